@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils.timezone import now
+
+from config.api.cache import bump_stock_versions_on_commit
+from products.models import Product, available_expression
+from .models import Basket, BasketItem, hold_expiry, lines_settled_by_caller
+
+ACTIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 200
+
+
+def per_product(amounts):
+    """CASE id WHEN <pk> THEN <amount> ... for UPDATEs that move a different amount for every product."""
+    return Case(*(When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()), output_field=IntegerField())
+
+
+def apply_operations(user, operations):
+    """
+    Applies `operations` ({'product_id', 'action', 'quantity'} dicts, one per product) to the user's basket
+    in one transaction: one basket lookup, one read of the affected lines and products, one UPDATE that
+    reserves the stock of every growing line, one that releases the shrinking ones, one upsert and one
+    DELETE. Lines that cannot be applied (unknown product, short stock) are reported and left untouched.
+    Returns one result dict per operation, in order.
+    """
+    product_ids = [operation['product_id'] for operation in operations]
+    while True:
+        with transaction.atomic():
+            # a write first, so SQLite takes its write lock before anything is read
+            Basket.objects.filter(user=user).update(updated=now())
+            basket_id = Basket.objects.values_list('pk', flat=True).get(user=user)
+            lines = {
+                line['product_id']: line
+                for line in BasketItem.objects.filter(basket_id=basket_id, product_id__in=product_ids)
+                .values('product_id', 'quantity', 'held')
+            }
+            available = dict(Product.objects.select_for_update().filter(pk__in=product_ids)
+                             .values_list('pk', available_expression()))
+
+            results, reserve, release, upserts, removals = [], {}, {}, [], []
+            expires = hold_expiry()
+            for operation in operations:
+                pk, action = operation['product_id'], operation['action']
+                line = lines.get(pk, {'quantity': 0, 'held': 0})
+                # the same line arithmetic as BasketItem.objects.add / set_quantity
+                if action == 'add':
+                    quantity, held = line['quantity'] + operation['quantity'], line['held'] + operation['quantity']
+                elif action == 'set':
+                    quantity = held = operation['quantity']
+                else:
+                    quantity = held = 0
+                difference = held - line['held']
+                result = {'product_id': pk, 'action': action}
+                if pk not in available:
+                    results.append({**result, 'status': 'not_found'})
+                    continue
+                if difference > available[pk]:
+                    results.append({**result, 'status': 'out_of_stock', 'available': max(available[pk], 0)})
+                    continue
+                if difference > 0:
+                    reserve[pk] = difference
+                elif difference < 0:
+                    release[pk] = -difference
+                if quantity:
+                    upserts.append(BasketItem(basket_id=basket_id, product_id=pk, quantity=quantity, held=held,
+                                              hold_expires_at=expires))
+                elif pk in lines:
+                    removals.append(pk)
+                results.append({**result, 'status': 'ok', 'quantity': quantity})
+
+            if reserve:
+                reserved = Product.objects.filter(pk__in=reserve, stock__gte=F('reserved') + per_product(reserve)).update(
+                    reserved=F('reserved') + per_product(reserve), updated=now())
+                if reserved != len(reserve):
+                    # the stock read above went stale (backends without select_for_update); start over
+                    transaction.set_rollback(True)
+                    continue
+            if release:
+                Product.objects.filter(pk__in=release).update(
+                    reserved=F('reserved') - per_product(release), updated=now())
+            if upserts:
+                BasketItem.objects.bulk_create(
+                    upserts, update_conflicts=True, unique_fields=['basket', 'product'],
+                    update_fields=['quantity', 'held', 'hold_expires_at'],
+                )
+            if removals:
+                # the basket was touched above, so the per-row carts.signals.touch_basket is skipped
+                with lines_settled_by_caller():
+                    BasketItem.objects.filter(basket_id=basket_id, product_id__in=removals).delete()
+            if reserve or release:
+                bump_stock_versions_on_commit([*reserve, *release])
+        return results
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class GuestBasketCache(FileBasedCache):
+    """
+    FileBasedCache, shared by the worker processes of one host, whose add() is atomic across them so the
+    guest basket lock in carts.guest holds: FileBasedCache.add() checks for the file, then writes it.
+    """
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._createdir()
+        fname = self._key_to_file(key, version)
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            for _ in range(2):
+                try:
+                    # a hard link fails if the name exists, and shows the entry complete or not at all
+                    os.link(tmp_path, fname)
+                    return True
+                except FileExistsError:
+                    # has_key() removes an expired entry, which then gets one more try
+                    if self.has_key(key, version):
+                        return False
+            return False
+        finally:
+            os.remove(tmp_path)
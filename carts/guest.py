@@ -0,0 +1,145 @@
+import secrets
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from products.models import Product, available_expression
+from .batch import MAX_OPERATIONS, apply_operations
+
+COOKIE_SALT = 'carts.guest'
+# seconds a request may hold a guest basket (a crashed worker's lock expires then), and may wait for it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+
+
+class GuestBasketBusy(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The basket is being changed by another request, try again."
+    default_code = 'guest_basket_busy'
+
+
+def guest_cache():
+    return caches[settings.GUEST_BASKET_CACHE_ALIAS]
+
+
+def cache_key(token):
+    return f'guest-basket:{token}'
+
+
+def guest_token(request):
+    return request.get_signed_cookie(
+        settings.GUEST_BASKET_COOKIE, default=None, salt=COOKIE_SALT, max_age=settings.GUEST_BASKET_TIMEOUT)
+
+
+def load_guest_basket(request):
+    """The visitor's (token, {product_id: quantity}); a new token and no lines without a valid cookie."""
+    token = guest_token(request)
+    lines = guest_cache().get(cache_key(token)) if token else None
+    return token or secrets.token_urlsafe(16), lines or {}
+
+
+@contextmanager
+def locked_guest_basket(request):
+    """
+    load_guest_basket() for a read-modify-write: concurrent requests of the visitor wait for each other
+    (GuestBasketBusy after LOCK_WAIT seconds) instead of saving over each other's lines. Relies on an
+    atomic cache.add(), see carts.cache.GuestBasketCache.
+    """
+    token = guest_token(request)
+    if token is None:
+        # a new token, nobody else can write to its basket yet
+        yield load_guest_basket(request)
+        return
+    lock_key, owner = f'{cache_key(token)}:lock', secrets.token_hex(8)
+    deadline = time.monotonic() + LOCK_WAIT
+    while not guest_cache().add(lock_key, owner, timeout=LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise GuestBasketBusy()
+        time.sleep(0.02)
+    try:
+        yield token, guest_cache().get(cache_key(token)) or {}
+    finally:
+        if guest_cache().get(lock_key) == owner:
+            guest_cache().delete(lock_key)
+
+
+def save_guest_basket(response, token, lines):
+    guest_cache().set(cache_key(token), lines, timeout=settings.GUEST_BASKET_TIMEOUT)
+    response.set_signed_cookie(
+        settings.GUEST_BASKET_COOKIE, token, salt=COOKIE_SALT, max_age=settings.GUEST_BASKET_TIMEOUT,
+        httponly=True, samesite='Lax',
+    )
+
+
+def clear_guest_basket(response, token):
+    guest_cache().delete(cache_key(token))
+    response.delete_cookie(settings.GUEST_BASKET_COOKIE, samesite='Lax')
+
+
+def apply_guest_operations(lines, operations):
+    """
+    BasketBatchSerializer operations applied to guest basket `lines` in place, with the same per-line results
+    as carts.batch.apply_operations. Guest lines hold no stock; the one query checks that the products exist
+    and have the quantity available right now.
+    """
+    available = dict(Product.objects.filter(pk__in=[operation['product_id'] for operation in operations])
+                     .values_list('pk', available_expression()))
+    results = []
+    for operation in operations:
+        pk, action = operation['product_id'], operation['action']
+        if action == 'add':
+            quantity = lines.get(pk, 0) + operation['quantity']
+        else:
+            quantity = operation['quantity'] if action == 'set' else 0
+        result = {'product_id': pk, 'action': action}
+        if pk not in available:
+            results.append({**result, 'status': 'not_found'})
+        elif quantity > available[pk]:
+            results.append({**result, 'status': 'out_of_stock', 'available': max(available[pk], 0)})
+        elif quantity and pk not in lines and len(lines) >= MAX_OPERATIONS:
+            # keeps every guest basket mergeable in one batch
+            results.append({**result, 'status': 'basket_full'})
+        else:
+            if quantity:
+                lines[pk] = quantity
+            else:
+                lines.pop(pk, None)
+            results.append({**result, 'status': 'ok', 'quantity': quantity})
+    return results
+
+
+def merge_guest_basket(request, user, response=None):
+    """
+    Adds the visitor's guest basket to `user`'s basket through carts.batch.apply_operations (stock is reserved
+    then). Lines that could not be added for lack of stock stay in the guest basket for a later merge; once
+    it is empty it is dropped, along with the cookie when `response` is given. Returns the per-line results.
+    """
+    with locked_guest_basket(request) as (token, lines):
+        results = apply_operations(user, [
+            {'product_id': pk, 'action': 'add', 'quantity': quantity} for pk, quantity in lines.items()
+        ]) if lines else []
+        # products that are gone are dropped with the merged lines
+        left = {pk: quantity for (pk, quantity), result in zip(lines.items(), results)
+                if result['status'] not in ('ok', 'not_found')}
+        if left:
+            guest_cache().set(cache_key(token), left, timeout=settings.GUEST_BASKET_TIMEOUT)
+        elif lines:
+            guest_cache().delete(cache_key(token))
+    if not left and response is not None and settings.GUEST_BASKET_COOKIE in request.COOKIES:
+        response.delete_cookie(settings.GUEST_BASKET_COOKIE, samesite='Lax')
+    return results
+
+
+def merge_guest_basket_at_login(request, user, response=None):
+    """
+    merge_guest_basket() for logins, which must not fail over it: a guest basket another request is changing
+    keeps its lines and cookie for the next merge (the merge endpoint, checkout or the next login).
+    """
+    try:
+        return merge_guest_basket(request, user, response)
+    except GuestBasketBusy:
+        return []
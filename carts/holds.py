@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from config.api.cache import bump_stock_versions_on_commit
+from products.models import Product
+from .models import Basket, BasketItem
+
+
+def release_holds(lines, stamp=None):
+    """
+    Returns what the (pk, product_id, held) `lines` hold to the products' available stock. Holds are mostly
+    a few units, so grouping the products by amount keeps this to a handful of UPDATEs.
+    """
+    returned = defaultdict(int)
+    for _, product_id, held in lines:
+        returned[product_id] += held
+    by_amount = defaultdict(list)
+    for product_id, amount in returned.items():
+        if amount:
+            by_amount[amount].append(product_id)
+    for amount, product_ids in by_amount.items():
+        Product.objects.filter(pk__in=product_ids).update(reserved=F('reserved') - amount, updated=stamp or now())
+    if by_amount:
+        bump_stock_versions_on_commit(pk for product_ids in by_amount.values() for pk in product_ids)
+
+
+def sweep_expired_holds(until=None, batch_size=10000):
+    """
+    Returns the stock held by basket lines whose hold expired by `until` (default: now), `batch_size` lines
+    per transaction. Each batch is read once; the products get their units back through release_holds(),
+    the baskets are touched and the lines keep their quantity but hold nothing. Returns the number of
+    lines released.
+    """
+    until = until or now()
+    released = 0
+    while True:
+        stamp = now()
+        with transaction.atomic():
+            expired = BasketItem.objects.filter(hold_expires_at__lte=until).order_by('hold_expires_at')
+            # a write first, so SQLite takes its write lock before the batch is read
+            Basket.objects.filter(pk__in=BasketItem.objects.filter(
+                pk__in=expired.values('pk')[:batch_size]).values('basket_id')).update(updated=stamp)
+            lines = list(expired.select_for_update().values_list('pk', 'product_id', 'held')[:batch_size])
+            release_holds(lines, stamp)
+            count = BasketItem.objects.filter(pk__in=[pk for pk, _, _ in lines], hold_expires_at__lte=until).update(
+                held=0, hold_expires_at=None)
+        released += count
+        if len(lines) < batch_size:
+            break
+    return released
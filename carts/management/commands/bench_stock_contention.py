@@ -0,0 +1,92 @@
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.models import F, Sum
+
+from carts.models import Basket, BasketItem
+from products.models import Product, available_expression
+from users.models import User
+
+EMAIL = 'bench-stock-{}@example.com'
+
+
+def hammer(basket_id, product_id, attempts, quantity):
+    """Adds `quantity` of the product to the basket `attempts` times; counts reserved, short and failed adds."""
+    basket = Basket(pk=basket_id)
+    counts = Counter()
+    try:
+        for _ in range(attempts):
+            try:
+                item = BasketItem.objects.add(basket, product_id, quantity)
+            except OperationalError:
+                # SQLite gave up waiting for the write lock
+                counts['errors'] += 1
+            else:
+                counts['reserved' if item else 'short'] += 1
+    finally:
+        connections.close_all()
+    return counts
+
+
+def hammer_args(args):
+    return hammer(*args)
+
+
+class Command(BaseCommand):
+    help = ("Hammer one product with concurrent add-to-basket calls from N threads or processes and report "
+            "throughput and oversell. The product's stock is restored and the bench users removed afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, help="Product id; defaults to the first product.")
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=200, help="Adds per worker.")
+        parser.add_argument('--quantity', type=int, default=1, help="Units per add.")
+        parser.add_argument('--stock', type=int, default=1000, help="Stock the product starts with.")
+        parser.add_argument('--processes', action='store_true', help="Use processes instead of threads.")
+
+    def handle(self, *args, product, workers, attempts, quantity, stock, processes, **options):
+        queryset = Product.objects.order_by('pk')
+        product = queryset.filter(pk=product).first() if product else queryset.first()
+        if product is None:
+            raise CommandError("No product to hammer.")
+        baskets = []
+        for number in range(workers):
+            user = User.objects.filter(email=EMAIL.format(number)).first()
+            user = user or User.objects.create_user(email=EMAIL.format(number), password=None)
+            baskets.append(user.basket.pk)
+        BasketItem.objects.filter(basket__in=baskets).delete()
+        # holds of other baskets stay where they are; the bench gets `stock` units on top of them
+        Product.objects.filter(pk=product.pk).update(stock=F('reserved') + stock)
+
+        jobs = [(basket, product.pk, attempts, quantity) for basket in baskets]
+        started = perf_counter()
+        if processes:
+            # forked children must not share the parent's SQLite connection
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                results = pool.map(hammer_args, jobs)
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(hammer_args, jobs))
+        elapsed = perf_counter() - started
+
+        counts = sum(results, Counter())
+        left = Product.objects.filter(pk=product.pk).values_list(available_expression(), flat=True).get()
+        in_baskets = BasketItem.objects.filter(basket__in=baskets).aggregate(total=Sum('quantity'))['total'] or 0
+        oversold = max(in_baskets - stock, 0) + max(-left, 0)
+        self.stdout.write(
+            f"{workers} {'processes' if processes else 'threads'} x {attempts} adds of {quantity} on product "
+            f"{product.pk} (stock {stock}): {counts['reserved']} reserved, {counts['short']} out of stock, "
+            f"{counts['errors']} lock timeouts in {elapsed:.2f} s ({sum(counts.values()) / elapsed:.0f} adds/s)"
+        )
+        self.stdout.write(f"Stock left {left}, in baskets {in_baskets}, "
+                          f"lost {stock - left - in_baskets}, oversold {oversold}")
+
+        User.objects.filter(email__in=[EMAIL.format(number) for number in range(workers)]).delete()
+        Product.objects.filter(pk=product.pk).update(stock=product.stock)
+        if oversold or left + in_baskets != stock:
+            raise CommandError("Stock and basket quantities disagree.")
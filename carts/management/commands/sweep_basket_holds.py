@@ -0,0 +1,25 @@
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand
+
+from carts.holds import sweep_expired_holds
+
+
+class Command(BaseCommand):
+    help = ("Return the stock held by basket lines whose hold expired. With --every it keeps running and "
+            "sweeps every N seconds, e.g. as a background worker next to the web processes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help="Lines released per transaction.")
+        parser.add_argument('--every', type=float, help="Seconds between sweeps; sweeps once when omitted.")
+
+    def handle(self, *args, batch_size, every, **options):
+        while True:
+            started = perf_counter()
+            released = sweep_expired_holds(batch_size=batch_size)
+            if released or not every:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Released the holds of {released} basket lines in {perf_counter() - started:.2f}s."))
+            if not every:
+                return
+            sleep(every)
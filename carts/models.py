@@ -1,6 +1,51 @@
-from django.db import models
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
 from users.models import User
-from products.models import Product
+from products.models import Product, discounted_price_expression
+
+
+def line_totals():
+    """Aggregates of a basket's lines: the sum of their total_price, with the discount math in SQL, and of their quantities."""
+    return {
+        'items_subtotal': Sum(discounted_price_expression(F('product__price'), F('product__discount')) * F('quantity')),
+        'items_quantity': Sum('quantity'),
+    }
+
+
+# set while a caller deletes basket lines whose holds it settles and whose basket it touches itself;
+# carts.signals then skips release_line_hold and touch_basket for those rows
+lines_settled = ContextVar('lines_settled', default=False)
+
+
+@contextmanager
+def lines_settled_by_caller():
+    token = lines_settled.set(True)
+    try:
+        yield
+    finally:
+        lines_settled.reset(token)
+
+
+def basket_totals():
+    """line_totals() of each basket as correlated subqueries, to annotate Basket querysets with."""
+    lines = BasketItem.objects.filter(basket=OuterRef('pk')).order_by().values('basket')
+    return {
+        name: Coalesce(Subquery(lines.annotate(total=total).values('total')), 0)
+        for name, total in line_totals().items()
+    }
+
+
+class BasketQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotates `items_subtotal` and `items_quantity`, which Basket.total_price / item_count then use."""
+        return self.annotate(**basket_totals())
 
 
 class Basket(models.Model):
@@ -8,19 +53,99 @@ class Basket(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = BasketQuerySet.as_manager()
+
     def __str__(self):
         return f"Basket for {self.user.email}"
 
+    def load_totals(self):
+        # one aggregate query, unless the basket came from BasketQuerySet.with_totals()
+        if not hasattr(self, 'items_subtotal'):
+            self.__dict__.update(self.items.aggregate(
+                **{name: Coalesce(total, 0) for name, total in line_totals().items()}))
+
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        self.load_totals()
+        return self.items_subtotal
+
+    @property
+    def item_count(self):
+        self.load_totals()
+        return self.items_quantity
+
+def hold_expiry():
+    return now() + timedelta(seconds=settings.BASKET_HOLD_TTL)
+
+
+class BasketItemQuerySet(models.QuerySet):
+    def add(self, basket, product_id, quantity):
+        """
+        Reserves `quantity` of the product and adds it to the basket's line for it (created if missing),
+        as one transaction that starts with the stock UPDATE. The line's hold is renewed for another
+        BASKET_HOLD_TTL. Returns the item, or None when the stock is short. Safe against concurrent adds
+        of the same product to the same basket.
+        """
+        with transaction.atomic():
+            if not Product.objects.reserve(product_id, quantity):
+                return None
+            line = self.filter(basket=basket, product_id=product_id)
+            added = {'quantity': F('quantity') + quantity, 'held': F('held') + quantity, 'hold_expires_at': hold_expiry()}
+            if not line.update(**added):
+                try:
+                    with transaction.atomic():
+                        item = self.create(basket=basket, product_id=product_id, quantity=quantity, held=quantity,
+                                           hold_expires_at=added['hold_expires_at'])
+                    return item
+                except IntegrityError:
+                    # another request created the line first
+                    line.update(**added)
+            # queryset updates skip carts.signals.touch_basket
+            Basket.objects.filter(pk=basket.pk).update(updated=now())
+            return line.get()
+
+    def set_quantity(self, item, quantity):
+        """
+        Moves the line to `quantity` (removing it at 0) and holds all of it again, reserving or releasing
+        the difference to what it held. The line is compared-and-set on its current quantity and hold,
+        so concurrent changes and the hold sweeper retry instead of drifting the stock. Returns False when
+        the stock is short.
+        """
+        quantity = max(quantity, 0)
+        while True:
+            current = self.filter(pk=item.pk).values_list('quantity', 'held').first()
+            if current is None:
+                return True
+            current_quantity, held = current
+            # every transaction starts with a write, so SQLite takes its write lock up front
+            with transaction.atomic():
+                line = self.filter(pk=item.pk, quantity=current_quantity, held=held)
+                if not line.update(quantity=quantity, held=quantity, hold_expires_at=hold_expiry() if quantity else None):
+                    continue
+                if not quantity:
+                    self.filter(pk=item.pk).delete()
+                difference = quantity - held
+                if difference > 0 and not Product.objects.reserve(item.product_id, difference):
+                    transaction.set_rollback(True)
+                    return False
+                if difference < 0:
+                    Product.objects.release(item.product_id, -difference)
+                Basket.objects.filter(pk=item.basket_id).update(updated=now())
+            item.quantity = quantity
+            return True
+
 
 class BasketItem(models.Model):
     basket = models.ForeignKey(Basket, on_delete=models.CASCADE, related_name='items')
     product =  models.ForeignKey(Product, on_delete=models.CASCADE, related_name='basket_items')
     quantity = models.IntegerField(default=1)
+    # units of `quantity` counted in the product's `reserved`, until carts.holds returns them at hold_expires_at
+    held = models.PositiveIntegerField(default=0)
+    hold_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BasketItemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -1,10 +1,12 @@
 from rest_framework import serializers
+from .batch import ACTIONS, MAX_OPERATIONS
 from .models import Basket, BasketItem
-from products.models import Product
+from products.models import Product, available_expression
+from config.api.sparse import DynamicFieldsMixin
 from rest_framework.response import Response
 
 
-class BasketItemSerializer(serializers.ModelSerializer):
+class BasketItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
@@ -14,69 +16,64 @@ class BasketItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = BasketItem
-        fields = ['id', 'product', 'product_id', 'quantity', 'added_at', 'total_price']
-        read_only_fields = ['added_at']
+        fields = ['id', 'product', 'product_id', 'quantity', 'hold_expires_at', 'added_at', 'total_price']
+        read_only_fields = ['hold_expires_at', 'added_at']
 
     def create(self, validated_data):
         basket = self.context['basket']
         product = validated_data['product']
         quantity = validated_data['quantity']
 
-
         if quantity < 1:
             raise serializers.ValidationError({"error": "You must purchase at least 1 product"})
 
-        if quantity <= product.stock:
-            product.stock -= quantity
-            product.save()
-        else:
-            raise serializers.ValidationError({
-                "quantity": f"Only {product.stock} items available in stock."
-            })
-
-        existing_item = BasketItem.objects.filter(basket=basket, product=product).first()
-        if existing_item:
-            existing_item.quantity += quantity
-            existing_item.save()
-            return existing_item
-
-        return BasketItem.objects.create(basket=basket, **validated_data)
+        item = BasketItem.objects.add(basket, product.pk, quantity)
+        if item is None:
+            raise self.out_of_stock(product.pk)
+        return item
 
     def update(self, instance, validated_data):
-        basket = self.context['basket']
         quantity = validated_data.get('quantity', instance.quantity)
-
-        quantity_diff = quantity - instance.quantity
-
-        if quantity_diff > 0:
-            if quantity_diff <= instance.product.stock:
-                instance.product.stock -= quantity_diff
-                instance.product.save()
-            else:
-                raise serializers.ValidationError({
-                    "quantity": f"Only {instance.product.stock} items available in stock."
-                })
-        elif quantity_diff < 0:
-            instance.product.stock -= quantity_diff
-            instance.product.save()
-
-        instance.quantity = quantity
-        if instance.quantity <= 0:
-            instance.product.stock += instance.quantity
-            instance.product.save()
-            instance.delete()
+        if not BasketItem.objects.set_quantity(instance, quantity):
+            raise self.out_of_stock(instance.product_id)
+        if quantity <= 0:
             return Response({"message": f"The {instance.product.name} in your basket has been removed."})
-        else:
-            instance.save()
         return instance
 
+    def out_of_stock(self, product_id):
+        available = Product.objects.filter(pk=product_id).values_list(available_expression(), flat=True).first() or 0
+        return serializers.ValidationError({"quantity": f"Only {max(available, 0)} items available in stock."})
+
 
-class BasketSerializer(serializers.ModelSerializer):
+class BasketSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = BasketItemSerializer(many=True, read_only=True)
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Basket
-        fields = ['id', 'user', 'items', 'created', 'updated', 'total_price']
-        read_only_fields = ['user', 'created', 'updated']
\ No newline at end of file
+        fields = ['id', 'user', 'items', 'created', 'updated', 'total_price', 'item_count']
+        read_only_fields = ['user', 'created', 'updated']
+
+
+class BasketOperationSerializer(serializers.Serializer):
+    # add: quantity more; set: exactly quantity (0 removes the line); remove: the whole line
+    product_id = serializers.IntegerField()
+    action = serializers.ChoiceField(choices=ACTIONS, default='add')
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, attrs):
+        if attrs['action'] == 'add' and attrs['quantity'] < 1:
+            raise serializers.ValidationError({"quantity": "You must purchase at least 1 product"})
+        return attrs
+
+
+class BasketBatchSerializer(serializers.Serializer):
+    operations = BasketOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+    def validate_operations(self, operations):
+        product_ids = [operation['product_id'] for operation in operations]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError("Each product can appear only once per batch.")
+        return operations
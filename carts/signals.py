@@ -1,9 +1,43 @@
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils.timezone import now
+from products.models import Product
 from users.models import User
-from .models import Basket
+from .guest import merge_guest_basket_at_login
+from .holds import release_holds
+from .models import Basket, BasketItem, lines_settled
 
 @receiver(post_save, sender=User)
 def create_user_basket(sender, instance, created, **kwargs):
     if created:
         Basket.objects.create(user=instance)
+
+
+@receiver(post_save, sender=BasketItem)
+@receiver(post_delete, sender=BasketItem)
+def touch_basket(sender, instance, raw=False, **kwargs):
+    # keeps Basket.updated (and with it the basket ETag) moving when only its items change
+    if not raw and not lines_settled.get():
+        Basket.objects.filter(pk=instance.basket_id).update(updated=now())
+
+
+@receiver(pre_delete, sender=BasketItem)
+def release_line_hold(sender, instance, origin=None, **kwargs):
+    # lines deleted along with their basket (or user) are released by release_basket_holds, in bulk
+    deleting_lines = isinstance(origin, BasketItem) or isinstance(origin, QuerySet) and origin.model is BasketItem
+    if instance.held and deleting_lines and not lines_settled.get():
+        Product.objects.release(instance.product_id, instance.held)
+
+
+@receiver(pre_delete, sender=Basket)
+def release_basket_holds(sender, instance, **kwargs):
+    release_holds(BasketItem.objects.filter(basket=instance, held__gt=0).values_list('pk', 'product_id', 'held'))
+
+
+@receiver(user_logged_in)
+def merge_guest_basket_on_login(sender, request, user, **kwargs):
+    # session logins (admin, browsable API); the JWT login view merges itself
+    if request is not None:
+        merge_guest_basket_at_login(request, user)
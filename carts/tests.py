@@ -1,3 +1,488 @@
-from django.test import TestCase
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from products.models import Category, Product, available_expression
+from users.models import User
+from .cache import GuestBasketCache
+from .guest import locked_guest_basket
+from .holds import sweep_expired_holds
+from .models import Basket, BasketItem
+
+
+class BasketConditionalGetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Smartphone", category=category, description="Latest model", price=Decimal("100.00"), stock=10,
+        )
+        self.item = BasketItem.objects.create(basket=self.user.basket, product=self.product, quantity=1)
+
+    def test_unchanged_basket_is_not_serialized_again(self):
+        url = reverse("my-basket-list")
+        etag = self.client.get(url)["ETag"]
+        # ETag aggregate
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_item_and_price_changes_change_the_etag(self):
+        url = reverse("my-basket-list")
+        etag = self.client.get(url)["ETag"]
+
+        self.item.quantity = 3
+        self.item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal("90.00"), updated=self.product.updated.replace(year=self.product.updated.year + 1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class BasketStockTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Smartphone", category=self.category, description="Latest model", price=Decimal("100.00"), stock=5,
+        )
+
+    def stock(self):
+        return Product.objects.values_list(available_expression(), flat=True).get(pk=self.product.pk)
+
+    def test_adding_reserves_stock_and_merges_the_line(self):
+        url = reverse("my-basket-list")
+        self.assertEqual(self.client.post(url, {"product_id": self.product.pk, "quantity": 2}).status_code, 201)
+        self.assertEqual(self.client.post(url, {"product_id": self.product.pk, "quantity": 1}).status_code, 201)
+        self.assertEqual(self.user.basket.items.get().quantity, 3)
+        self.assertEqual(self.stock(), 2)
+
+        response = self.client.post(url, {"product_id": self.product.pk, "quantity": 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["quantity"], "Only 2 items available in stock.")
+        self.assertEqual(self.stock(), 2)
+
+    def test_reserving_leaves_the_other_columns_alone(self):
+        # a price change made after the product was loaded must survive the stock update
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal("80.00"))
+        self.assertIsNotNone(BasketItem.objects.add(self.user.basket, self.product.pk, 1))
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.price, product.stock, product.available), (Decimal("80.00"), 5, 4))
+
+    def test_changing_the_quantity_moves_the_difference(self):
+        item = BasketItem.objects.add(self.user.basket, self.product.pk, 2)
+        url = reverse("my-basket-detail", args=[item.pk])
+
+        self.assertEqual(self.client.patch(url, {"quantity": 4}).status_code, 200)
+        self.assertEqual(self.stock(), 1)
+        response = self.client.patch(url, {"quantity": 6})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((self.stock(), BasketItem.objects.get(pk=item.pk).quantity), (1, 4))
+        self.assertEqual(self.client.patch(url, {"quantity": 1}).status_code, 200)
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(self.client.patch(url, {"quantity": 0}).status_code, 200)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(BasketItem.objects.filter(pk=item.pk).exists())
+
+    def test_stale_quantity_is_not_written_back(self):
+        item = BasketItem.objects.add(self.user.basket, self.product.pk, 1)
+        stale = BasketItem.objects.get(pk=item.pk)
+        BasketItem.objects.add(self.user.basket, self.product.pk, 2)
+        self.assertTrue(BasketItem.objects.set_quantity(stale, 1))
+        self.assertEqual(BasketItem.objects.get(pk=item.pk).quantity, 1)
+        self.assertEqual(self.stock(), 4)
+
+
+class BasketHoldTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Electronics")
+        self.products = [
+            Product.objects.create(name=f"Phone {i}", category=self.category, description="Phone",
+                                   price=Decimal("100.00"), stock=10)
+            for i in range(2)
+        ]
+
+    def stock(self, product):
+        return Product.objects.values_list(available_expression(), flat=True).get(pk=product.pk)
+
+    def expire(self, item):
+        BasketItem.objects.filter(pk=item.pk).update(hold_expires_at=now() - timedelta(seconds=1))
+
+    def test_sweeper_returns_only_expired_holds(self):
+        other = User.objects.create_user(email="other@example.com", password="user123")
+        expired = [BasketItem.objects.add(basket, self.products[0].pk, 2) for basket in (self.user.basket, other.basket)]
+        active = BasketItem.objects.add(self.user.basket, self.products[1].pk, 3)
+        for item in expired:
+            self.expire(item)
+        self.assertEqual(self.stock(self.products[0]), 6)
+
+        self.assertEqual(sweep_expired_holds(batch_size=1), 2)
+        self.assertEqual((self.stock(self.products[0]), self.stock(self.products[1])), (10, 7))
+        item = BasketItem.objects.get(pk=expired[0].pk)
+        self.assertEqual((item.quantity, item.held, item.hold_expires_at), (2, 0, None))
+        self.assertEqual(BasketItem.objects.get(pk=active.pk).held, 3)
+        self.assertEqual(sweep_expired_holds(), 0)
+
+    def test_changing_a_released_line_holds_it_again(self):
+        item = BasketItem.objects.add(self.user.basket, self.products[0].pk, 2)
+        self.expire(item)
+        sweep_expired_holds()
+        self.assertTrue(BasketItem.objects.set_quantity(item, 3))
+        item.refresh_from_db()
+        self.assertEqual((item.held, self.stock(self.products[0])), (3, 7))
+        self.assertGreater(item.hold_expires_at, now())
+
+    def test_checkout_reserves_what_expired_holds_gave_back(self):
+        held = BasketItem.objects.add(self.user.basket, self.products[0].pk, 2)
+        released = BasketItem.objects.add(self.user.basket, self.products[1].pk, 4)
+        self.expire(released)
+        sweep_expired_holds()
+        Product.objects.filter(pk=self.products[1].pk).update(stock=3)
+
+        response = self.client.post(reverse("order-list"), {})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(self.products[1]), 3)
+        self.assertEqual(BasketItem.objects.get(pk=held.pk).held, 2)
+
+        Product.objects.filter(pk=self.products[1].pk).update(stock=5)
+        self.assertEqual(self.client.post(reverse("order-list"), {}).status_code, 201)
+        self.assertEqual((self.stock(self.products[0]), self.stock(self.products[1])), (8, 1))
+
+    def test_removing_a_line_returns_its_hold(self):
+        item = BasketItem.objects.add(self.user.basket, self.products[0].pk, 4)
+        self.assertEqual(self.client.delete(reverse("my-basket-detail", args=[item.pk])).status_code, 204)
+        self.assertEqual(self.stock(self.products[0]), 10)
+
+    def test_deleting_the_user_returns_the_holds(self):
+        other = User.objects.create_user(email="other@example.com", password="user123")
+        BasketItem.objects.add(other.basket, self.products[0].pk, 3)
+        BasketItem.objects.add(other.basket, self.products[1].pk, 1)
+        BasketItem.objects.add(self.user.basket, self.products[0].pk, 2)
+        other.delete()
+        self.assertEqual((self.stock(self.products[0]), self.stock(self.products[1])), (8, 10))
+
+    def test_setting_the_on_hand_stock_keeps_the_holds(self):
+        # an import or owner PATCH overwrites stock while lines hold it; the sweep must not hand it out twice
+        item = BasketItem.objects.add(self.user.basket, self.products[0].pk, 4)
+        Product.objects.filter(pk=self.products[0].pk).update(stock=6)
+        self.assertEqual(self.stock(self.products[0]), 2)
+        self.expire(item)
+        sweep_expired_holds()
+        self.assertEqual(Product.objects.values_list("stock", "reserved").get(pk=self.products[0].pk), (6, 0))
+
+    def test_products_list_what_is_available(self):
+        BasketItem.objects.add(self.user.basket, self.products[0].pk, 4)
+        response = self.client.get(reverse("product-list"), {"available_min": 7})
+        self.assertEqual([(row["id"], row["stock"], row["available"]) for row in response.json()["results"]],
+                         [(self.products[1].pk, 10, 10)])
+
+
+class BasketTotalsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        category = Category.objects.create(name="Electronics")
+        # effective prices 99.50, 100.50, 101.50, ... exercise round() halving to even
+        self.products = Product.objects.bulk_create([
+            Product(name=f"Phone {i}", category=category, description="Phone", price=Decimal("199.00") + 2 * i,
+                    discount=50, effective_price=Decimal("99.50") + i, stock=10)
+            for i in range(50)
+        ])
+
+    def fill(self, basket, count):
+        BasketItem.objects.bulk_create(
+            BasketItem(basket=basket, product=product, quantity=i % 3 + 1)
+            for i, product in enumerate(self.products[:count])
+        )
+
+    def test_totals_match_the_item_totals(self):
+        self.fill(self.user.basket, 7)
+        basket = Basket.objects.with_totals().get(pk=self.user.basket.pk)
+        items = list(self.user.basket.items.all())
+        expected = sum(item.total_price for item in items)
+        with self.assertNumQueries(0):
+            self.assertEqual((basket.total_price, basket.item_count), (expected, sum(i.quantity for i in items)))
+        self.assertEqual(self.user.basket.total_price, expected)
+        other = User.objects.create_user(email="other@example.com", password="user123")
+        self.assertEqual((other.basket.total_price, other.basket.item_count), (0, 0))
+
+    def test_basket_read_does_not_grow_with_the_items(self):
+        self.client.force_authenticate(self.user)
+        url = reverse("basket-list")
+        self.fill(self.user.basket, 5)
+        # ETag aggregate + count + baskets with totals + items with their products
+        with self.assertNumQueries(4):
+            small = self.client.get(url).json()["results"][0]
+        BasketItem.objects.all().delete()
+        self.fill(self.user.basket, 50)
+        with self.assertNumQueries(4):
+            large = self.client.get(url).json()["results"][0]
+        self.assertEqual((len(small["items"]), len(large["items"])), (5, 50))
+        self.assertEqual(Decimal(large["total_price"]), sum(Decimal(item["total_price"]) for item in large["items"]))
+        self.assertEqual(large["item_count"], sum(item["quantity"] for item in large["items"]))
+
+    def test_staff_list_filters_and_orders_by_total(self):
+        other = User.objects.create_user(email="other@example.com", password="user123")
+        self.fill(self.user.basket, 2)
+        self.fill(other.basket, 5)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("basket-list"), {"ordering": "-total_price", "fields": "user,total_price"})
+        self.assertEqual([row["user"] for row in response.json()["results"]], [other.pk, self.user.pk, self.admin.pk])
+        response = self.client.get(reverse("basket-list"), {"user": other.pk})
+        self.assertEqual([row["user"] for row in response.json()["results"]], [other.pk])
+
+
+class BasketBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Electronics")
+        self.products = Product.objects.bulk_create([
+            Product(name=f"Phone {i}", category=category, description="Phone", price=Decimal("100.00"),
+                    effective_price=Decimal("100.00"), stock=10)
+            for i in range(40)
+        ])
+        self.url = reverse("my-basket-batch")
+
+    def stock(self):
+        return dict(Product.objects.values_list("pk", available_expression()))
+
+    def test_operations_are_applied_with_per_line_results(self):
+        first, second, third, fourth = self.products[:4]
+        BasketItem.objects.add(self.user.basket, first.pk, 2)
+        BasketItem.objects.add(self.user.basket, second.pk, 5)
+        BasketItem.objects.add(self.user.basket, third.pk, 1)
+        operations = [
+            {"product_id": first.pk, "quantity": 3},
+            {"product_id": second.pk, "action": "set", "quantity": 1},
+            {"product_id": third.pk, "action": "remove"},
+            {"product_id": fourth.pk, "action": "set", "quantity": 11},
+            {"product_id": 0, "quantity": 1},
+        ]
+        response = self.client.post(self.url, {"operations": operations}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [
+            {"product_id": first.pk, "action": "add", "status": "ok", "quantity": 5},
+            {"product_id": second.pk, "action": "set", "status": "ok", "quantity": 1},
+            {"product_id": third.pk, "action": "remove", "status": "ok", "quantity": 0},
+            {"product_id": fourth.pk, "action": "set", "status": "out_of_stock", "available": 10},
+            {"product_id": 0, "action": "add", "status": "not_found"},
+        ])
+        lines = dict(self.user.basket.items.values_list("product_id", "quantity"))
+        self.assertEqual(lines, {first.pk: 5, second.pk: 1})
+        stock = self.stock()
+        self.assertEqual([stock[p.pk] for p in (first, second, third, fourth)], [5, 9, 10, 10])
+        self.assertTrue(all(item.held == item.quantity for item in self.user.basket.items.all()))
+
+    def test_reorder_takes_a_handful_of_queries(self):
+        operations = [{"product_id": product.pk, "quantity": 2} for product in self.products]
+        # touch + basket + lines + products + reserve + upsert, and the transaction's savepoint pair
+        with self.assertNumQueries(8):
+            response = self.client.post(self.url, {"operations": operations}, format="json")
+        self.assertEqual({row["status"] for row in response.json()["results"]}, {"ok"})
+        self.assertEqual(self.user.basket.items.count(), 40)
+        self.assertEqual(set(self.stock().values()), {8})
+
+    def test_invalid_batches_are_rejected(self):
+        pk = self.products[0].pk
+        for operations in ([], [{"product_id": pk}, {"product_id": pk, "action": "set"}],
+                           [{"product_id": pk, "quantity": 0}]):
+            with self.subTest(operations=operations):
+                response = self.client.post(self.url, {"operations": operations}, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(self.stock().values()), {10})
+
+
+# a basket cache of their own, not the file cache under BASE_DIR/var
+@override_settings(CACHES={**settings.CACHES, "baskets": {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "guest-basket-tests"}})
+class GuestBasketTests(TestCase):
+    def setUp(self):
+        self.addCleanup(caches["baskets"].clear)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123", is_active=True)
+        category = Category.objects.create(name="Electronics")
+        self.products = Product.objects.bulk_create([
+            Product(name=f"Phone {i}", category=category, description="Phone", price=Decimal("100.00"),
+                    effective_price=Decimal("100.00"), stock=5)
+            for i in range(3)
+        ])
+        self.url = reverse("guest-basket")
+
+    def fill(self):
+        operations = [{"product_id": self.products[0].pk, "quantity": 2}, {"product_id": self.products[1].pk}]
+        return self.client.post(self.url, {"operations": operations}, format="json")
+
+    def stock(self):
+        return list(Product.objects.order_by("pk").values_list(available_expression(), flat=True))
+
+    def test_guest_basket_stays_out_of_the_database(self):
+        response = self.fill()
+        self.assertEqual([row["status"] for row in response.json()["results"]], ["ok", "ok"])
+        self.assertIn("guest_basket", response.cookies)
+        operations = [{"product_id": self.products[0].pk, "quantity": 4}, {"product_id": 0}]
+        response = self.client.post(self.url, {"operations": operations}, format="json")
+        self.assertEqual([row["status"] for row in response.json()["results"]], ["out_of_stock", "not_found"])
+
+        with self.assertNumQueries(0):
+            basket = self.client.get(self.url).json()
+        self.assertEqual(basket, {"items": [{"product_id": self.products[0].pk, "quantity": 2},
+                                            {"product_id": self.products[1].pk, "quantity": 1}], "item_count": 3})
+        self.assertEqual(self.stock(), [5, 5, 5])
+        self.assertFalse(BasketItem.objects.exists())
+
+    def test_tampered_cookie_starts_an_empty_basket(self):
+        self.fill()
+        self.client.cookies["guest_basket"] = self.client.cookies["guest_basket"].value + "x"
+        self.assertEqual(self.client.get(self.url).json()["items"], [])
+
+    def test_login_merges_the_guest_basket(self):
+        self.fill()
+        BasketItem.objects.add(self.user.basket, self.products[0].pk, 1)
+        response = self.client.post(reverse("token-obtain-pair"), {"email": "user@example.com", "password": "user123"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json())
+        self.assertEqual(response.cookies["guest_basket"].value, "")
+        lines = dict(self.user.basket.items.values_list("product_id", "quantity"))
+        self.assertEqual(lines, {self.products[0].pk: 3, self.products[1].pk: 1})
+        self.assertEqual(self.stock(), [2, 4, 5])
+
+    def test_merge_endpoint_and_checkout_take_the_guest_basket(self):
+        self.fill()
+        self.client.force_authenticate(self.user)
+        merged = self.client.post(reverse("guest-basket-merge")).json()["results"]
+        self.assertEqual([row["quantity"] for row in merged], [2, 1])
+        self.assertEqual(self.client.post(reverse("guest-basket-merge")).json()["results"], [])
+
+        self.client.force_authenticate(None)
+        self.client.post(self.url, {"operations": [{"product_id": self.products[2].pk}]}, format="json")
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(reverse("order-list"), {}).status_code, 201)
+        self.assertEqual(self.stock(), [3, 4, 4])
+        self.assertFalse(self.user.basket.items.exists())
+
+    def test_lines_short_of_stock_stay_in_the_guest_basket(self):
+        self.fill()
+        Product.objects.filter(pk=self.products[1].pk).update(stock=0)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse("guest-basket-merge"))
+        self.assertEqual([row["status"] for row in response.json()["results"]], ["ok", "out_of_stock"])
+        self.assertNotIn("guest_basket", response.cookies)
+        self.assertEqual(self.client.get(self.url).json()["items"], [{"product_id": self.products[1].pk, "quantity": 1}])
+
+        Product.objects.filter(pk=self.products[1].pk).update(stock=5)
+        self.assertEqual([row["status"] for row in self.client.post(reverse("guest-basket-merge")).json()["results"]],
+                         ["ok"])
+        self.assertEqual(dict(self.user.basket.items.values_list("product_id", "quantity")),
+                         {self.products[0].pk: 2, self.products[1].pk: 1})
+
+    def test_a_locked_guest_basket_is_not_written_over(self):
+        self.fill()
+        request = RequestFactory().get(self.url)
+        request.COOKIES["guest_basket"] = self.client.cookies["guest_basket"].value
+        with locked_guest_basket(request) as (token, lines):
+            self.assertEqual(sum(lines.values()), 3)
+            with mock.patch("carts.guest.LOCK_WAIT", 0):
+                response = self.client.post(self.url, {"operations": [{"product_id": self.products[2].pk}]},
+                                            format="json")
+            self.assertEqual(response.status_code, 409)
+        response = self.client.post(self.url, {"operations": [{"product_id": self.products[2].pk}]}, format="json")
+        self.assertEqual(response.json()["item_count"], 4)
+
+    def test_login_succeeds_while_the_guest_basket_is_busy(self):
+        self.fill()
+        request = RequestFactory().get(self.url)
+        request.COOKIES["guest_basket"] = self.client.cookies["guest_basket"].value
+        credentials = {"email": "user@example.com", "password": "user123"}
+        with locked_guest_basket(request), mock.patch("carts.guest.LOCK_WAIT", 0):
+            response = self.client.post(reverse("token-obtain-pair"), credentials)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("access", response.json())
+            self.assertNotIn("guest_basket", response.cookies)
+            self.assertTrue(self.client.login(**credentials))
+        self.assertFalse(self.user.basket.items.exists())
+
+        # the lines wait for the next merge
+        response = self.client.post(reverse("token-obtain-pair"), credentials)
+        self.assertEqual(response.cookies["guest_basket"].value, "")
+        self.assertEqual(dict(self.user.basket.items.values_list("product_id", "quantity")),
+                         {self.products[0].pk: 2, self.products[1].pk: 1})
+
+
+class GuestBasketCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = GuestBasketCache(tempfile.mkdtemp(), {})
+        self.addCleanup(self.cache.clear)
+
+    def test_add_claims_a_key_once(self):
+        self.assertTrue(self.cache.add("lock", "a", timeout=10))
+        self.assertFalse(self.cache.add("lock", "b", timeout=10))
+        self.assertEqual(self.cache.get("lock"), "a")
+
+    def test_add_takes_over_an_expired_key(self):
+        self.cache.set("lock", "a", timeout=-1)
+        self.assertTrue(self.cache.add("lock", "b", timeout=10))
+        self.assertEqual(self.cache.get("lock"), "b")
+
+
+class StockContentionTests(TransactionTestCase):
+    workers = 8
+    attempts = 10
+    stock = 25
+
+    def setUp(self):
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Smartphone", category=category, description="Latest model", price=Decimal("100.00"), stock=self.stock,
+        )
+        self.baskets = [
+            User.objects.create_user(email=f"user{number}@example.com", password="user123").basket
+            for number in range(self.workers)
+        ]
+
+    def hammer(self, basket):
+        reserved = 0
+        try:
+            for _ in range(self.attempts):
+                while True:
+                    try:
+                        reserved += BasketItem.objects.add(basket, self.product.pk, 1) is not None
+                        break
+                    except OperationalError:
+                        # the shared-cache in-memory test database reports busy tables instead of waiting
+                        pass
+        finally:
+            connection.close()
+        return reserved
+
+    def test_one_product_hammered_from_many_threads_is_never_oversold(self):
+        with ThreadPoolExecutor(self.workers) as pool:
+            reserved = sum(pool.map(self.hammer, self.baskets))
+
+        in_baskets = BasketItem.objects.filter(product=self.product).aggregate(total=Sum("quantity"))["total"]
+        self.assertEqual(reserved, self.stock)
+        self.assertEqual(in_baskets, self.stock)
+        self.assertEqual(Product.objects.values_list("reserved", flat=True).get(pk=self.product.pk), self.stock)
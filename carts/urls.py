@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BasketViewSet, BasketItemViewSet
+from .views import BasketViewSet, BasketItemViewSet, GuestBasketMergeView, GuestBasketView
 
 
 router = DefaultRouter()
@@ -8,5 +8,7 @@ router.register(r'baskets', BasketViewSet, basename='basket')
 router.register(r'my-basket', BasketItemViewSet, basename='my-basket')
 
 urlpatterns = [
+    path('guest-basket/', GuestBasketView.as_view(), name='guest-basket'),
+    path('guest-basket/merge/', GuestBasketMergeView.as_view(), name='guest-basket-merge'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
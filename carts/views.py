@@ -1,13 +1,26 @@
-from rest_framework.permissions import IsAuthenticated
+from django.db.models import Prefetch
+from rest_framework.decorators import action
+from rest_framework import status
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .models import Basket, BasketItem
-from .serializers import BasketItemSerializer, BasketSerializer
+from config.api.conditional import ConditionalGetMixin
+from config.api.sparse import wants_field
+from .models import Basket, BasketItem, basket_totals
+from .batch import apply_operations
+from .guest import (
+    apply_guest_operations, clear_guest_basket, load_guest_basket, locked_guest_basket, merge_guest_basket,
+    save_guest_basket,
+)
+from .serializers import BasketBatchSerializer, BasketItemSerializer, BasketSerializer
 
 
-class BasketItemViewSet(ModelViewSet):
+class BasketItemViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = BasketItemSerializer
+    conditional_timestamps = ('added_at', 'basket__updated', 'product__updated')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['product', 'quantity']
@@ -16,31 +29,90 @@ class BasketItemViewSet(ModelViewSet):
     ordering = ['-added_at']
 
     def get_queryset(self):
-        user = self.request.user
-        basket = Basket.objects.get(user=user)
-        return BasketItem.objects.filter(basket=basket)
+        queryset = BasketItem.objects.filter(basket__user=self.request.user)
+        if wants_field(self.request, 'total_price'):
+            queryset = queryset.select_related('product')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save()
 
+    def perform_destroy(self, instance):
+        BasketItem.objects.set_quantity(instance, 0)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, *args, **kwargs):
+        # {"operations": [{"product_id": 1, "action": "add|set|remove", "quantity": 2}, ...]}, one transaction
+        serializer = BasketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': apply_operations(request.user, serializer.validated_data['operations'])})
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['basket'] = Basket.objects.get(user=self.request.user)
         return context
 
 
-class BasketViewSet(ModelViewSet):
+class BasketViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = BasketSerializer
+    # item quantity changes touch basket.updated (carts.signals); price changes show up through the products
+    conditional_timestamps = ('updated', 'items__product__updated')
+    conditional_counts = ('pk', 'items')
     permission_classes = [IsAuthenticated]
     http_method_names = ['get']
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['user', 'status']
+    filterset_fields = ['user']
     search_fields = ['user__email']
     ordering_fields = ['created', 'total_price']
     ordering = ['-created']
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return Basket.objects.all()
-        return Basket.objects.filter(user=user)
\ No newline at end of file
+        queryset = Basket.objects.all() if user.is_staff else Basket.objects.filter(user=user)
+        if wants_field(self.request, 'items'):
+            queryset = queryset.prefetch_related(
+                Prefetch('items', queryset=BasketItem.objects.select_related('product').order_by('pk')))
+        if wants_field(self.request, 'total_price') or wants_field(self.request, 'item_count'):
+            queryset = queryset.with_totals()
+        # ?ordering=total_price; an alias, since an annotation would clash with the Basket.total_price property
+        return queryset.alias(total_price=basket_totals()['items_subtotal'])
+
+
+class GuestBasketView(APIView):
+    # the basket of a visitor who is not logged in, kept in the cache until login or checkout (carts/guest.py)
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        token, lines = load_guest_basket(request)
+        return Response(self.basket(lines))
+
+    def post(self, request):
+        # the operations of /api/my-basket/batch/
+        serializer = BasketBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with locked_guest_basket(request) as (token, lines):
+            results = apply_guest_operations(lines, serializer.validated_data['operations'])
+            response = Response({'results': results, **self.basket(lines)})
+            save_guest_basket(response, token, lines)
+        return response
+
+    def delete(self, request):
+        response = Response(status=status.HTTP_204_NO_CONTENT)
+        with locked_guest_basket(request) as (token, lines):
+            clear_guest_basket(response, token)
+        return response
+
+    def basket(self, lines):
+        return {
+            'items': [{'product_id': pk, 'quantity': quantity} for pk, quantity in lines.items()],
+            'item_count': sum(lines.values()),
+        }
+
+
+class GuestBasketMergeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        response = Response()
+        response.data = {'results': merge_guest_basket(request, request.user, response)}
+        return response
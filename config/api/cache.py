@@ -0,0 +1,159 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import checks_object_permissions, not_modified, set_conditional_headers
+
+VERSION_KEY = 'catalog:version'
+# stock versions: one per product, and one for every product's, which responses filtered or ordered by stock read
+STOCK_KEY = 'catalog:stock'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def _incr(key, initial):
+    cache = catalog_cache()
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial, timeout=None)
+        return cache.get(key, initial)
+
+
+def catalog_version():
+    version = catalog_cache().get(VERSION_KEY)
+    if version is None:
+        # start from a clock value so an evicted counter never reuses an old version
+        catalog_cache().add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = catalog_cache().get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version(*args, **kwargs):
+    _incr(VERSION_KEY, time.time_ns() // 1000)
+
+
+def bump_catalog_version_on_commit(*args, **kwargs):
+    # a bump inside the writer's transaction lets a concurrent read cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+
+def product_stock_key(pk):
+    return f'{STOCK_KEY}:{pk}'
+
+
+def bump_stock_versions(product_ids):
+    """
+    Expires the cached responses that show the stock of these products, or depend on stock as a whole,
+    and leaves the rest of the catalog cache alone. Versions are clock stamps (see cached_response).
+    """
+    keys = [STOCK_KEY, *(product_stock_key(pk) for pk in set(product_ids))]
+    catalog_cache().set_many(dict.fromkeys(keys, time.time_ns()), timeout=None)
+
+
+def bump_stock_versions_on_commit(product_ids):
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: bump_stock_versions(product_ids))
+
+
+def stock_unchanged(keys, since):
+    """Whether none of the stock versions `keys` moved after `since`; an evicted version counts as moved."""
+    if not keys:
+        return True
+    versions = catalog_cache().get_many(keys)
+    return len(versions) == len(keys) and max(versions.values()) <= since
+
+
+def cache_stats():
+    hits = catalog_cache().get(HITS_KEY, 0)
+    misses = catalog_cache().get(MISSES_KEY, 0)
+    return {
+        'version': catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0,
+    }
+
+
+def permission_tier(user):
+    if not user.is_authenticated:
+        return 'anon'
+    if user.is_staff and user.is_superuser:
+        return 'admin'
+    return 'user'
+
+
+def response_cache_key(request):
+    query = '&'.join(f'{key}={value}' for key, values in sorted(request.query_params.lists()) for value in values)
+    digest = hashlib.sha1(
+        f'{permission_tier(request.user)}|{request.scheme}://{request.get_host()}{request.path}|{query}'.encode()
+    ).hexdigest()
+    return f'catalog:response:{catalog_version()}:{digest}'
+
+
+class CatalogCacheMixin:
+    """
+    Serves the read actions from the catalog cache; entries die with every catalog version bump, and with
+    the stock versions the handler declared through depend_on_stock(). Actions with object-level
+    permissions are never cached, since a hit would skip the check.
+    """
+    cached_actions = ('list', 'retrieve')
+    stock_dependencies = None
+
+    def depend_on_stock(self, product_ids=None):
+        """Marks the response being built as showing the stock of `product_ids` (None: of every product)."""
+        if self.stock_dependencies is not None:
+            self.stock_dependencies.update(
+                [STOCK_KEY] if product_ids is None else (product_stock_key(pk) for pk in product_ids))
+
+    def get_conditional_identity(self):
+        # catalog responses only vary by permission tier, and any catalog write bumps the version (stock moves
+        # bump the stock versions instead, and the rows' `updated`, which the ETag aggregate reads)
+        return permission_tier(self.request.user), catalog_version()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.cached_actions or checks_object_permissions(self):
+            return handler(request, *args, **kwargs)
+        key = response_cache_key(request)
+        cached = catalog_cache().get(key)
+        if cached is not None and stock_unchanged(cached[3], cached[4]):
+            _incr(HITS_KEY, 1)
+            data, etag, last_modified, _, _ = cached
+            if etag is None:
+                return Response(data, headers={'X-Cache': 'HIT'})
+            if not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED, headers={'X-Cache': 'HIT'})
+            else:
+                response = Response(data, headers={'X-Cache': 'HIT'})
+            return set_conditional_headers(response, etag, last_modified)
+        self.stock_dependencies = set()
+        # stamped before the rows are read: a stock bump racing with the handler leaves a newer version behind
+        computed = time.time_ns()
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            _incr(MISSES_KEY, 1)
+            last_modified = parse_http_date_safe(response.get('Last-Modified', ''))
+            dependencies = sorted(self.stock_dependencies)
+            # products whose stock never moved have no version yet
+            for dependency in set(dependencies) - catalog_cache().get_many(dependencies).keys():
+                catalog_cache().add(dependency, computed, timeout=None)
+            catalog_cache().set(key, (response.data, response.get('ETag'), last_modified, dependencies, computed),
+                                settings.CATALOG_CACHE_TIMEOUT)
+            response['X-Cache'] = 'MISS'
+        return response
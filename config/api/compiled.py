@@ -0,0 +1,154 @@
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import ForeignKey
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+
+from .fields import FiniteFloatField
+
+# DRF fields whose to_representation() returns the database value unchanged
+PASSTHROUGH_FIELDS = (
+    drf_fields.CharField, drf_fields.IntegerField, drf_fields.FloatField, drf_fields.BooleanField,
+    drf_fields.ChoiceField, drf_fields.ReadOnlyField, drf_fields.JSONField, PrimaryKeyRelatedField,
+)
+
+
+def column_for(model, source):
+    """values() key holding the database value behind a serializer field `source`, None if there is none."""
+    if '.' in source:
+        return source.replace('.', '__')
+    try:
+        model_field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if isinstance(model_field, ForeignKey):
+        return model_field.attname
+    return model_field.name if model_field.concrete else None
+
+
+def file_url(name, storage, request):
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def column_accessor(field, key, model, request):
+    if isinstance(field, drf_fields.FileField):
+        storage = model._meta.get_field(field.source).storage
+        return lambda row: file_url(row[key], storage, request)
+    if isinstance(field, PASSTHROUGH_FIELDS) and not isinstance(field, FiniteFloatField):
+        return lambda row: row[key]
+    to_representation = field.to_representation
+    return lambda row: None if row[key] is None else to_representation(row[key])
+
+
+def compile_plan(serializer, model, request, custom=None):
+    """
+    ([(name, accessor)], values() columns) rendering rows the way `serializer` renders instances. Only
+    the fields left after ?fields= / ?omit= pruning are compiled; `custom` supplies accessors for
+    fields that are not plain columns (properties, method fields, nested serializers).
+    """
+    custom = custom or {}
+    plan, columns = [], set()
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in custom:
+            plan.append((name, custom[name]))
+            continue
+        key = column_for(model, field.source)
+        if key is None:
+            raise ImproperlyConfigured(f"No compiled accessor for '{name}' of {type(serializer).__name__}.")
+        columns.add(key)
+        plan.append((name, column_accessor(field, key, model, serializer.context.get('request'))))
+    return plan, columns
+
+
+def render(plan, row):
+    return {name: accessor(row) for name, accessor in plan}
+
+
+class RowAttributes:
+    """Attribute access to a values() row, for evaluating model properties without building instances."""
+    __slots__ = ('row',)
+
+    def __init__(self, row):
+        self.row = row
+
+    def __getattr__(self, name):
+        return self.row[name]
+
+
+def property_accessor(model, name):
+    getter = getattr(model, name).fget
+    return lambda row: getter(RowAttributes(row))
+
+
+class CompiledSerializer:
+    """
+    Read-only list twin of `serializer_class` that renders `values()` rows instead of model instances,
+    with the per-field work resolved once per request. Subclasses provide accessors for the non-column
+    fields in custom_accessors() and bulk-load related rows for a page in prepare().
+    """
+    serializer_class = None
+    # model properties rendered by the serializer: {name: columns the property reads}
+    property_columns = {}
+
+    def __init__(self, context):
+        self.context = context
+        self.request = context.get('request')
+        self.model = self.serializer_class.Meta.model
+        self.columns = {self.model._meta.pk.name}
+        serializer = self.serializer_class(context=context)
+        custom = {}
+        for name, columns in self.property_columns.items():
+            if name in serializer.fields:
+                custom[name] = property_accessor(self.model, name)
+                self.columns.update(columns)
+        custom.update(self.custom_accessors(serializer))
+        self.plan, columns = compile_plan(serializer, self.model, self.request, custom)
+        self.columns |= columns
+
+    def custom_accessors(self, serializer):
+        """{field name: accessor(row)}; add the columns they read to self.columns."""
+        return {}
+
+    def rows(self, queryset, extra=()):
+        """The values() queryset to paginate; `extra` adds columns the pagination ordering reads."""
+        return queryset.prefetch_related(None).values(*sorted(self.columns | set(extra)))
+
+    def prepare(self, rows):
+        pass
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        plan = self.plan
+        return [{name: accessor(row) for name, accessor in plan} for row in rows]
+
+
+class CompiledListMixin:
+    """
+    Serves `list` through `compiled_serializer_class` (see CompiledSerializer) when the request allows it;
+    everything else, and lists with ?expand=, use the regular serializer.
+    """
+    compiled_serializer_class = None
+
+    def use_compiled_serializer(self):
+        return (self.compiled_serializer_class is not None and self.action == 'list'
+                and 'expand' not in self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_compiled_serializer():
+            return super().list(request, *args, **kwargs)
+        compiled = self.compiled_serializer_class(self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        # the keyset paginator reads its ordering columns from the rows
+        extra = [queryset.model._meta.pk.name, *queryset.query.annotations,
+                 *(field for field in getattr(self, 'ordering_fields', None) or () if isinstance(field, str))]
+        rows = compiled.rows(queryset, extra)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.serialize(page))
+        return Response(compiled.serialize(rows))
@@ -0,0 +1,91 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+
+
+def not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in etags)
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return bool(if_modified_since and last_modified and last_modified <= if_modified_since)
+
+
+def set_conditional_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+    return response
+
+
+def checks_object_permissions(view):
+    # permissions that keep BasePermission's has_object_permission allow every object, so there is nothing to fetch
+    return any(type(permission).has_object_permission is not BasePermission.has_object_permission
+               for permission in view.get_permissions())
+
+
+class ConditionalGetMixin:
+    # ETag / Last-Modified for list and retrieve, built from one Max/Count aggregate over the filtered
+    # queryset so a matching If-None-Match / If-Modified-Since gets its 304 before anything is serialized
+    conditional_timestamps = ('updated',)
+    conditional_counts = ('pk',)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+    def get_conditional_identity(self):
+        return self.request.user.pk
+
+    def is_conditional_detail(self):
+        return (self.lookup_url_kwarg or self.lookup_field) in self.kwargs
+
+    def get_conditional_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.is_conditional_detail():
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]})
+        return queryset
+
+    def get_conditional_state(self):
+        aggregates = {f'modified_{field}': Max(field) for field in self.conditional_timestamps}
+        aggregates.update({f'count_{field}': Count(field, distinct=True) for field in self.conditional_counts})
+        state = self.get_conditional_queryset().order_by().aggregate(**aggregates)
+        if self.is_conditional_detail() and not state[f'count_{self.conditional_counts[0]}']:
+            # let the regular handler produce its 404
+            return None
+        last_modified = max(
+            (int(state[f'modified_{field}'].timestamp())
+             for field in self.conditional_timestamps if state[f'modified_{field}']),
+            default=None,
+        )
+        key = (
+            self.get_conditional_identity(),
+            self.request.path,
+            sorted(self.request.query_params.lists()),
+            sorted((name, str(value)) for name, value in state.items()),
+        )
+        return f'W/"{hashlib.sha1(repr(key).encode()).hexdigest()}"', last_modified
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        state = self.get_conditional_state()
+        if state is None:
+            return handler(request, *args, **kwargs)
+        etag, last_modified = state
+        if not_modified(request, etag, last_modified):
+            if self.is_conditional_detail() and checks_object_permissions(self):
+                # a 304 must not confirm an object the regular handler would refuse
+                self.get_object()
+            return set_conditional_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_conditional_headers(response, etag, last_modified)
+        return response
@@ -0,0 +1,16 @@
+import math
+
+from rest_framework import serializers
+
+
+class FiniteFloatField(serializers.FloatField):
+    """
+    FloatField that refuses NaN and infinite values on output with JSONRenderer's ValueError, so the
+    renderers never see them: orjson (config.api.renderers) would write them as null.
+    """
+
+    def to_representation(self, value):
+        value = super().to_representation(value)
+        if not math.isfinite(value):
+            raise ValueError("Out of range float values are not JSON compliant: " + repr(value))
+        return value
@@ -0,0 +1,40 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class TotalCountPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class FeedPagination(CursorPagination):
+    """
+    Keyset pagination over the view's ordering with an id tiebreak: opaque cursors and no COUNT(*).
+    Sending `?page=<n>` switches to page-number pagination for clients that need totals.
+    """
+    ordering = ('-created', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    page_number_class = TotalCountPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_paginator = None
+        if self.page_number_class.page_query_param in request.query_params:
+            self.page_number_paginator = self.page_number_class()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.page_number_paginator:
+            return self.page_number_paginator.get_html_context()
+        return super().get_html_context()
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
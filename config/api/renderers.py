@@ -0,0 +1,78 @@
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # the stdlib json paths of DRF are used instead
+    orjson = None
+
+encoder_default = JSONEncoder().default
+# maps every digit to b'0', so the checks below are plain substring searches
+DIGITS_AS_ZERO = bytes(ord('0') if chr(i) in '0123456789' else i for i in range(256))
+# orjson writes 1e16 / 1e-7 where json writes 1e+16 / 1e-07
+EXPONENT_FLOAT = re.compile(rb'[0-9]e-?[0-9]')
+# orjson reads integers beyond 64 bits as floats
+BIG_INTEGER = b'0' * 20
+
+
+def encode(data):
+    """
+    Compact UTF-8 JSON for `data`, the same bytes as DRF's JSONEncoder with ensure_ascii=False, or None
+    when orjson is missing or cannot guarantee that (non-str keys, huge integers, exponent floats). Decimals,
+    datetimes and the other non-JSON types go through DRF's encoder, so they keep its format. NaN and
+    infinite floats, which orjson writes as null, are refused by the serializers (see config.api.fields)
+    instead of searched for here, which would cost more than the encoding.
+    """
+    if orjson is None:
+        return None
+    try:
+        content = orjson.dumps(data, default=encoder_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    except TypeError:
+        return None
+    if b'0e' in content.translate(DIGITS_AS_ZERO) and EXPONENT_FLOAT.search(content):
+        return None
+    return content
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer on orjson when it is installed; the output is byte-for-byte what JSONRenderer produces
+    and anything orjson cannot match (indented output, ensure_ascii, the cases in encode()) falls back to it.
+    NaN and infinite floats are the exception: orjson renders them as null where JSONRenderer raises, so the
+    serializers refuse them first (config.api.fields.FiniteFloatField).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        content = encode(data)
+        if content is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        # same JavaScript-safe escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser on orjson when it is installed. Invalid bodies are re-parsed by JSONParser for its error message."""
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        content = stream.read()
+        if BIG_INTEGER not in content.translate(DIGITS_AS_ZERO):
+            try:
+                return orjson.loads(content)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(content), media_type, parser_context)
@@ -0,0 +1,76 @@
+from django.db import models
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ModelSerializer
+
+from .fields import FiniteFloatField
+
+
+def parse_paths(value):
+    return {path.strip() for path in (value or '').split(',') if path.strip()}
+
+
+def requested_expansions(request):
+    if request is None:
+        return set()
+    return parse_paths(request.query_params.get('expand'))
+
+
+def field_path(serializer, name):
+    names = [name]
+    while serializer.parent is not None:
+        if serializer.field_name:
+            names.append(serializer.field_name)
+        serializer = serializer.parent
+    prefix = serializer.context.get('field_prefix')
+    if prefix:
+        names.append(prefix)
+    return '.'.join(reversed(names))
+
+
+def wants_field(request, path):
+    """
+    False when ?fields= / ?omit= (dotted paths, e.g. fields=id,name,category.name) leave `path` out.
+    Only applies to reads; writes always get the full representation back.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return True
+    selected = parse_paths(request.query_params.get('fields'))
+    omitted = parse_paths(request.query_params.get('omit'))
+    parts = path.split('.')
+    for depth in range(1, len(parts) + 1):
+        prefix = '.'.join(parts[:depth - 1])
+        if '.'.join(parts[:depth]) in omitted:
+            return False
+        # names selected at this depth: `fields=category.name` selects `category`, then `name` inside it
+        names = {
+            selected_path[len(prefix) + 1 if prefix else 0:].split('.')[0]
+            for selected_path in selected
+            if not prefix or selected_path.startswith(f'{prefix}.')
+        }
+        if names and parts[depth - 1] not in names:
+            return False
+    return True
+
+
+def nested_context(serializer, name):
+    """Context for a serializer built by hand for field `name`, so sparse paths keep working inside it."""
+    return {**serializer.context, 'field_prefix': field_path(serializer, name)}
+
+
+class DynamicFieldsMixin:
+    # fields only serialized when named in ?expand=
+    expandable_fields = ()
+    # model FloatFields render through FiniteFloatField, which is what lets the renderers skip the NaN check
+    serializer_field_mapping = {**ModelSerializer.serializer_field_mapping, models.FloatField: FiniteFloatField}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+        expansions = requested_expansions(request)
+        for name in list(fields):
+            path = field_path(self, name)
+            if name in self.expandable_fields and path not in expansions or not wants_field(request, path):
+                fields.pop(name)
+        return fields
@@ -0,0 +1,35 @@
+import json
+from itertools import islice
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .renderers import encode
+
+
+def dumps(data):
+    content = encode(data)
+    if content is not None:
+        return content.decode()
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def serialize_in_chunks(queryset, serializer_class, context, chunk_size):
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield from serializer_class(chunk, many=True, context=context).data
+
+
+def stream_json_object(header, key, items):
+    """Yield `header` as a JSON object whose `key` member is an array streamed from `items`."""
+    head = dumps(header)
+    yield f'{head[:-1]}{"," if header else ""}{dumps(key)}:['
+    separator = ''
+    for item in items:
+        yield separator + dumps(item)
+        separator = ','
+    yield ']}'
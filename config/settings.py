@@ -136,6 +136,38 @@ STATIC_URL = "static/"
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# Caches
+# The catalog cache holds serialized responses of the public catalog endpoints (see config/api/cache.py).
+# Point CATALOG_CACHE_BACKEND at django.core.cache.backends.filebased.FileBasedCache and
+# CATALOG_CACHE_LOCATION at a directory to share it between worker processes on one node.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "catalog": {
+        "BACKEND": os.getenv('CATALOG_CACHE_BACKEND', "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv('CATALOG_CACHE_LOCATION', "catalog"),
+    },
+    "baskets": {
+        "BACKEND": os.getenv('GUEST_BASKET_CACHE_BACKEND', "carts.cache.GuestBasketCache"),
+        "LOCATION": os.getenv('GUEST_BASKET_CACHE_LOCATION', os.path.join(BASE_DIR, 'var', 'guest_baskets')),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv('GUEST_BASKET_CACHE_MAX_ENTRIES', 100000))},
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Baskets of anonymous visitors live only in the "baskets" cache under a signed cookie (see carts/guest.py) and
+# reach the database when the visitor logs in or checks out. Unlike catalog entries they cannot be rebuilt, so the
+# default is a file cache every worker process of the host shares. Across hosts use a shared cache whose add() is
+# atomic (Redis, Memcached), as the guest basket lock relies on it; LocMemCache loses baskets between workers.
+GUEST_BASKET_CACHE_ALIAS = 'baskets'
+GUEST_BASKET_COOKIE = 'guest_basket'
+GUEST_BASKET_TIMEOUT = int(os.getenv('GUEST_BASKET_TIMEOUT', 7 * 24 * 60 * 60))
+# seconds a basket line holds its stock before `manage.py sweep_basket_holds` returns it
+BASKET_HOLD_TTL = int(os.getenv('BASKET_HOLD_TTL', 30 * 60))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -151,6 +183,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson-backed when installed, byte-for-byte the same output as DRF's JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'config.api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],  # Ko'plik shakli
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',  # List emas, string
     'PAGE_SIZE': 10
@@ -158,6 +200,19 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'users.user'
 
+# products.search.SQLiteFTSBackend (FTS5) or products.search.DatabaseSearchBackend (plain icontains)
+PRODUCT_SEARCH_BACKEND = os.getenv('PRODUCT_SEARCH_BACKEND', 'products.search.SQLiteFTSBackend')
+
+# lower bounds of the price buckets reported by /api/products/facets/
+PRODUCT_FACET_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# resized copies generated by products.images for every ProductImage and Brand logo (name: max edge in px)
+PRODUCT_IMAGE_VARIANTS = {'thumbnail': 160, 'medium': 640, 'large': 1280}
+PRODUCT_IMAGE_FORMAT = os.getenv('PRODUCT_IMAGE_FORMAT', 'WEBP')
+PRODUCT_IMAGE_QUALITY = int(os.getenv('PRODUCT_IMAGE_QUALITY', 80))
+# size of the background worker pool; 0 processes uploads inline
+PRODUCT_IMAGE_WORKERS = int(os.getenv('PRODUCT_IMAGE_WORKERS', 2))
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
@@ -0,0 +1,58 @@
+from statistics import median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from carts.models import BasketItem
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from products.models import Product
+from users.models import User
+
+EMAIL = 'bench-checkout@example.com'
+
+
+class Command(BaseCommand):
+    help = ("Measure OrderSerializer.create (checkout) latency and queries for baskets of 1, 10 and 100 lines. "
+            "Every checkout runs in a transaction that is rolled back, so product stock and holds are left as "
+            "they were; the bench user is removed afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, lines, repeat, **options):
+        products = list(Product.objects.order_by('pk').values_list('pk', flat=True)[:max(lines)])
+        if len(products) < max(lines):
+            raise CommandError(f"Needs at least {max(lines)} products.")
+        User.objects.filter(email=EMAIL).delete()
+        user = User.objects.create_user(email=EMAIL, password=None)
+        request = Request(RequestFactory().post('/api/orders/'))
+        request.user = user
+        try:
+            for count in lines:
+                timings, queries = [], 0
+                for _ in range(repeat + 1):
+                    with transaction.atomic():
+                        # lines holding their units, as BasketItem.objects.add leaves them, on stock that has them
+                        Product.objects.filter(pk__in=products[:count]).update(
+                            stock=F('stock') + 2, reserved=F('reserved') + 2)
+                        BasketItem.objects.bulk_create(
+                            BasketItem(basket=user.basket, product_id=pk, quantity=2, held=2) for pk in products[:count])
+                        serializer = OrderSerializer(data={}, context={'request': request})
+                        serializer.is_valid(raise_exception=True)
+                        with CaptureQueriesContext(connection) as captured:
+                            started = perf_counter()
+                            serializer.save()
+                            timings.append(perf_counter() - started)
+                        queries = len(captured)
+                        transaction.set_rollback(True)
+                self.stdout.write(f"{count:>4} lines: {median(timings[1:]) * 1000:8.2f} ms median, {queries} queries")
+        finally:
+            Order.objects.filter(basket__user=user).delete()
+            user.delete()
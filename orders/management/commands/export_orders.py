@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_filters.filterset import filterset_factory
+
+from orders.models import Order, OrderItem
+from orders.views import OrderViewSet
+from products.exports import EXPORT_FORMATS, order_line_export
+from products.management.commands.export_products import parse_filters, write_export
+
+
+class Command(BaseCommand):
+    help = "Stream every order line (optionally filtered with the /api/orders/ filter fields) as CSV, JSONL or columnar JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help="File to write; defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help=f"One of {', '.join(OrderViewSet.filterset_fields)}, e.g. --filter status=delivered")
+
+    def handle(self, *args, format, output, chunk_size, filter, **options):
+        filterset_class = filterset_factory(Order, fields=OrderViewSet.filterset_fields)
+        filterset = filterset_class(data=parse_filters(filter), queryset=Order.objects.all())
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+        lines = OrderItem.objects.filter(order__in=filterset.qs.values('pk')).order_by('order_id', 'pk')
+        write_export(order_line_export(lines, format, chunk_size), output, self.stdout)
@@ -23,7 +23,7 @@ class Order(models.Model):
         return f"Order {self.id} by {self.basket.user.email}"
 
     def save(self, *args, **kwargs):
-        if not self.pk:
+        if not self.pk and self.total_price is None:
             self.total_price = self.basket.total_price
         super().save(*args, **kwargs)
 
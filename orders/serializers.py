@@ -1,10 +1,19 @@
+from decimal import Decimal
+
 from django.db import transaction
+from django.db.models import F
 from rest_framework import serializers
 from .models import OrderItem, Order
-from carts.models import Basket
+from carts.guest import merge_guest_basket
+from carts.batch import per_product
+from carts.models import Basket, BasketItem, lines_settled_by_caller
+from config.api.cache import bump_stock_versions_on_commit
+from products.models import Product
 from django.utils.timezone import now
+from config.api.compiled import CompiledSerializer, compile_plan, property_accessor
+from config.api.sparse import DynamicFieldsMixin
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
@@ -13,7 +22,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['price_at_order', 'created', 'total_price']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
@@ -23,31 +32,60 @@ class OrderSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
+        # what the user put in the basket before logging in counts too
+        merge_guest_basket(self.context['request'], user)
         try:
             with transaction.atomic():
+                # takes the lines out of the hold sweeper's reach before their holds are read; as a write
+                # first, it also makes SQLite take its write lock up front
+                BasketItem.objects.filter(basket__user=user).update(hold_expires_at=None)
                 basket = Basket.objects.get(user=user)
-                basket_items = basket.items.all()
+                basket_items = list(basket.items.select_related('product').order_by('pk'))
 
                 if not basket_items:
                     raise serializers.ValidationError({"detail": "Basket is empty"})
 
+                # one guarded UPDATE sells every line: the units leave the stock and the line's hold ends;
+                # units a line no longer holds (its hold expired) must still be available
+                quantities = {item.product_id: item.quantity for item in basket_items}
+                held = {item.product_id: item.held for item in basket_items}
+                missing = {pk: max(quantities[pk] - held[pk], 0) for pk in quantities}
+                sold = (
+                    Product.objects.filter(pk__in=quantities, stock__gte=per_product(quantities))
+                    .filter(stock__gte=F('reserved') + per_product(missing))
+                    .update(stock=F('stock') - per_product(quantities), reserved=F('reserved') - per_product(held),
+                            updated=now())
+                )
+                if sold != len(quantities):
+                    short = [item.product.name for item in basket_items
+                             if item.product.stock < item.quantity or item.product.available < missing[item.product_id]]
+                    # the stock moved after it was read
+                    short = short or [item.product.name for item in basket_items]
+                    raise serializers.ValidationError({"detail": f"Not enough {', '.join(short)} left in stock"})
+                bump_stock_versions_on_commit(quantities)
+
+                # prices are frozen from the products loaded above; the total matches Basket.total_price
                 order = Order.objects.create(
                     basket=basket,
-                    status='pending'
+                    status='pending',
+                    total_price=Decimal(sum(item.product.discounted_price * item.quantity for item in basket_items)),
                 )
-
-                for item in basket_items:
-                    OrderItem.objects.create(
+                OrderItem.objects.bulk_create(
+                    OrderItem(
                         order=order,
                         product=item.product,
                         quantity=item.quantity,
-                        discount=item.product.discount if hasattr(item.product, 'discount') else None,
-                        price_at_order=item.product.price
+                        discount=item.product.discount,
+                        price_at_order=item.product.price,
                     )
+                    for item in basket_items
+                )
 
-                basket_items.delete()
-
-                order.refresh_from_db()
+                # one DELETE of exactly the ordered lines, whose holds were settled above; the basket is touched
+                # once instead of per line
+                with lines_settled_by_caller():
+                    BasketItem.objects.filter(pk__in=[item.pk for item in basket_items]).delete()
+                Basket.objects.filter(pk=basket.pk).update(updated=now())
                 return order
 
         except Basket.DoesNotExist:
@@ -58,9 +96,7 @@ class OrderSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             if new_status == "cancelled" and instance.status != "cancelled":
                 for item in instance.items.all():
-                    product = item.product
-                    product.stock += item.quantity
-                    product.save()
+                    Product.objects.restock(item.product_id, item.quantity)
 
             if new_status == "delivered" and instance.status != "delivered":
                 instance.delivered_at = now()
@@ -68,4 +104,28 @@ class OrderSerializer(serializers.ModelSerializer):
             instance.status = new_status
             instance.save()
             instance.refresh_from_db()
-            return instance
\ No newline at end of file
+            return instance
+
+
+class CompiledOrderSerializer(CompiledSerializer):
+    """OrderSerializer over values() rows, with the items of a page loaded in one query."""
+    serializer_class = OrderSerializer
+
+    def custom_accessors(self, serializer):
+        if 'items' not in serializer.fields:
+            return {}
+        items = serializer.fields['items'].child
+        custom = {}
+        if 'total_price' in items.fields:
+            custom['total_price'] = property_accessor(OrderItem, 'total_price')
+        self.item_plan, self.item_columns = compile_plan(items, OrderItem, self.request, custom)
+        self.item_columns |= {'order_id', 'price_at_order', 'quantity'}
+        return {'items': lambda row: self.items[row['id']]}
+
+    def prepare(self, rows):
+        if not hasattr(self, 'item_plan'):
+            return
+        self.items = {row['id']: [] for row in rows}
+        plan = self.item_plan
+        for item in OrderItem.objects.filter(order_id__in=list(self.items)).order_by('pk').values(*self.item_columns):
+            self.items[item['order_id']].append({name: accessor(item) for name, accessor in plan})
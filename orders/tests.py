@@ -1,3 +1,120 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from carts.models import BasketItem
+from products.models import Category, Product
+from users.models import User
+from .models import Order, OrderItem
+from .views import OrderViewSet
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        category = Category.objects.create(name="Electronics")
+        self.product = Product.objects.create(
+            name="Smartphone", category=category, description="Latest model", price=Decimal("100.00"), stock=10,
+        )
+        BasketItem.objects.create(basket=self.user.basket, product=self.product, quantity=2)
+        for status in ("pending", "delivered"):
+            order = Order.objects.create(basket=self.user.basket, status=status)
+            OrderItem.objects.create(order=order, product=self.product, quantity=2, price_at_order=Decimal("100.00"))
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse("order-export")).status_code, 403)
+
+    def test_export_streams_filtered_order_lines(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("order-export"), {"export_format": "jsonl", "status": "delivered"})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]["status"], rows[0]["customer"], rows[0]["quantity"]),
+                         ("delivered", "user@example.com", 2))
+
+
+class CompiledOrderListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        category = Category.objects.create(name="Electronics")
+        products = [
+            Product.objects.create(name=f"Phone {i}", category=category, description="Phone",
+                                   price=Decimal("100.00"), stock=10)
+            for i in range(2)
+        ]
+        BasketItem.objects.create(basket=self.user.basket, product=products[0], quantity=1)
+        for status in ("pending", "delivered", "cancelled"):
+            order = Order.objects.create(basket=self.user.basket, status=status)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, quantity=3, price_at_order=Decimal("99.95"))
+        self.client.force_authenticate(self.user)
+
+    def assertSameAsRegular(self, params):
+        compiled = self.client.get(reverse("order-list"), params)
+        with mock.patch.object(OrderViewSet, "compiled_serializer_class", None):
+            regular = self.client.get(reverse("order-list"), params)
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, regular.content)
+
+    def test_output_matches_regular_serializer(self):
+        for params in ({}, {"fields": "id,items.total_price"}, {"omit": "items"}, {"ordering": "created"}):
+            with self.subTest(params=params):
+                self.assertSameAsRegular(params)
+
+    def test_every_field_matches_regular_serializer(self):
+        # one field (and item field) at a time, so an accessor drifting from its DRF field is named
+        order = self.client.get(reverse("order-list")).json()["results"][0]
+        paths = [*order, *(f"items.{name}" for name in order["items"][0])]
+        for path in paths:
+            with self.subTest(field=path):
+                self.assertSameAsRegular({"fields": path})
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(email="user@example.com", password="user123")
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Electronics")
+        self.products = [
+            Product.objects.create(name=f"Phone {i}", category=category, description="Phone",
+                                   price=Decimal("100.00") + i, discount=10 * (i % 3), stock=10)
+            for i in range(20)
+        ]
+
+    def fill(self, count):
+        for product in self.products[:count]:
+            BasketItem.objects.add(self.user.basket, product.pk, 2)
+
+    def test_order_freezes_the_basket(self):
+        self.fill(3)
+        expected_total = self.user.basket.total_price
+        response = self.client.post(reverse("order-list"), {})
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.json()["id"])
+        self.assertEqual(order.total_price, expected_total)
+        self.assertEqual(
+            list(order.items.order_by("product_id").values_list("product_id", "quantity", "discount", "price_at_order")),
+            [(p.pk, 2, p.discount, p.price) for p in self.products[:3]],
+        )
+        self.assertFalse(self.user.basket.items.exists())
+        self.assertEqual(set(Product.objects.values_list("stock", flat=True)[:3]), {8})
 
-# Create your tests here.
+    def test_checkout_queries_do_not_grow_with_the_lines(self):
+        self.fill(2)
+        # hold claim + basket + lines with products + stock UPDATE + order + items + collect and delete the
+        # lines + basket touch, the savepoint pair and the response's items
+        with self.assertNumQueries(12):
+            self.client.post(reverse("order-list"), {})
+        self.fill(20)
+        with self.assertNumQueries(12):
+            response = self.client.post(reverse("order-list"), {})
+        self.assertEqual(len(response.json()["items"]), 20)
@@ -6,11 +6,17 @@ from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from .models import Order, OrderItem
-from .serializers import OrderSerializer, OrderItemSerializer
+from .serializers import CompiledOrderSerializer, OrderSerializer, OrderItemSerializer
+from config.api.compiled import CompiledListMixin
+from config.api.conditional import ConditionalGetMixin
+from config.api.pagination import FeedPagination
+from config.api.sparse import wants_field
+from products.exports import export_response, order_line_export, requested_export_format
 
 
-class OrderItemViewSet(ModelViewSet):
+class OrderItemViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = OrderItemSerializer
+    conditional_timestamps = ('created', 'order__updated')
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['product', 'quantity', 'order']
@@ -22,8 +28,10 @@ class OrderItemViewSet(ModelViewSet):
         return OrderItem.objects.filter(order__basket__user=self.request.user)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, CompiledListMixin, ModelViewSet):
     serializer_class = OrderSerializer
+    compiled_serializer_class = CompiledOrderSerializer
+    pagination_class = FeedPagination
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'basket', 'total_price']
@@ -32,15 +40,26 @@ class OrderViewSet(ModelViewSet):
     ordering = ['-created']
 
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(basket__user=self.request.user)
+        queryset = Order.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(basket__user=self.request.user)
+        if self.action in ('list', 'retrieve') and wants_field(self.request, 'items'):
+            queryset = queryset.prefetch_related('items')
+        return queryset
 
     def get_permissions(self):
-        if self.action in ['update', 'partial_update', 'destroy']:
+        if self.action in ['update', 'partial_update', 'destroy', 'export']:
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        # one row per order line; ?export_format=csv|jsonl|columnar plus the list filters
+        format = requested_export_format(request)
+        orders = self.filter_queryset(self.get_queryset())
+        lines = OrderItem.objects.filter(order__in=orders.values('pk')).order_by('order_id', 'pk')
+        return export_response(order_line_export(lines, format), format, 'orders')
+
     @action(detail=False, methods=['POST'], url_path='make-order')
     def create_from_basket(self, request):
         serializer = OrderSerializer(data={}, context={'request': request})
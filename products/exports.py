@@ -0,0 +1,143 @@
+import csv
+from datetime import date, datetime
+
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from config.api.streaming import chunked, dumps
+
+from .models import ProductField, ProductsFieldValue
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    # column-oriented JSONL: one {"rows": n, "columns": {name: [values]}} record per chunk
+    'columnar': ('application/x-ndjson', 'columns.jsonl'),
+}
+
+# same column names the catalog importer reads, so a CSV export can be imported again
+PRODUCT_COLUMNS = {
+    'id': F('id'),
+    'name': F('name'),
+    'category': F('category__name'),
+    'brand': F('brand__name'),
+    'description': F('description'),
+    'price': F('price'),
+    'effective_price': F('effective_price'),
+    'stock': F('stock'),
+    'discount': F('discount'),
+    'rating_average': F('rating_average'),
+    'rating_count': F('rating_count'),
+    'created': F('created'),
+    'updated': F('updated'),
+}
+
+ORDER_LINE_COLUMNS = {
+    'order_id': F('order_id'),
+    'status': F('order__status'),
+    'customer': F('order__basket__user__email'),
+    'order_total': F('order__total_price'),
+    'ordered_at': F('order__created'),
+    'delivered_at': F('order__delivered_at'),
+    'product_id': F('product_id'),
+    'product': F('product__name'),
+    'quantity': F('quantity'),
+    'discount': F('discount'),
+    'price_at_order': F('price_at_order'),
+}
+
+
+def export_rows(queryset, columns, chunk_size):
+    """
+    `values()` rows of `queryset` as lists of at most `chunk_size` dicts. Rows come from a server-side
+    iterator, so only one chunk is ever held in memory.
+    """
+    # expressions are aliased with a prefix because values() refuses aliases that shadow model fields
+    aliases = {f'export_{name}': expression for name, expression in columns.items()}
+    rows = queryset.values(**aliases).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        yield [{name: row[f'export_{name}'] for name in columns} for row in chunk]
+
+
+def with_attributes(chunks):
+    """Adds an `attributes` {field name: value} map to every product row, one query per chunk."""
+    names = dict(ProductField.objects.values_list('pk', 'name'))
+    for chunk in chunks:
+        attributes = {row['id']: {} for row in chunk}
+        for product_id, field_id, value in ProductsFieldValue.objects.filter(
+                product_id__in=list(attributes)).values_list('product_id', 'field_id', 'value'):
+            attributes[product_id][names[field_id]] = value
+        for row in chunk:
+            row['attributes'] = attributes[row['id']]
+        yield chunk
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def stream_csv(chunks, columns, attribute_names=()):
+    writer = csv.writer(Echo())
+    yield writer.writerow([*columns, *(f'attr[{name}]' for name in attribute_names)])
+    for chunk in chunks:
+        lines = []
+        for row in chunk:
+            attributes = row.get('attributes', {})
+            lines.append(writer.writerow([
+                *(csv_value(row[name]) for name in columns),
+                *(attributes.get(name, '') for name in attribute_names),
+            ]))
+        yield ''.join(lines)
+
+
+def stream_jsonl(chunks):
+    for chunk in chunks:
+        yield ''.join(f'{dumps(row)}\n' for row in chunk)
+
+
+def stream_columnar(chunks, columns):
+    for chunk in chunks:
+        names = list(chunk[0]) if chunk else list(columns)
+        yield dumps({'rows': len(chunk), 'columns': {name: [row[name] for row in chunk] for name in names}}) + '\n'
+
+
+def stream_export(chunks, columns, format, attribute_names=()):
+    if format == 'csv':
+        return stream_csv(chunks, columns, attribute_names)
+    if format == 'jsonl':
+        return stream_jsonl(chunks)
+    if format == 'columnar':
+        return stream_columnar(chunks, columns)
+    raise ValueError(f"Unsupported export format '{format}', expected one of {', '.join(EXPORT_FORMATS)}.")
+
+
+def product_export(queryset, format, chunk_size=2000):
+    chunks = with_attributes(export_rows(queryset, PRODUCT_COLUMNS, chunk_size))
+    attribute_names = sorted(set(ProductField.objects.values_list('name', flat=True))) if format == 'csv' else ()
+    return stream_export(chunks, PRODUCT_COLUMNS, format, attribute_names)
+
+
+def order_line_export(queryset, format, chunk_size=2000):
+    return stream_export(export_rows(queryset, ORDER_LINE_COLUMNS, chunk_size), ORDER_LINE_COLUMNS, format)
+
+
+def requested_export_format(request, default='csv'):
+    # `format` itself is DRF's renderer override, hence `export_format`
+    format = request.query_params.get('export_format', default)
+    if format not in EXPORT_FORMATS:
+        raise ValidationError({"export_format": f"Expected one of {', '.join(EXPORT_FORMATS)}."})
+    return format
+
+
+def export_response(stream, format, filename):
+    content_type, extension = EXPORT_FORMATS[format]
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
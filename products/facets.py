@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Count, OuterRef, Subquery, Value, When
+
+from .models import Brand, Category, Product, ProductFacet, ProductField, ProductsFieldValue
+
+FIELD_FACET_PREFIX = 'field:'
+
+
+def field_facet(field_id):
+    return f'{FIELD_FACET_PREFIX}{field_id}'
+
+
+def price_buckets():
+    bounds = settings.PRODUCT_FACET_PRICE_BUCKETS
+    return [f'{low}-{high}' for low, high in zip(bounds, bounds[1:])] + [f'{bounds[-1]}+']
+
+
+def price_bucket(price):
+    bounds = settings.PRODUCT_FACET_PRICE_BUCKETS
+    for low, high in zip(bounds, bounds[1:]):
+        if price < high:
+            return f'{low}-{high}'
+    return f'{bounds[-1]}+'
+
+
+def product_facets(product):
+    facets = {
+        'category': str(product['category_id']),
+        'price': price_bucket(product['price']),
+        'discount': 'true' if product['discount'] else 'false',
+    }
+    if product['brand_id']:
+        facets['brand'] = str(product['brand_id'])
+    return facets
+
+
+def refresh_product_facets(queryset, batch_size=1000):
+    products = queryset.order_by('pk').values('pk', 'category_id', 'brand_id', 'price', 'discount')
+    batch = []
+    for product in products.iterator(chunk_size=batch_size):
+        batch.append(product)
+        if len(batch) >= batch_size:
+            _refresh_batch(batch)
+            batch = []
+    if batch:
+        _refresh_batch(batch)
+
+
+def _refresh_batch(products):
+    ids = [product['pk'] for product in products]
+    rows = [
+        ProductFacet(product_id=product['pk'], facet=facet, value=value)
+        for product in products
+        for facet, value in product_facets(product).items()
+    ]
+    rows += [
+        ProductFacet(product_id=product_id, facet=field_facet(field_id), value=value)
+        for product_id, field_id, value in ProductsFieldValue.objects.filter(
+            product_id__in=ids).values_list('product_id', 'field_id', 'value')
+    ]
+    with transaction.atomic():
+        ProductFacet.objects.filter(product_id__in=ids).delete()
+        ProductFacet.objects.bulk_create(rows)
+
+
+def price_bucket_expression():
+    """SQL twin of price_bucket()."""
+    bounds = settings.PRODUCT_FACET_PRICE_BUCKETS
+    return Case(
+        *(When(price__lt=high, then=Value(f'{low}-{high}')) for low, high in zip(bounds, bounds[1:])),
+        default=Value(f'{bounds[-1]}+'), output_field=CharField(),
+    )
+
+
+def refresh_price_facets(queryset):
+    """Recomputes the price and discount facets of `queryset` in two UPDATEs, after set-based repricing."""
+    products = Product.objects.filter(pk=OuterRef('product_id'))
+    rows = ProductFacet.objects.filter(product__in=queryset.order_by().values('pk'))
+    rows.filter(facet='price').update(
+        value=Subquery(products.annotate(bucket=price_bucket_expression()).values('bucket')[:1]))
+    rows.filter(facet='discount').update(value=Subquery(products.annotate(has_discount=Case(
+        When(discount__gt=0, then=Value('true')), default=Value('false'), output_field=CharField(),
+    )).values('has_discount')[:1]))
+
+
+def set_field_facet(product_id, field_id, value):
+    ProductFacet.objects.update_or_create(
+        product_id=product_id, facet=field_facet(field_id), defaults={'value': value}
+    )
+
+
+def remove_field_facet(product_id, field_id):
+    ProductFacet.objects.filter(product_id=product_id, facet=field_facet(field_id)).delete()
+
+
+def remove_brand_facets(brand_id):
+    # Brand deletion nulls Product.brand with a queryset update, which no post_save refresh sees
+    ProductFacet.objects.filter(facet='brand', value=str(brand_id)).delete()
+
+
+def compute_facets(queryset):
+    counts = (
+        ProductFacet.objects.filter(product__in=queryset.order_by().values('pk'))
+        .values_list('facet', 'value').annotate(count=Count('pk')).order_by('facet', '-count', 'value')
+    )
+    grouped = {}
+    for facet, value, count in counts:
+        grouped.setdefault(facet, []).append((value, count))
+
+    categories = dict(Category.objects.filter(
+        pk__in=[value for value, _ in grouped.get('category', [])]).values_list('pk', 'name'))
+    brands = dict(Brand.objects.filter(
+        pk__in=[value for value, _ in grouped.get('brand', [])]).values_list('pk', 'name'))
+    field_ids = [int(facet[len(FIELD_FACET_PREFIX):]) for facet in grouped if facet.startswith(FIELD_FACET_PREFIX)]
+    fields = ProductField.objects.filter(pk__in=field_ids).order_by('name')
+
+    bucket_order = {label: position for position, label in enumerate(price_buckets())}
+    return {
+        'category': [
+            {'value': int(value), 'label': categories.get(int(value)), 'count': count}
+            for value, count in grouped.get('category', [])
+        ],
+        'brand': [
+            {'value': int(value), 'label': brands.get(int(value)), 'count': count}
+            for value, count in grouped.get('brand', [])
+        ],
+        'price': [
+            {'value': value, 'count': count}
+            for value, count in sorted(grouped.get('price', []), key=lambda item: bucket_order.get(item[0], 0))
+        ],
+        'discount': [
+            {'value': value == 'true', 'count': count} for value, count in grouped.get('discount', [])
+        ],
+        'fields': [
+            {
+                'id': field.pk,
+                'name': field.name,
+                'values': [{'value': value, 'count': count} for value, count in grouped[field_facet(field.pk)]],
+            }
+            for field in fields
+        ],
+    }
+
+
+def rebuild_facets(batch_size=1000):
+    with transaction.atomic():
+        ProductFacet.objects.all().delete()
+        refresh_product_facets(Product.objects.all(), batch_size=batch_size)
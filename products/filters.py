@@ -1,5 +1,17 @@
+import math
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db.models.functions import Lower
+from django.db.models.lookups import GreaterThanOrEqual
 from django_filters import rest_framework as filters
-from .models import Product, Brand, Category, ProductImage, ProductField, ProductsFieldValue
+from rest_framework.exceptions import ValidationError
+from .models import (
+    Product, Brand, Category, ProductImage, ProductField, ProductFieldChoice, ProductsFieldValue, available_expression,
+)
+
+ATTRIBUTE_PARAM = re.compile(r'^attr\[(?P<name>[^\]]+)\](?:__(?P<lookup>gte|lte|gt|lt|in))?$')
+RANGE_LOOKUPS = ('gte', 'lte', 'gt', 'lt')
 
 
 class ProductFilter(filters.FilterSet):
@@ -7,8 +19,11 @@ class ProductFilter(filters.FilterSet):
     brand = filters.NumberFilter(field_name='brand__id', lookup_expr='exact')
     price_min = filters.NumberFilter(field_name='price', lookup_expr='gte')
     price_max = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    effective_price_min = filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    effective_price_max = filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
     stock_min = filters.NumberFilter(field_name='stock', lookup_expr='gte')
     stock_max = filters.NumberFilter(field_name='stock', lookup_expr='lte')
+    available_min = filters.NumberFilter(method='filter_available_min')
     discount = filters.BooleanFilter(field_name='discount', lookup_expr='gt', method='has_discount')
 
 
@@ -17,9 +32,60 @@ class ProductFilter(filters.FilterSet):
             return quertset.filter(discount__gt=0)
         return quertset
 
+    def filter_available_min(self, queryset, name, value):
+        # stock less what basket lines hold; an int bound (not the filter's Decimal, which SQLite compares
+        # as CAST(... AS NUMERIC)) lets it match product_available_idx
+        return queryset.filter(GreaterThanOrEqual(available_expression(), math.ceil(value)))
+
     class Meta:
         model = Product
-        fields = ['category', 'brand', 'price_min', 'price_max', 'stock_min', 'stock_max', 'discount']
+        fields = ['category', 'brand', 'price_min', 'price_max', 'effective_price_min', 'effective_price_max',
+                  'stock_min', 'stock_max', 'available_min', 'discount']
+
+    def filter_queryset(self, queryset):
+        return self.filter_attributes(super().filter_queryset(queryset))
+
+    def filter_attributes(self, queryset):
+        # attr[<field name>]=<value>, attr[<field name>]__in=<a>,<b>, attr[<number field>]__gte=<n> (also lte/gt/lt)
+        conditions = [
+            (param, match['name'], match['lookup'] or 'exact', value)
+            for param, value in self.data.items() if (match := ATTRIBUTE_PARAM.match(param))
+        ]
+        if not conditions:
+            return queryset
+        fields = {}
+        for field in ProductField.objects.annotate(lower_name=Lower('name')).filter(
+                lower_name__in=[name.lower() for _, name, _, _ in conditions]).order_by('pk'):
+            fields.setdefault(field.lower_name, field)
+
+        for param, name, lookup, value in conditions:
+            field = fields.get(name.lower())
+            if field is None:
+                raise ValidationError({param: f"Unknown attribute '{name}'."})
+            values = self.attribute_values(param, field, lookup, value)
+            queryset = queryset.filter(pk__in=values.values('product_id'))
+        return queryset
+
+    def attribute_values(self, param, field, lookup, value):
+        values = ProductsFieldValue.objects.filter(field=field)
+        raw_values = [item.strip() for item in value.split(',')] if lookup == 'in' else [value.strip()]
+        if field.field_type == 'number':
+            try:
+                numbers = [Decimal(item) for item in raw_values]
+            except InvalidOperation:
+                raise ValidationError({param: f"'{value}' is not a number."})
+            if not all(number.is_finite() for number in numbers):
+                raise ValidationError({param: f"'{value}' is not a number."})
+            if lookup in RANGE_LOOKUPS:
+                return values.filter(**{f'number_value__{lookup}': numbers[0]})
+            return values.filter(number_value__in=numbers)
+        if lookup in RANGE_LOOKUPS:
+            raise ValidationError({param: "Range lookups are only supported for number attributes."})
+        if field.field_type == 'choice':
+            options = ProductFieldChoice.objects.annotate(lower_value=Lower('value')).filter(
+                field=field, lower_value__in=[item.lower() for item in raw_values])
+            return values.filter(choice__in=options)
+        return values.filter(value__in=raw_values)
 
 
 class CategoryFilter(filters.FilterSet):
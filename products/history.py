@@ -0,0 +1,96 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection
+from django.db.models import Count, DateField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import DailyPrice, PriceHistory, Product
+
+
+def record_prices(queryset, recorded_at=None):
+    """
+    Appends the current price, discount and effective price of every product in `queryset` to
+    PriceHistory with one INSERT ... SELECT, then refreshes their DailyPrice row for the day.
+    """
+    recorded_at = recorded_at or timezone.now()
+    ids_sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {PriceHistory._meta.db_table} (product_id, price, discount, effective_price, recorded_at) "
+            f"SELECT id, price, discount, effective_price, %s FROM {Product._meta.db_table} WHERE id IN ({ids_sql})",
+            [connection.ops.adapt_datetimefield_value(recorded_at), *params],
+        )
+    rollup_day(queryset, timezone.localdate(recorded_at))
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(queryset, day):
+    """
+    Recomputes the DailyPrice rows of `queryset` for `day` from the raw history. The open is the price
+    in effect when the day started (the first change of the day for new products), so a chart can
+    draw each day as a candle without reading earlier rows.
+    """
+    start, end = day_bounds(day)
+    history = PriceHistory.objects.filter(product=OuterRef('product'))
+    same_day = history.filter(recorded_at__gte=start, recorded_at__lt=end)
+    opening = Coalesce(
+        Subquery(history.filter(recorded_at__lt=start).order_by('-recorded_at', '-pk').values('effective_price')[:1]),
+        Subquery(same_day.order_by('recorded_at', 'pk').values('effective_price')[:1]),
+    )
+    rows = (
+        PriceHistory.objects.filter(product__in=queryset.order_by().values('pk'), recorded_at__gte=start, recorded_at__lt=end)
+        .values('product').order_by()
+        .annotate(
+            day=Value(day, output_field=DateField()),
+            open=opening,
+            high=Greatest(Max('effective_price'), opening),
+            low=Least(Min('effective_price'), opening),
+            close=Subquery(same_day.order_by('-recorded_at', '-pk').values('effective_price')[:1]),
+            changes=Count('pk'),
+        )
+    )
+    rows_sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        # `WHERE true` keeps SQLite from reading ON CONFLICT as a join constraint of the SELECT
+        cursor.execute(
+            f"INSERT INTO {DailyPrice._meta.db_table} (product_id, day, open, high, low, close, changes) "
+            f"SELECT * FROM ({rows_sql}) WHERE true "
+            f"ON CONFLICT (product_id, day) DO UPDATE SET open = excluded.open, high = excluded.high, "
+            f"low = excluded.low, close = excluded.close, changes = excluded.changes",
+            params,
+        )
+
+
+def parse_day(value):
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def parse_moment(value):
+    """Aware datetime for an ISO 8601 datetime, or the end of the day for a date; None if invalid."""
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is None:
+        day = parse_day(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, time.max)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def price_at(product_id, at):
+    """The PriceHistory row in effect for the product at `at`, or None before its first recorded price."""
+    return (
+        PriceHistory.objects.filter(product_id=product_id, recorded_at__lte=at)
+        .order_by('-recorded_at', '-pk').first()
+    )
@@ -0,0 +1,105 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config.api.cache import bump_catalog_version
+
+from .models import Brand, ProductImage
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PRODUCT_IMAGE_WORKERS,
+                                           thread_name_prefix='product-images')
+    return _executor
+
+
+def variant_name(name, variant):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}-{variant}.{settings.PRODUCT_IMAGE_FORMAT.lower()}')
+
+
+def render_variants(field_file):
+    """Writes every PRODUCT_IMAGE_VARIANTS size of `field_file`; returns (width, height, variants)."""
+    with field_file.open('rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    width, height = image.size
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    variants = {}
+    for variant, edge in settings.PRODUCT_IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, settings.PRODUCT_IMAGE_FORMAT, quality=settings.PRODUCT_IMAGE_QUALITY)
+        name = variant_name(field_file.name, variant)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        variants[variant] = {'name': name, 'width': resized.width, 'height': resized.height}
+    return width, height, variants
+
+
+def process_product_image(pk):
+    image = ProductImage.objects.filter(pk=pk).first()
+    if image is None or not image.image:
+        return False
+    try:
+        width, height, variants = render_variants(image.image)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning("Could not process product image %s (%s): %s", pk, image.image.name, exc)
+        return False
+    # update() rather than save() so the pipeline does not schedule itself again
+    ProductImage.objects.filter(pk=pk, image=image.image.name).update(width=width, height=height, variants=variants)
+    bump_catalog_version()
+    return True
+
+
+def process_brand_logo(pk):
+    brand = Brand.objects.filter(pk=pk).first()
+    if brand is None or not brand.logo:
+        return False
+    try:
+        _, _, variants = render_variants(brand.logo)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as exc:
+        logger.warning("Could not process logo of brand %s (%s): %s", pk, brand.logo.name, exc)
+        return False
+    Brand.objects.filter(pk=pk, logo=brand.logo.name).update(logo_variants=variants)
+    bump_catalog_version()
+    return True
+
+
+def run_in_worker(func, pk):
+    try:
+        return func(pk)
+    except Exception:
+        logger.exception("Image pipeline job %s(%s) failed", func.__name__, pk)
+        return False
+    finally:
+        # worker threads get their own connections; don't leave them open between jobs
+        connections.close_all()
+
+
+def schedule(func, pk):
+    """Runs `func(pk)` on the worker pool once the current transaction commits."""
+    if settings.PRODUCT_IMAGE_WORKERS:
+        transaction.on_commit(lambda: executor().submit(run_in_worker, func, pk))
+    else:
+        transaction.on_commit(lambda: func(pk))
@@ -0,0 +1,243 @@
+import csv
+import json
+import re
+from decimal import Decimal, InvalidOperation
+from time import perf_counter
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+from config.api.cache import bump_catalog_version
+
+from . import facets, history
+from .models import Brand, Category, Product, ProductField, ProductsFieldValue, effective_price_for
+from .search import get_search_backend
+
+FORMATS = ('csv', 'jsonl')
+ATTRIBUTE_COLUMN = re.compile(r'^attr\[(?P<name>[^\]]+)\]$')
+PRODUCT_UPDATE_FIELDS = ['category', 'brand', 'description', 'price', 'stock', 'discount', 'effective_price', 'updated']
+MAX_PRICE = Decimal('999999999999.99')
+
+
+def read_rows(stream, format):
+    """
+    Yields (line number, row dict or error message). CSV rows carry attributes as `attr[<field name>]`
+    columns, JSONL rows as an `attributes` object.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            attributes = {}
+            for column in list(row):
+                match = ATTRIBUTE_COLUMN.match(column or '')
+                if match:
+                    value = row.pop(column)
+                    if value not in (None, ''):
+                        attributes[match['name']] = value
+            row['attributes'] = attributes
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, f"Invalid JSON: {exc}"
+                continue
+            yield line_number, row if isinstance(row, dict) else "Expected a JSON object."
+    else:
+        raise ValueError(f"Unsupported import format '{format}', expected one of {', '.join(FORMATS)}.")
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0
+
+    def as_dict(self, max_errors=100):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': len(self.errors),
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+            'errors': self.errors[:max_errors],
+        }
+
+
+class CatalogImporter:
+    """
+    Upserts products (matched by name) and their field values from a stream of rows, one chunk at a time.
+    Categories, brands, fields and choice options are resolved from in-memory maps, invalid rows are
+    reported and skipped, and search/facet indexes are refreshed per chunk with a single cache bump at the end.
+    """
+
+    def __init__(self, chunk_size=1000, create_missing=False, user=None):
+        self.chunk_size = chunk_size
+        self.create_missing = create_missing
+        self.user = user
+        self.categories = {name.lower(): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        self.brands = {name.lower(): pk for pk, name in Brand.objects.values_list('pk', 'name')}
+        self.fields = {}
+        for field in ProductField.objects.prefetch_related('options').order_by('pk'):
+            self.fields.setdefault(field.name.lower(), field)
+        self.options = {
+            field.pk: {option.value.lower(): option for option in field.options.all()}
+            for field in self.fields.values()
+        }
+
+    def run(self, rows):
+        result = ImportResult()
+        started = perf_counter()
+        chunk = []
+        for line_number, row in rows:
+            result.rows += 1
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                self.import_chunk(chunk, result)
+                chunk = []
+        if chunk:
+            self.import_chunk(chunk, result)
+        if result.created or result.updated:
+            bump_catalog_version()
+        result.elapsed = perf_counter() - started
+        return result
+
+    def import_chunk(self, chunk, result):
+        products = {}
+        for line_number, row in chunk:
+            if isinstance(row, str):
+                result.errors.append({'line': line_number, 'errors': [row]})
+                continue
+            try:
+                name, values, attributes = self.clean(row)
+            except ValidationError as exc:
+                result.errors.append({'line': line_number, 'name': row.get('name'), 'errors': exc.messages})
+                continue
+            # a name repeated inside one chunk keeps its last row
+            products[name] = (line_number, values, attributes)
+        if not products:
+            return
+        try:
+            with transaction.atomic():
+                created, updated = self.save_chunk(products)
+        except DatabaseError as exc:
+            result.errors.extend({'line': line_number, 'name': name, 'errors': [str(exc)]}
+                                 for name, (line_number, _, _) in products.items())
+            return
+        result.created += created
+        result.updated += updated
+
+    def clean(self, row):
+        errors = []
+        name = str(row.get('name') or '').strip()
+        if not name:
+            errors.append("name is required.")
+        elif len(name) > 255:
+            errors.append("name is longer than 255 characters.")
+
+        values = {'description': str(row.get('description') or '')}
+        values['category_id'] = self.resolve(row.get('category'), self.categories, Category, errors, required=True)
+        values['brand_id'] = self.resolve(row.get('brand'), self.brands, Brand, errors, required=False)
+        try:
+            values['price'] = Decimal(str(row.get('price', '')).strip())
+            if not values['price'].is_finite() or not 0 <= values['price'] <= MAX_PRICE:
+                raise InvalidOperation
+            values['price'] = values['price'].quantize(Decimal('0.01'))
+        except InvalidOperation:
+            errors.append(f"price '{row.get('price')}' is not a valid non-negative amount.")
+        for column, default, maximum in (('stock', 0, 2147483647), ('discount', 0, 90)):
+            raw = row.get(column)
+            try:
+                values[column] = default if raw in (None, '') else int(raw)
+                if not 0 <= values[column] <= maximum:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append(f"{column} '{raw}' must be a whole number between 0 and {maximum}.")
+
+        attributes = []
+        raw_attributes = row.get('attributes') or {}
+        if not isinstance(raw_attributes, dict):
+            errors.append("attributes must be an object of field name to value.")
+            raw_attributes = {}
+        for field_name, value in raw_attributes.items():
+            field = self.fields.get(str(field_name).strip().lower())
+            if field is None:
+                errors.append(f"Unknown attribute '{field_name}'.")
+                continue
+            value = str(value).strip()
+            try:
+                typed = field.parse_value(value, options=self.options[field.pk])
+            except ValidationError as exc:
+                errors.extend(exc.messages)
+                continue
+            attributes.append((field, value, typed))
+
+        if errors:
+            raise ValidationError(errors)
+        # bulk_create skips Product.save()
+        values['effective_price'] = effective_price_for(values['price'], values['discount'])
+        return name, values, attributes
+
+    def resolve(self, value, lookup, model, errors, required):
+        name = str(value or '').strip()
+        if not name:
+            if required:
+                errors.append(f"{model._meta.model_name} is required.")
+            return None
+        if name.lower() not in lookup:
+            if not self.create_missing:
+                errors.append(f"Unknown {model._meta.model_name} '{name}'.")
+                return None
+            defaults = {'created_by': self.user}
+            if model is Brand:
+                defaults['description'] = ''
+            instance, _ = model.objects.get_or_create(name=name, defaults=defaults)
+            lookup[name.lower()] = instance.pk
+        return lookup[name.lower()]
+
+    def save_chunk(self, products):
+        existing = {
+            name: (price, discount)
+            for name, price, discount in Product.objects.filter(name__in=list(products)).values_list('name', 'price', 'discount')
+        }
+        # one INSERT ... ON CONFLICT (name) DO UPDATE per batch; far cheaper than bulk_update's CASE per column
+        Product.objects.bulk_create(
+            [Product(name=name, created_by=self.user, **values) for name, (_, values, _) in products.items()],
+            batch_size=self.chunk_size, update_conflicts=True, unique_fields=['name'],
+            update_fields=PRODUCT_UPDATE_FIELDS,
+        )
+        ids = dict(Product.objects.filter(name__in=list(products)).values_list('name', 'pk'))
+        self.save_field_values(ids, products)
+
+        queryset = Product.objects.filter(pk__in=list(ids.values()))
+        get_search_backend().index(queryset)
+        facets.refresh_product_facets(queryset, batch_size=self.chunk_size)
+        repriced = [
+            ids[name] for name, (_, values, _) in products.items()
+            if existing.get(name) != (values['price'], values['discount'])
+        ]
+        if repriced:
+            history.record_prices(Product.objects.filter(pk__in=repriced))
+        return len(products) - len(existing), len(existing)
+
+    def save_field_values(self, ids, products):
+        field_values = [
+            # bulk writes skip ProductsFieldValue.save(), so the typed columns are set here
+            ProductsFieldValue(product_id=ids[name], field=field, value=value,
+                               number_value=typed['number_value'], choice=typed['choice'])
+            for name, (_, _, attributes) in products.items()
+            for field, value, typed in attributes
+        ]
+        ProductsFieldValue.objects.bulk_create(
+            field_values, batch_size=self.chunk_size, update_conflicts=True,
+            unique_fields=['product', 'field'], update_fields=['value', 'number_value', 'choice'],
+        )
@@ -0,0 +1,52 @@
+import io
+from time import perf_counter
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from products.models import Product
+from config.api.renderers import FastJSONParser, FastJSONRenderer, orjson
+from products.serializers import ProductListSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare render and parse throughput of DRF's JSON renderer/parser and the fast ones on a products list payload."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help="Products in the payload.")
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--host', default='localhost', help="Host used for absolute media URLs.")
+
+    def handle(self, *args, rows, repeat, host, **options):
+        request = Request(RequestFactory(SERVER_NAME=host).get('/'))
+        request.user = AnonymousUser()
+        products = Product.objects.with_list_relations().order_by('-pk')[:rows]
+        data = {'next': None, 'previous': None,
+                'results': ProductListSerializer(products, many=True, context={'request': request}).data}
+        content = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != content:
+            self.stderr.write("Rendered output differs from JSONRenderer.")
+        self.stdout.write(f"Payload: {len(data['results'])} products, {len(content) / 1024:.0f} KiB, "
+                          f"orjson {'installed' if orjson else 'missing (fallback)'}")
+
+        for label, regular, fast in (
+            ('render', lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(data)),
+            ('parse', lambda: JSONParser().parse(io.BytesIO(content)),
+             lambda: FastJSONParser().parse(io.BytesIO(content))),
+        ):
+            regular_time, fast_time = self.measure(regular, repeat), self.measure(fast, repeat)
+            self.stdout.write(
+                f"{label:>8}: JSONRenderer/Parser {regular_time * 1000:8.3f} ms   fast {fast_time * 1000:8.3f} ms   "
+                f"({regular_time / fast_time:.1f}x)"
+            )
+
+    def measure(self, func, repeat):
+        func()
+        started = perf_counter()
+        for _ in range(repeat):
+            func()
+        return (perf_counter() - started) / repeat
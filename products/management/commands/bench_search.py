@@ -0,0 +1,91 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from products.models import Brand, Category, Product
+from products.search import get_search_backend
+
+COMMON_WORDS = (
+    "phone laptop tablet camera lens charger cable speaker headphones watch monitor keyboard mouse "
+    "router drone console printer scanner battery adapter case stand light projector microphone "
+    "wireless portable smart ultra pro mini max compact premium classic gaming studio travel"
+).split()
+
+
+def make_vocabulary(rng, size):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return COMMON_WORDS + [''.join(rng.choices(letters, k=rng.randint(5, 9))) for _ in range(size)]
+
+
+class Rollback(Exception):
+    pass
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ("Compare search latency (p50/p99) of the indexed search backend against the old "
+            "name/description icontains filter on a synthetic catalog. All data is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, products, queries, batch_size, vocabulary, seed, **options):
+        rng = random.Random(seed)
+        self.words = make_vocabulary(rng, vocabulary)
+        try:
+            with transaction.atomic():
+                self.populate(rng, products, batch_size)
+                terms = [rng.choice(self.words)[:rng.randint(3, 6)] for _ in range(queries)]
+                self.report("icontains", [self.time_icontains(term) for term in terms])
+                self.report("indexed", [self.time_indexed(term) for term in terms])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def populate(self, rng, count, batch_size):
+        category = Category.objects.create(name="bench-search-category")
+        brand = Brand.objects.create(name="bench-search-brand", description="")
+        started = perf_counter()
+        for offset in range(0, count, batch_size):
+            Product.objects.bulk_create([
+                Product(
+                    name=f"bench {i} {' '.join(rng.choices(self.words, k=3))}",
+                    description=' '.join(rng.choices(self.words, k=20)),
+                    category=category, brand=brand, price=rng.randint(1, 5000),
+                )
+                for i in range(offset, min(offset + batch_size, count))
+            ], batch_size=batch_size)
+        self.stdout.write(f"Inserted {count} products in {perf_counter() - started:.1f}s")
+
+        started = perf_counter()
+        get_search_backend().rebuild()
+        self.stdout.write(f"Built search index in {perf_counter() - started:.1f}s")
+
+    def time_icontains(self, term):
+        queryset = Product.objects.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        started = perf_counter()
+        list(queryset.order_by('-created')[:10])
+        return perf_counter() - started
+
+    def time_indexed(self, term):
+        queryset = get_search_backend().search(Product.objects.all(), term)
+        started = perf_counter()
+        list(queryset.order_by('search_rank')[:10])
+        return perf_counter() - started
+
+    def report(self, label, samples):
+        self.stdout.write(
+            f"{label:>10}: p50 {percentile(samples, 0.5) * 1000:8.2f} ms   "
+            f"p99 {percentile(samples, 0.99) * 1000:8.2f} ms"
+        )
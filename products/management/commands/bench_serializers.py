@@ -0,0 +1,65 @@
+from time import perf_counter
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from orders.models import Order
+from orders.serializers import CompiledOrderSerializer, OrderSerializer
+from products.models import Product
+from products.serializers import CompiledProductListSerializer, ProductListSerializer
+from reviews.models import Review
+from reviews.serializers import CompiledReviewSerializer, ReviewSerializer
+
+ENDPOINTS = {
+    'products': (
+        lambda: Product.objects.with_list_relations(), ProductListSerializer, CompiledProductListSerializer),
+    'orders': (lambda: Order.objects.prefetch_related('items'), OrderSerializer, CompiledOrderSerializer),
+    'reviews': (lambda: Review.objects.select_related('user'), ReviewSerializer, CompiledReviewSerializer),
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare rows/second of the regular list serializers against their compiled values() twins "
+            "on the existing data, queries included.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=ENDPOINTS, action='append')
+        parser.add_argument('--rows', type=int, default=100, help="Rows per page.")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--fields', help="Optional ?fields= value, e.g. id,name,category.name")
+        parser.add_argument('--host', default='localhost', help="Host used for absolute media URLs.")
+
+    def handle(self, *args, endpoint, rows, repeat, fields, host, **options):
+        params = {'fields': fields} if fields else {}
+        request = Request(RequestFactory(SERVER_NAME=host).get('/', params))
+        request.user = AnonymousUser()
+        context = {'request': request}
+        for name in endpoint or ENDPOINTS:
+            get_queryset, serializer_class, compiled_class = ENDPOINTS[name]
+            regular = self.measure(
+                lambda: serializer_class(get_queryset().order_by('-pk')[:rows], many=True, context=context).data,
+                repeat)
+            regular_rows = regular[0]
+
+            def compiled_page():
+                compiled = compiled_class(context)
+                return compiled.serialize(compiled.rows(get_queryset().order_by('-pk'))[:rows])
+
+            compiled = self.measure(compiled_page, repeat)
+            if not regular_rows:
+                self.stdout.write(f"{name:>10}: no rows to serialize")
+                continue
+            self.stdout.write(
+                f"{name:>10}: regular {regular[1]:10.0f} rows/s   compiled {compiled[1]:10.0f} rows/s   "
+                f"({compiled[1] / regular[1]:.1f}x)"
+            )
+
+    def measure(self, page, repeat):
+        count = len(page())  # warm-up
+        started = perf_counter()
+        for _ in range(repeat):
+            page()
+        elapsed = perf_counter() - started
+        return count, count * repeat / elapsed if elapsed else 0
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.exports import EXPORT_FORMATS, product_export
+from products.filters import ProductFilter
+from products.models import Product
+
+
+def parse_filters(pairs):
+    filters = {}
+    for pair in pairs:
+        name, separator, value = pair.partition('=')
+        if not separator:
+            raise CommandError(f"Filters are given as name=value, got '{pair}'.")
+        filters[name] = value
+    return filters
+
+
+class Command(BaseCommand):
+    help = "Stream every product (optionally filtered with the /api/products/ filters) as CSV, JSONL or columnar JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help="File to write; defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+                            help="ProductFilter parameter, e.g. --filter category=3 --filter attr[Color]=red")
+
+    def handle(self, *args, format, output, chunk_size, filter, **options):
+        filterset = ProductFilter(data=parse_filters(filter), queryset=Product.objects.order_by('pk'))
+        if not filterset.is_valid():
+            raise CommandError(filterset.errors.as_text())
+        write_export(product_export(filterset.qs, format, chunk_size), output, self.stdout)
+
+
+def write_export(stream, output, stdout):
+    if not output:
+        for piece in stream:
+            stdout.write(piece, ending='')
+        return
+    with open(output, 'w', newline='', encoding='utf-8') as target:
+        for piece in stream:
+            target.write(piece)
@@ -0,0 +1,43 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importers import FORMATS, CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Bulk upsert products (matched by name) and their attribute values from a CSV or JSONL feed. "
+            "Invalid rows are reported and skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--create-missing', action='store_true',
+                            help="Create unknown categories and brands instead of rejecting their rows.")
+        parser.add_argument('--user', help="Email of the user recorded as creator of new products.")
+        parser.add_argument('--max-errors', type=int, default=20, help="Number of row errors to print.")
+
+    def handle(self, *args, path, format, chunk_size, create_missing, user, max_errors, **options):
+        format = format or os.path.splitext(path)[1].lstrip('.').lower()
+        if format not in FORMATS:
+            raise CommandError(f"Cannot infer the format of {path}; pass --format {'/'.join(FORMATS)}.")
+        if user:
+            try:
+                user = get_user_model().objects.get(email=user)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with email {user}.")
+
+        importer = CatalogImporter(chunk_size=chunk_size, create_missing=create_missing, user=user)
+        with open(path, newline='', encoding='utf-8') as stream:
+            result = importer.run(read_rows(stream, format))
+
+        for error in result.errors[:max_errors]:
+            self.stderr.write(f"line {error['line']}: {' '.join(error['errors'])}")
+        if len(result.errors) > max_errors:
+            self.stderr.write(f"... and {len(result.errors) - max_errors} more errors")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.rows} rows in {result.elapsed:.2f}s ({result.rows_per_second} rows/s): "
+            f"{result.created} created, {result.updated} updated, {len(result.errors)} failed."
+        ))
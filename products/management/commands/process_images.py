@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.images import process_brand_logo, process_product_image, run_in_worker
+from products.models import Brand, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants of existing product images and brand logos in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PRODUCT_IMAGE_WORKERS,
+                            help="Size of the thread pool; 0 processes everything in this thread.")
+        parser.add_argument('--all', action='store_true', help="Reprocess images that already have variants.")
+
+    def handle(self, *args, workers, all, **options):
+        images = ProductImage.objects.exclude(image='')
+        brands = Brand.objects.exclude(logo='')
+        if not all:
+            images = images.filter(variants={})
+            brands = brands.filter(logo_variants={})
+        jobs = [(process_product_image, pk) for pk in images.values_list('pk', flat=True).iterator()]
+        jobs += [(process_brand_logo, pk) for pk in brands.values_list('pk', flat=True).iterator()]
+
+        started = perf_counter()
+        if workers:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(lambda job: run_in_worker(*job), jobs))
+        else:
+            results = [func(pk) for func, pk in jobs]
+        processed = sum(results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {processed} of {len(jobs)} images with {workers} workers "
+            f"in {perf_counter() - started:.2f}s ({len(jobs) - processed} failed)."
+        ))
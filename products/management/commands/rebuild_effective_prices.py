@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from config.api.cache import bump_catalog_version
+from products.models import Product, effective_price_expression
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored effective (discounted) price of every product in one UPDATE."
+
+    def handle(self, *args, **options):
+        updated = Product.objects.update(effective_price=effective_price_expression())
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt effective prices for {updated} products."))
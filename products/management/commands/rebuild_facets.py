@@ -0,0 +1,20 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from products.facets import rebuild_facets
+from products.models import ProductFacet
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed product facet index."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        started = perf_counter()
+        rebuild_facets(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {ProductFacet.objects.count()} facet rows in {perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating aggregates of every product from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        histogram = {
+            f'rating_{value}': Count('reviews', filter=Q(reviews__value=value))
+            for value in Product.RATING_VALUES
+        }
+        queryset = Product.objects.order_by('pk').annotate(
+            rated=Count('reviews', filter=Q(reviews__value__isnull=False)),
+            rated_sum=Sum('reviews__value'),
+            **{f'{name}_total': aggregate for name, aggregate in histogram.items()},
+        )
+        fields = ['rating_count', 'rating_sum', 'rating_average', *histogram]
+
+        updated = 0
+        batch = []
+        with transaction.atomic():
+            for product in queryset.iterator(chunk_size=batch_size):
+                product.rating_count = product.rated
+                product.rating_sum = product.rated_sum or 0
+                product.rating_average = product.rating_sum / product.rating_count if product.rating_count else 0
+                for name in histogram:
+                    setattr(product, name, getattr(product, f'{name}_total'))
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    Product.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {updated} products."))
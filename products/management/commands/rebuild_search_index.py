@@ -0,0 +1,21 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = perf_counter()
+        with transaction.atomic():
+            backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {Product.objects.count()} products with {type(backend).__name__} "
+            f"in {perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,46 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import ProductField, ProductsFieldValue
+
+
+class Command(BaseCommand):
+    help = "Sync ProductField choice options and refill the typed columns of every ProductsFieldValue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        updated = invalid = 0
+        with transaction.atomic():
+            fields = {field.pk: field for field in ProductField.objects.all()}
+            for field in fields.values():
+                field.sync_options()
+            options_by_field = {
+                field_id: {option.value.lower(): option for option in field.options.all()}
+                for field_id, field in fields.items()
+            }
+
+            batch = []
+            for field_value in ProductsFieldValue.objects.order_by('pk').iterator(chunk_size=batch_size):
+                field = fields[field_value.field_id]
+                field_value.number_value = field_value.choice = None
+                try:
+                    if field.field_type == 'choice':
+                        field_value.choice = options_by_field[field.pk][field_value.value.strip().lower()]
+                    else:
+                        field_value.number_value = field.parse_value(field_value.value)['number_value']
+                except (KeyError, ValidationError):
+                    invalid += 1
+                    self.stderr.write(f"Invalid value {field_value.value!r} for {field.name} (id={field_value.pk})")
+                batch.append(field_value)
+                if len(batch) >= batch_size:
+                    ProductsFieldValue.objects.bulk_update(batch, ['number_value', 'choice'])
+                    updated += len(batch)
+                    batch = []
+            if batch:
+                ProductsFieldValue.objects.bulk_update(batch, ['number_value', 'choice'])
+                updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} attribute values ({invalid} invalid)."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products.history import record_prices
+from products.models import PriceHistory, Product
+
+
+class Command(BaseCommand):
+    help = ("Record the current price of every product (or only of products without any history) in the "
+            "price history, e.g. to seed it for an existing catalog.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help="Only products that have no history yet.")
+
+    def handle(self, *args, missing, **options):
+        products = Product.objects.all()
+        if missing:
+            products = products.exclude(pk__in=PriceHistory.objects.values('product_id'))
+        count = products.count()
+        record_prices(products)
+        self.stdout.write(self.style.SUCCESS(f"Recorded prices of {count} products."))
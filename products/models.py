@@ -1,8 +1,14 @@
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 
 from django.db import models
+from django.db.models import F, Prefetch, Value
+from django.db.models.functions import Cast, Mod, Round
+from django.db.models.lookups import Exact, GreaterThan
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
+from config.api.cache import bump_stock_versions_on_commit
 User = get_user_model()
 
 class Category(models.Model):
@@ -20,6 +26,7 @@ class Brand(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField()
     logo = models.ImageField(upload_to='images/brand-logos')
+    logo_variants = models.JSONField(default=dict, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_brands')
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -33,6 +40,10 @@ class ProductImage(models.Model):
     image = models.FileField(upload_to='images/product-images/')
     alt_text = models.TextField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False)
+    # filled in the background by products.images: source dimensions and {variant: {name, width, height}}
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"Image for {self.product.name}"
@@ -46,18 +57,160 @@ class ProductField(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def choice_list(self):
+        return [choice.strip() for choice in (self.choices or '').split(',') if choice.strip()]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.sync_options()
+
+    def sync_options(self):
+        choices = self.choice_list if self.field_type == 'choice' else []
+        self.options.exclude(value__in=choices).delete()
+        ProductFieldChoice.objects.bulk_create(
+            [ProductFieldChoice(field=self, value=choice) for choice in choices], ignore_conflicts=True
+        )
+
+    def parse_value(self, value, options=None):
+        """
+        Typed columns of a ProductsFieldValue holding `value`; raises ValidationError for invalid values.
+        `options` ({lowercased value: ProductFieldChoice}) skips the option query for bulk callers.
+        """
+        if self.field_type == 'number':
+            try:
+                number = Decimal(str(value).strip())
+            except InvalidOperation:
+                raise ValidationError(f"'{value}' is not a valid number for {self.name}.")
+            if not number.is_finite() or abs(number) >= 10 ** 14:
+                raise ValidationError(f"'{value}' is not a valid number for {self.name}.")
+            return {'number_value': number, 'choice': None}
+        if self.field_type == 'choice':
+            if options is None:
+                option = self.options.filter(value__iexact=str(value).strip()).first()
+            else:
+                option = options.get(str(value).strip().lower())
+            if option is None:
+                raise ValidationError(f"'{value}' is not one of the choices for {self.name}: {self.choices}.")
+            return {'number_value': None, 'choice': option}
+        return {'number_value': None, 'choice': None}
+
+
+class ProductFieldChoice(models.Model):
+    field = models.ForeignKey(ProductField, on_delete=models.CASCADE, related_name='options')
+    value = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.field.name}: {self.value}"
+
+    class Meta:
+        unique_together = ('field', 'value')
+
 
 class ProductsFieldValue(models.Model):
     product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='field_values')
     field = models.ForeignKey(ProductField, on_delete=models.CASCADE, related_name='values')
     value = models.CharField(max_length=255)
+    # typed copies of `value`, filled from field.parse_value() on save
+    number_value = models.DecimalField(max_digits=20, decimal_places=6, null=True, blank=True)
+    choice = models.ForeignKey(ProductFieldChoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='values')
 
     def __str__(self):
         return f"{self.product.name} - {self.field.name}: {self.value}"
 
+    def save(self, *args, **kwargs):
+        for name, typed_value in self.field.parse_value(self.value).items():
+            setattr(self, name, typed_value)
+        super().save(*args, **kwargs)
+
     class Meta:
         unique_together = ('product', 'field')
-
+        indexes = [
+            models.Index(fields=['field', 'number_value']),
+            models.Index(fields=['field', 'choice']),
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_list_relations(self, expand=(), skip=()):
+        # `skip` names relations the response leaves out (created_by, category, brand, primary_image)
+        queryset = self
+        if 'created_by' not in skip:
+            queryset = queryset.select_related('created_by')
+        if 'category' not in skip:
+            queryset = queryset.prefetch_related(
+                Prefetch('category', queryset=Category.objects.annotate(product_count=models.Count('products'))))
+        if 'brand' not in skip:
+            queryset = queryset.prefetch_related(
+                Prefetch('brand', queryset=Brand.objects.annotate(product_count=models.Count('products'))))
+        if 'primary_image' not in skip:
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=ProductImage.objects.filter(is_primary=True), to_attr='primary_images'))
+        if 'category.products' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('category__products', queryset=Product.objects.only('id', 'category_id')))
+        if 'brand.products' in expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('brand__products', queryset=Product.objects.only('id', 'brand_id')))
+        return queryset
+
+    def reserve(self, pk, quantity):
+        """
+        Holds `quantity` of product `pk` for a basket in one conditional UPDATE (stock - reserved >= quantity),
+        so concurrent buyers can never oversell it. False when not enough stock is available.
+        """
+        return self.stock_moved(pk, self.filter(pk=pk, stock__gte=F('reserved') + quantity).update(
+            reserved=F('reserved') + quantity, updated=timezone.now()))
+
+    def release(self, pk, quantity):
+        """Returns `quantity` held for a basket to the available stock of product `pk`."""
+        return self.stock_moved(pk, self.filter(pk=pk).update(reserved=F('reserved') - quantity, updated=timezone.now()))
+
+    def restock(self, pk, quantity):
+        """Puts `quantity` sold units back on hand, e.g. for a cancelled order."""
+        return self.stock_moved(pk, self.filter(pk=pk).update(stock=F('stock') + quantity, updated=timezone.now()))
+
+    def stock_moved(self, pk, updated):
+        if updated:
+            bump_stock_versions_on_commit([pk])
+        return updated == 1
+
+    def with_detail_relations(self, skip=()):
+        queryset = self if 'created_by' in skip else self.select_related('created_by')
+        return queryset.prefetch_related(*(name for name in ('field_values', 'images') if name not in skip))
+
+
+def available_expression():
+    """Units new basket holds can take: on hand minus held. Matches the product_available index."""
+    return F('stock') - F('reserved')
+
+
+def effective_price_for(price, discount):
+    """Price after `discount` percent, rounded half up to cents."""
+    return (Decimal(str(price)) * (100 - int(discount)) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def effective_price_expression(price=F('price'), discount=F('discount')):
+    """SQL twin of effective_price_for(), for bulk writes; computed in integer cents so it rounds the same."""
+    cents = Cast(Round(price * 100), models.BigIntegerField())
+    discounted_cents = (cents * (Value(100) - discount) + Value(50)) / Value(100)
+    return models.ExpressionWrapper(
+        discounted_cents * Value(Decimal('0.01')), output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+
+def discounted_price_expression(price=F('price'), discount=F('discount')):
+    """SQL twin of Product.discounted_price: price after discount rounded to a whole number, half to even like round()."""
+    cents = Cast(Round(price * 100), models.BigIntegerField())
+    # the discounted price in 1/10000ths, exact, so it is rounded only once
+    scaled = cents * (Value(100) - discount)
+    whole = scaled / Value(10000)
+    remainder = scaled - whole * Value(10000)
+    round_up = models.Case(
+        models.When(GreaterThan(remainder, 5000), then=Value(1)),
+        models.When(models.Q(Exact(remainder, 5000)) & models.Q(Exact(Mod(whole, 2), 1)), then=Value(1)),
+        default=Value(0),
+    )
+    return models.ExpressionWrapper(whole + round_up, output_field=models.BigIntegerField())
 
 
 class Product(models.Model):
@@ -67,31 +220,152 @@ class Product(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='created_products')
     description = models.TextField()
     price = models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(Decimal(0))])
+    # units on hand, set outright by the catalog import and owner edits, taken off by checkouts
     stock = models.PositiveIntegerField(default=0)
+    # units of `stock` held by basket lines (carts), maintained by reserve() / release() and the hold sweeper
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     discount = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(90), MinValueValidator(0)])
+    # price after discount, kept in sync by save() and by the bulk writers through effective_price_expression()
+    effective_price = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True, editable=False)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    # rating aggregates, maintained by reviews.signals and rebuilt by `manage.py rebuild_ratings`
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    rating_average = models.FloatField(default=0, db_index=True)
+
+    RATING_VALUES = (1, 2, 3, 4, 5)
+    # columns moved by queryset UPDATEs elsewhere (carts, checkout, reviews.signals), which a full save() of
+    # an instance loaded before them would otherwise write back
+    MAINTAINED_FIELDS = frozenset({'stock', 'reserved', 'rating_count', 'rating_sum', 'rating_1', 'rating_2',
+                                   'rating_3', 'rating_4', 'rating_5', 'rating_average'})
+
+    objects = ProductQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stock = instance.__dict__.get('stock')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.effective_price = effective_price_for(self.price, self.discount)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # a full save of a loaded row writes stock only when it was set on this instance (admin, scripts)
+            stock_set = self.__dict__.get('stock', self._loaded_stock) != self._loaded_stock
+            skipped = self.MAINTAINED_FIELDS - ({'stock'} if stock_set else set())
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped and field.attname not in deferred
+            ]
+        elif update_fields is not None and {'price', 'discount'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'effective_price'}
+        super().save(*args, **kwargs)
+        self._loaded_stock = self.__dict__.get('stock')
+
     @property
     def average_rating(self):
-        ratings = self.reviews.all()
-        if ratings.exists():
-            return round(sum(rating.value for rating in ratings) / ratings.count(), 2)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 2)
         return 0
 
+    @property
+    def rating_histogram(self):
+        return {value: getattr(self, f'rating_{value}') for value in self.RATING_VALUES}
+
+    @property
+    def available(self):
+        # stock - reserved drops below zero when the on-hand count is lowered under what baskets hold
+        return max(self.stock - self.reserved, 0)
+
     @property
     def discounted_price(self):
-        return round(Decimal(self.price * (1 - Decimal(self.discount / 100))))
+        # from price and discount, not effective_price: rounding its cents first would round 3.495 up to 4
+        return round(self.price * (100 - self.discount) / 100)
 
+    class Meta:
+        indexes = [models.Index(available_expression(), name='product_available_idx')]
 
 
 
+class PriceHistory(models.Model):
+    # append-only, one row per change of a product's price or discount, written by products.history
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    price = models.DecimalField(max_digits=14, decimal_places=2)
+    discount = models.PositiveSmallIntegerField()
+    effective_price = models.DecimalField(max_digits=14, decimal_places=2)
+    recorded_at = models.DateTimeField()
 
+    def __str__(self):
+        return f"{self.product_id} @ {self.recorded_at}: {self.effective_price}"
 
+    class Meta:
+        # "price of P at time T" is the last row of P at or before T; a series is a range scan of the same index
+        indexes = [models.Index(fields=['product', 'recorded_at'])]
 
 
+class DailyPrice(models.Model):
+    # per-day open/high/low/close of PriceHistory.effective_price that price charts read instead of the raw rows
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_prices')
+    day = models.DateField()
+    open = models.DecimalField(max_digits=14, decimal_places=2)
+    high = models.DecimalField(max_digits=14, decimal_places=2)
+    low = models.DecimalField(max_digits=14, decimal_places=2)
+    close = models.DecimalField(max_digits=14, decimal_places=2)
+    changes = models.PositiveIntegerField(default=0)
 
+    def __str__(self):
+        return f"{self.product_id} {self.day}: {self.open}-{self.close}"
+
+    class Meta:
+        unique_together = ('product', 'day')
+
+
+class ProductFacet(models.Model):
+    # precomputed facet index maintained by products.facets, one row per product and facet
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=64)
+    value = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.product_id} - {self.facet}: {self.value}"
+
+    class Meta:
+        unique_together = ('product', 'facet')
+        indexes = [models.Index(fields=['facet', 'value', 'product'])]
+
+class SearchDocumentField(models.TextField):
+    """The hidden FTS5 column named after its table; only supports the `match` lookup."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ProductSearchEntry(models.Model):
+    # FTS5 virtual table created by products.search.SQLiteFTSBackend.setup()
+    product = models.OneToOneField(Product, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                   db_constraint=False, related_name='search_entry')
+    document = SearchDocumentField(db_column='products_product_search')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_search'
@@ -0,0 +1,76 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, IntegerField, Q, Value
+from django.db.models.functions import Cast, Greatest, Least, Round
+from django.utils import timezone
+from config.api.cache import bump_catalog_version
+from config.api.streaming import chunked
+
+from . import facets, history
+from .models import Product, effective_price_expression
+
+CHANGE_MODES = ('percent', 'absolute')
+# pks per UPDATE, well under SQLite's default limit of 32766 query parameters
+REPRICE_BATCH_SIZE = 10000
+MAX_PRICE = Decimal('999999999999.99')
+# bounds of Product.discount's validators
+MIN_DISCOUNT, MAX_DISCOUNT = 0, 90
+
+
+def price_expression(mode, change):
+    """New price for F('price'): scaled by `change` percent or moved by `change`, rounded to cents, kept in 0..MAX_PRICE."""
+    if mode == 'percent':
+        price = F('price') * Value(1 + Decimal(change) / 100)
+    else:
+        price = F('price') + Value(Decimal(change))
+    price = Round(price, 2, output_field=DecimalField(max_digits=14, decimal_places=2))
+    return Least(Greatest(price, Value(Decimal(0))), Value(MAX_PRICE))
+
+
+def discount_expression(mode, change):
+    """New discount for F('discount'): scaled by `change` percent or moved by `change` points, kept in 0..90."""
+    if mode == 'percent':
+        discount = Round(F('discount') * Value(1 + Decimal(change) / 100))
+    else:
+        discount = F('discount') + Value(int(change))
+    discount = Cast(discount, IntegerField())
+    return Least(Greatest(discount, Value(MIN_DISCOUNT)), Value(MAX_DISCOUNT))
+
+
+def bulk_reprice(queryset, price=None, discount=None, dry_run=False):
+    """
+    Applies `price` / `discount` ((mode, change) pairs) to every product of `queryset` with one UPDATE.
+    Returns how many products are selected and how many prices and discounts change; with `dry_run`
+    only those counts are computed. Only changed rows are written; their facets and price history follow
+    in set-based statements and the catalog cache is invalidated once.
+    """
+    selection = Product.objects.filter(pk__in=queryset.order_by().values('pk'))
+    updates = {}
+    if price is not None:
+        updates['price'] = price_expression(*price)
+    if discount is not None:
+        updates['discount'] = discount_expression(*discount)
+    # SET expressions read the old row, so the new price and discount are passed in
+    effective_price = effective_price_expression(
+        updates.get('price', F('price')), updates.get('discount', F('discount')))
+
+    counts = {'selected': Count('pk')}
+    changed = Q()
+    for name, expression in updates.items():
+        counts[f'{name}_changed'] = Count('pk', filter=~Q(**{name: expression}))
+        changed |= ~Q(**{name: expression})
+    with transaction.atomic():
+        result = selection.aggregate(**counts)
+        if dry_run or not result['selected']:
+            return {**result, 'dry_run': dry_run}
+        # the selection may filter on price or discount, so the rows to reprice are pinned by pk first
+        stamp = timezone.now()
+        changed_pks = list(selection.filter(changed).values_list('pk', flat=True))
+        for pks in chunked(changed_pks, REPRICE_BATCH_SIZE):
+            repriced = Product.objects.filter(pk__in=pks)
+            repriced.update(updated=stamp, effective_price=effective_price, **updates)
+            facets.refresh_price_facets(repriced)
+            history.record_prices(repriced, recorded_at=stamp)
+    bump_catalog_version()
+    return {**result, 'dry_run': dry_run}
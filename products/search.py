@@ -0,0 +1,128 @@
+import abc
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.utils.module_loading import import_string
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from .models import Brand, Category, Product, ProductSearchEntry, ProductsFieldValue
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend(abc.ABC):
+    def setup(self):
+        pass
+
+    def index(self, queryset):
+        """(Re)index the products of `queryset`."""
+
+    def remove(self, queryset):
+        """Drop the products of `queryset` from the index."""
+
+    def rebuild(self):
+        self.setup()
+        self.index(Product.objects.all())
+
+    @abc.abstractmethod
+    def search(self, queryset, query):
+        """Filter `queryset` to matches of `query`, annotated with `search_rank` (lower ranks first)."""
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Unindexed icontains fallback for databases without a full-text engine."""
+
+    def search(self, queryset, query):
+        for term in TOKEN_RE.findall(query):
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term) | Q(brand__name__icontains=term)
+                | Q(category__name__icontains=term) | Q(pk__in=ProductsFieldValue.objects.filter(
+                    value__icontains=term).values('product_id'))
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """SQLite FTS5 inverted index ranked with bm25 and prefix indexes for 2 and 3 character prefixes."""
+    table = ProductSearchEntry._meta.db_table
+    columns = ('name', 'description', 'brand', 'category', 'attributes')
+    weights = (10.0, 1.0, 4.0, 3.0, 2.0)
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                f"{', '.join(self.columns)}, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"INSERT INTO {self.table} ({self.table}, rank) VALUES ('rank', %s)",
+                [f"bm25({', '.join(map(str, self.weights))})"],
+            )
+
+    def _ids_sql(self, queryset):
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        return f'({sql})', params
+
+    def index(self, queryset):
+        ids_sql, params = self._ids_sql(queryset)
+        products = Product._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN {ids_sql}", params)
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, {', '.join(self.columns)}) "
+                f"SELECT p.id, p.name, p.description, COALESCE(b.name, ''), COALESCE(c.name, ''), "
+                f"COALESCE((SELECT group_concat(v.value, ' ') FROM {ProductsFieldValue._meta.db_table} v "
+                f"WHERE v.product_id = p.id), '') "
+                f"FROM {products} p "
+                f"LEFT JOIN {Category._meta.db_table} c ON c.id = p.category_id "
+                f"LEFT JOIN {Brand._meta.db_table} b ON b.id = p.brand_id "
+                f"WHERE p.id IN {ids_sql}",
+                params,
+            )
+
+    def remove(self, queryset):
+        ids_sql, params = self._ids_sql(queryset)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN {ids_sql}", params)
+
+    def rebuild(self):
+        self.setup()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+        self.index(Product.objects.all())
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+    def match_expression(self, query):
+        return ' '.join(f'"{term}"*' for term in TOKEN_RE.findall(query))
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset
+        return queryset.filter(search_entry__document__match=match).annotate(search_rank=F('search_entry__rank'))
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(settings.PRODUCT_SEARCH_BACKEND)()
+
+
+class ProductSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        return get_search_backend().search(queryset, query)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """Orders search results by relevance unless the client asks for an explicit ordering."""
+
+    def get_ordering(self, request, queryset, view):
+        if not request.query_params.get(self.ordering_param) and 'search_rank' in queryset.query.annotations:
+            return ['search_rank']
+        return super().get_ordering(request, queryset, view)
@@ -1,19 +1,55 @@
-from rest_framework.serializers import ModelSerializer, PrimaryKeyRelatedField, SerializerMethodField, ValidationError
-from .models import Category, Brand, Product, ProductImage, ProductField, ProductsFieldValue
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Count
+from rest_framework.reverse import reverse
+from rest_framework.serializers import (
+    BooleanField, ChoiceField, DecimalField, ModelSerializer, PrimaryKeyRelatedField, Serializer, SerializerMethodField,
+    ValidationError,
+)
+from config.api.compiled import CompiledSerializer, RowAttributes, compile_plan, property_accessor, render
+from config.api.pagination import FeedPagination
+from config.api.sparse import DynamicFieldsMixin, nested_context, requested_expansions, wants_field
+
+from .pricing import CHANGE_MODES
+from .models import Category, Brand, DailyPrice, PriceHistory, Product, ProductImage, ProductField, ProductsFieldValue
+from users.models import User
 from users.serializers import UserSerializer
 
 
-class ProductFieldSerializer(ModelSerializer):
+class ProductFieldSerializer(DynamicFieldsMixin, ModelSerializer):
     class Meta:
         model = ProductField
         fields = ['id', 'name', 'field_type', 'choices']
 
 
-class ProductImageSerializer(ModelSerializer):
+def variant_urls(variants, request):
+    urls = {}
+    for name, variant in variants.items():
+        url = default_storage.url(variant['name'])
+        urls[name] = {
+            'url': request.build_absolute_uri(url) if request else url,
+            'width': variant['width'],
+            'height': variant['height'],
+        }
+    return urls
+
+
+class ProductImageSerializer(DynamicFieldsMixin, ModelSerializer):
+    variants = SerializerMethodField()
+    srcset = SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary']
-        read_only_fields = ['id']
+        fields = ['id', 'image', 'alt_text', 'is_primary', 'width', 'height', 'variants', 'srcset']
+        read_only_fields = ['id', 'width', 'height']
+
+    def get_variants(self, obj):
+        # empty until products.images has processed the upload
+        return variant_urls(obj.variants, self.context.get('request'))
+
+    def get_srcset(self, obj):
+        variants = variant_urls(obj.variants, self.context.get('request')).values()
+        return ', '.join(f"{variant['url']} {variant['width']}w" for variant in variants) or None
 
     def _update_primary_image(self, product, is_primary):
         if is_primary:
@@ -38,13 +74,23 @@ class ProductImageSerializer(ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ProductFieldValueSerializer(ModelSerializer):
+class ProductFieldValueSerializer(DynamicFieldsMixin, ModelSerializer):
     field = PrimaryKeyRelatedField(queryset=ProductField.objects.all())
 
     class Meta:
         model = ProductsFieldValue
         fields = ['id', 'field', 'value']
 
+    def validate(self, attrs):
+        field = attrs.get('field', getattr(self.instance, 'field', None))
+        value = attrs.get('value', getattr(self.instance, 'value', None))
+        if field is not None and value is not None:
+            try:
+                field.parse_value(value)
+            except DjangoValidationError as exc:
+                raise ValidationError({"value": exc.messages})
+        return attrs
+
     def create(self, validated_data):
         product = self.context.get('product')
         if not product:
@@ -60,15 +106,54 @@ class ProductFieldValueSerializer(ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class CategoryListSerializer(ModelSerializer):
+class ProductCollectionMixin:
+    # product ids are only listed with ?expand=products (or e.g. ?expand=category.products when nested)
+    products_route = None
+    expandable_fields = ('products',)
+
+    def get_product_count(self, obj):
+        if hasattr(obj, 'product_count'):
+            return obj.product_count
+        return obj.products.count()
+
+    def get_products_url(self, obj):
+        return reverse(self.products_route, kwargs={self.products_route_kwarg: obj.pk},
+                       request=self.context.get('request'))
+
+
+def product_list_skips(request, prefix=''):
+    # nested relations of ProductListSerializer left out by ?fields= / ?omit=, see ProductQuerySet.with_list_relations
+    return {name for name in ('created_by', 'category', 'brand', 'primary_image')
+            if not wants_field(request, f'{prefix}{name}')}
+
+
+def paginated_products(products, context):
+    # same keyset ordering and page size rules as the nested /categories|brands/<pk>/products/ routes
+    request = context['request']
+    paginator = FeedPagination()
+    products = products.with_list_relations(
+        expand=requested_expansions(request), skip=product_list_skips(request, f"{context['field_prefix']}."))
+    page = paginator.paginate_queryset(products, request)
+    view = context.get('view')
+    if hasattr(view, 'depend_on_stock'):
+        view.depend_on_stock(product.pk for product in page)
+    data = ProductListSerializer(page, many=True, context=context).data
+    return paginator.get_paginated_response(data).data
+
+
+class CategoryListSerializer(ProductCollectionMixin, DynamicFieldsMixin, ModelSerializer):
     products = PrimaryKeyRelatedField(many=True, read_only=True)
+    product_count = SerializerMethodField()
+    products_url = SerializerMethodField()
+    products_route = 'category-products-list'
+    products_route_kwarg = 'category_pk'
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'description','products']
+        fields = ['id', 'name', 'description', 'product_count', 'products_url', 'products']
 
 
-class CategoryDetailSerializer(ModelSerializer):
+class CategoryDetailSerializer(DynamicFieldsMixin, ModelSerializer):
     created_by = SerializerMethodField()
     products = SerializerMethodField()
 
@@ -80,51 +165,60 @@ class CategoryDetailSerializer(ModelSerializer):
     def get_created_by(self, obj):
         user = self.context['request'].user
         if user.is_staff and user.is_superuser:
-            return UserSerializer(obj.created_by).data
+            return UserSerializer(obj.created_by, context=nested_context(self, 'created_by')).data
         return {"fullname": f"{obj.created_by.first_name} {obj.created_by.last_name}"}
 
     def get_products(self, obj):
-        products = obj.products.all()
-        return ProductListSerializer(products, many=True, context=self.context).data
+        return paginated_products(obj.products.all(), nested_context(self, 'products'))
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class BrandListSerializer(ModelSerializer):
+class BrandLogoVariantsMixin:
+    def get_logo_variants(self, obj):
+        return variant_urls(obj.logo_variants, self.context.get('request'))
+
+
+class BrandListSerializer(BrandLogoVariantsMixin, ProductCollectionMixin, DynamicFieldsMixin, ModelSerializer):
+    logo_variants = SerializerMethodField()
     products = PrimaryKeyRelatedField(many=True, read_only=True)
+    product_count = SerializerMethodField()
+    products_url = SerializerMethodField()
+    products_route = 'brand-products-list'
+    products_route_kwarg = 'brand_pk'
 
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'description', 'logo', 'products']
+        fields = ['id', 'name', 'description', 'logo', 'logo_variants', 'product_count', 'products_url', 'products']
 
 
-class BrandDetailSerializer(ModelSerializer):
+class BrandDetailSerializer(BrandLogoVariantsMixin, DynamicFieldsMixin, ModelSerializer):
+    logo_variants = SerializerMethodField()
     created_by = SerializerMethodField()
     products = SerializerMethodField()
 
     class Meta:
         model = Brand
-        fields = ['id', 'name', 'description', 'logo', 'created_by', 'created', 'updated', 'products']
+        fields = ['id', 'name', 'description', 'logo', 'logo_variants', 'created_by', 'created', 'updated', 'products']
         read_only_fields = ['created_by', 'created', 'updated']
 
     def get_created_by(self, obj):
         user = self.context['request'].user
         if user.is_staff and user.is_superuser:
-            return UserSerializer(obj.created_by).data
+            return UserSerializer(obj.created_by, context=nested_context(self, 'created_by')).data
         return {"full_name": f"{obj.created_by.first_name} {obj.created_by.last_name}"}
 
     def get_products(self, obj):
-        products = obj.products.all()
-        return ProductListSerializer(products, many=True, context=self.context).data
+        return paginated_products(obj.products.all(), nested_context(self, 'products'))
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class ProductListSerializer(ModelSerializer):
+class ProductListSerializer(DynamicFieldsMixin, ModelSerializer):
     category = CategoryListSerializer(read_only=True)
     brand = BrandListSerializer(read_only=True)
     created_by = SerializerMethodField()
@@ -133,19 +227,22 @@ class ProductListSerializer(ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'brand', 'created_by', 'description', 'price',
-                  'discounted_price', 'stock', 'discount', 'created', 'updated', 'average_rating',
-                  'primary_image']
-        read_only_fields = ['discounted_price', 'average_rating', 'created', 'updated']
+                  'effective_price', 'discounted_price', 'stock', 'available', 'discount', 'created', 'updated',
+                  'average_rating', 'primary_image']
+        read_only_fields = ['effective_price', 'discounted_price', 'available', 'average_rating', 'created', 'updated']
 
     def get_created_by(self, obj):
-        return UserSerializer(obj.created_by, context=self.context).data
+        return UserSerializer(obj.created_by, context=nested_context(self, 'created_by')).data
 
     def get_primary_image(self, obj):
-        primary = obj.images.filter(is_primary=True).first()
-        return ProductImageSerializer(primary, context=self.context).data if primary else None
+        if hasattr(obj, 'primary_images'):
+            primary = obj.primary_images[0] if obj.primary_images else None
+        else:
+            primary = obj.images.filter(is_primary=True).first()
+        return ProductImageSerializer(primary, context=nested_context(self, 'primary_image')).data if primary else None
 
 
-class ProductDetailSerializer(ModelSerializer):
+class ProductDetailSerializer(DynamicFieldsMixin, ModelSerializer):
     category = PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
     brand = PrimaryKeyRelatedField(queryset=Brand.objects.all(), required=False)
     created_by = SerializerMethodField()
@@ -155,12 +252,13 @@ class ProductDetailSerializer(ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'category', 'brand', 'created_by', 'description', 'price',
-                  'discounted_price', 'stock', 'discount', 'created', 'updated', 'average_rating',
-                  'field_values', 'images']
-        read_only_fields = ['discounted_price', 'average_rating', 'created', 'updated', 'created_by']
+                  'effective_price', 'discounted_price', 'stock', 'available', 'discount', 'created', 'updated',
+                  'average_rating', 'field_values', 'images']
+        read_only_fields = ['effective_price', 'discounted_price', 'available', 'average_rating', 'created', 'updated',
+                            'created_by']
 
     def get_created_by(self, obj):
-        return UserSerializer(obj.created_by, context=self.context).data
+        return UserSerializer(obj.created_by, context=nested_context(self, 'created_by')).data
 
     def validate(self, attrs):
         category = attrs.get('category')
@@ -206,7 +304,11 @@ class ProductDetailSerializer(ModelSerializer):
 
     def update(self, instance, validated_data):
         images_data = validated_data.pop('images', None)
-        instance = super().update(instance, validated_data)
+        # only the submitted columns: the instance was read before the request's checks, and its stock and
+        # rating counters may have moved since
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'updated'])
 
         if images_data is not None:
             for image_data in images_data:
@@ -216,4 +318,118 @@ class ProductDetailSerializer(ModelSerializer):
                 )
                 image_serializer.is_valid(raise_exception=True)
                 image_serializer.save()
-        return instance
\ No newline at end of file
+        return instance
+
+class PriceHistorySerializer(DynamicFieldsMixin, ModelSerializer):
+    class Meta:
+        model = PriceHistory
+        fields = ['price', 'discount', 'effective_price', 'recorded_at']
+
+
+class DailyPriceSerializer(DynamicFieldsMixin, ModelSerializer):
+    class Meta:
+        model = DailyPrice
+        fields = ['day', 'open', 'high', 'low', 'close', 'changes']
+
+
+class BulkPriceSerializer(Serializer):
+    # percent: -10 takes 10% off; absolute: -5 subtracts 5 from the price / 5 points from the discount
+    price_change = DecimalField(max_digits=14, decimal_places=2, required=False)
+    price_mode = ChoiceField(choices=CHANGE_MODES, default='percent')
+    discount_change = DecimalField(max_digits=5, decimal_places=2, required=False)
+    discount_mode = ChoiceField(choices=CHANGE_MODES, default='absolute')
+    dry_run = BooleanField(default=False)
+
+    def validate(self, attrs):
+        if 'price_change' not in attrs and 'discount_change' not in attrs:
+            raise ValidationError({"error": "Provide price_change and/or discount_change."})
+        for name in ('price', 'discount'):
+            change = attrs.get(f'{name}_change')
+            if change is None:
+                continue
+            if attrs[f'{name}_mode'] == 'percent' and change < -100:
+                raise ValidationError({f'{name}_change': "A percentage change cannot go below -100."})
+            if name == 'discount' and attrs['discount_mode'] == 'absolute' and change != int(change):
+                raise ValidationError({"discount_change": "Discounts move by whole points."})
+        return attrs
+
+    def changes(self):
+        return {
+            name: (self.validated_data[f'{name}_mode'], self.validated_data[f'{name}_change'])
+            for name in ('price', 'discount') if f'{name}_change' in self.validated_data
+        }
+
+
+class CompiledProductListSerializer(CompiledSerializer):
+    """ProductListSerializer over values() rows, with related rows loaded in one query each per page."""
+    serializer_class = ProductListSerializer
+    property_columns = {
+        'discounted_price': ('price', 'discount'), 'available': ('stock', 'reserved'),
+        'average_rating': ('rating_sum', 'rating_count'),
+    }
+
+    def custom_accessors(self, serializer):
+        request = self.request
+        custom = {}
+        self.related = {}
+        if 'created_by' in serializer.fields:
+            users = UserSerializer(context=nested_context(serializer, 'created_by'))
+            user_plan, user_columns = compile_plan(
+                users, User, request, {'full_name': property_accessor(User, 'full_name')})
+            user_columns |= {'first_name', 'last_name'}
+            # joined into the product row, like select_related('created_by')
+            self.columns.update({'created_by_id', *(f'created_by__{column}' for column in user_columns)})
+            # what the method field returns for products without a creator
+            missing = UserSerializer(None, context=users.context).data
+            custom['created_by'] = lambda row: missing if row['created_by_id'] is None else render(
+                user_plan, {column: row[f'created_by__{column}'] for column in user_columns})
+        for name, model in (('category', Category), ('brand', Brand)):
+            if name in serializer.fields:
+                nested = serializer.fields[name]
+                collection_custom = {
+                    'product_count': lambda row: row['product_count'],
+                    'products_url': lambda row, nested=nested: reverse(
+                        nested.products_route, kwargs={nested.products_route_kwarg: row['id']}, request=request),
+                    'logo_variants': lambda row: variant_urls(row['logo_variants'], request),
+                }
+                plan, columns = compile_plan(nested, model, request, collection_custom)
+                queryset = model.objects.all()
+                if 'product_count' in nested.fields:
+                    queryset = queryset.annotate(product_count=Count('products'))
+                    columns.add('product_count')
+                if 'logo_variants' in nested.fields:
+                    columns.add('logo_variants')
+                self.columns.add(f'{name}_id')
+                self.related[name] = (queryset, f'{name}_id', plan, columns)
+                custom[name] = self.related_accessor(name, f'{name}_id', None)
+        if 'primary_image' in serializer.fields:
+            images = ProductImageSerializer(context=nested_context(serializer, 'primary_image'))
+            plan, columns = compile_plan(images, ProductImage, request, {
+                'variants': lambda row: variant_urls(row['variants'], request),
+                'srcset': lambda row: images.get_srcset(RowAttributes(row)),
+            })
+            self.primary_images = (plan, columns | {'product_id', 'variants'})
+            custom['primary_image'] = lambda row: self.rendered_images.get(row['id'])
+        return custom
+
+    def related_accessor(self, name, key, missing):
+        def accessor(row):
+            if row[key] is None:
+                return missing
+            return self.rendered[name][row[key]]
+        return accessor
+
+    def prepare(self, rows):
+        self.rendered = {}
+        for name, (queryset, key, plan, columns) in self.related.items():
+            ids = {row[key] for row in rows if row[key] is not None}
+            self.rendered[name] = {
+                related['id']: render(plan, related)
+                for related in queryset.filter(pk__in=ids).values(*columns | {'id'})
+            }
+        if hasattr(self, 'primary_images'):
+            plan, columns = self.primary_images
+            self.rendered_images = {}
+            for image in ProductImage.objects.filter(
+                    product_id__in=[row['id'] for row in rows], is_primary=True).order_by('pk').values(*columns | {'id'}):
+                self.rendered_images.setdefault(image['product_id'], render(plan, image))
@@ -0,0 +1,105 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from config.api.cache import bump_catalog_version_on_commit
+
+from . import facets, history, images
+from .models import Brand, Category, Product, ProductImage, ProductsFieldValue
+from .search import get_search_backend
+
+
+def create_search_index(sender, **kwargs):
+    get_search_backend().setup()
+
+
+for model in (Product, Category, Brand, ProductImage, ProductsFieldValue):
+    post_save.connect(bump_catalog_version_on_commit, sender=model, dispatch_uid=f'catalog_version_{model.__name__}_save')
+    post_delete.connect(bump_catalog_version_on_commit, sender=model, dispatch_uid=f'catalog_version_{model.__name__}_delete')
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Brand)
+def index_brand_products(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        get_search_backend().index(Product.objects.filter(brand=instance))
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        get_search_backend().index(Product.objects.filter(category=instance))
+
+
+@receiver([post_save, post_delete], sender=ProductsFieldValue)
+def index_field_value_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.refresh_product_facets(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=ProductsFieldValue)
+def set_field_value_facet(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.set_field_facet(instance.product_id, instance.field_id, instance.value)
+
+
+@receiver(post_delete, sender=ProductsFieldValue)
+def remove_field_value_facet(sender, instance, **kwargs):
+    facets.remove_field_facet(instance.product_id, instance.field_id)
+
+
+@receiver(post_delete, sender=Brand)
+def remove_brand_facets(sender, instance, **kwargs):
+    facets.remove_brand_facets(instance.pk)
+
+
+@receiver(post_init, sender=Product)
+def remember_product_price(sender, instance, **kwargs):
+    instance._recorded_price = instance.__dict__.get('price'), instance.__dict__.get('discount')
+
+
+@receiver(post_save, sender=Product)
+def record_price_change(sender, instance, created, raw=False, **kwargs):
+    # deferred fields were not saved, so they cannot have changed
+    current = instance.__dict__.get('price'), instance.__dict__.get('discount')
+    if not raw and None not in current and (created or current != instance._recorded_price):
+        history.record_prices(Product.objects.filter(pk=instance.pk))
+    instance._recorded_price = current
+
+
+@receiver(post_init, sender=ProductImage)
+def remember_product_image(sender, instance, **kwargs):
+    instance._processed_image = instance.__dict__.get('image') and str(instance.__dict__['image'])
+
+
+@receiver(post_save, sender=ProductImage)
+def process_product_image(sender, instance, created, raw=False, **kwargs):
+    if not raw and instance.image and (created or instance.image.name != instance._processed_image):
+        images.schedule(images.process_product_image, instance.pk)
+    instance._processed_image = instance.image.name
+
+
+@receiver(post_init, sender=Brand)
+def remember_brand_logo(sender, instance, **kwargs):
+    instance._processed_logo = instance.__dict__.get('logo') and str(instance.__dict__['logo'])
+
+
+@receiver(post_save, sender=Brand)
+def process_brand_logo(sender, instance, created, raw=False, **kwargs):
+    if not raw and instance.logo and (created or instance.logo.name != instance._processed_logo):
+        images.schedule(images.process_brand_logo, instance.pk)
+    instance._processed_logo = instance.logo.name
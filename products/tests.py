@@ -1,16 +1,47 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ModelSerializer
 from rest_framework.test import APIClient
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+import json
 from decimal import Decimal
-from .models import Category, Brand, Product, ProductField, ProductsFieldValue
-from .serializers import CategoryDetailSerializer, ProductDetailSerializer
+from config.api.cache import catalog_cache, catalog_version
+from config.api.compiled import CompiledSerializer
+from config.api.renderers import FastJSONParser, FastJSONRenderer
+from config.api.sparse import DynamicFieldsMixin
+
+from .history import record_prices
+from .permissions import IsOwner
+from .models import (
+    Category, Brand, DailyPrice, PriceHistory, Product, ProductFacet, ProductField, ProductImage, ProductsFieldValue,
+    discounted_price_expression, effective_price_for,
+)
+from .serializers import CompiledProductListSerializer, ProductDetailSerializer
+from .importers import CatalogImporter, read_rows
+from .views import ProductViewSet
 
 User = get_user_model()
 
 
 class SimpleModelTests(TestCase):
     def setUp(self):
+        # catalog writes bump the cache version on commit, which a TestCase never reaches
+        catalog_cache().clear()
         self.client = APIClient()
         # Admin va oddiy foydalanuvchini yaratamiz
         self.admin = User.objects.create_superuser(
@@ -163,8 +194,8 @@ class SimpleModelTests(TestCase):
     def test_category_products_relation(self):
         response = self.client.get(reverse("category-detail", kwargs={"pk": self.category.pk}))
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data["products"]), 1)
-        self.assertEqual(response.data["products"][0]["name"], "Smartphone")
+        self.assertEqual(len(response.data["products"]["results"]), 1)
+        self.assertEqual(response.data["products"]["results"][0]["name"], "Smartphone")
 
     def test_non_owner_cannot_update_product(self):
         self.client.force_authenticate(self.user)
@@ -175,3 +206,993 @@ class SimpleModelTests(TestCase):
         self.assertEqual(response.status_code, 403)
         self.product.refresh_from_db()
         self.assertEqual(self.product.name, "Smartphone")
+
+    def counters(self):
+        return Product.objects.values_list("stock", "reserved", "rating_count", "rating_sum").get(pk=self.product.pk)
+
+    def test_update_writes_only_the_submitted_fields(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(stock=90, reserved=3, rating_count=1, rating_sum=4)
+        data = {"name": "Smartphone 2", "price": "500.00", "category": self.category.pk, "brand": self.brand.pk}
+        serializer = ProductDetailSerializer(stale, data=data, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.counters(), (90, 3, 1, 4))
+        self.assertEqual(Product.objects.values_list("name", "effective_price").get(pk=self.product.pk),
+                         ("Smartphone 2", Decimal("450.00")))
+
+        serializer = ProductDetailSerializer(stale, data={**data, "stock": 70}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.counters(), (70, 3, 1, 4))
+
+    def test_full_save_leaves_the_maintained_columns_alone(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(stock=90, reserved=3, rating_count=1, rating_sum=4)
+        stale.description = "Edited"
+        stale.save()
+        self.assertEqual(self.counters(), (90, 3, 1, 4))
+        stale.stock = 80
+        stale.save()
+        self.assertEqual(self.counters(), (80, 3, 1, 4))
+        self.assertEqual(Product.objects.get(pk=self.product.pk).description, "Edited")
+
+
+# the image files don't exist; their jobs would only fail, on worker threads sharing the test database
+@mock.patch("products.images.schedule", mock.Mock())
+class ProductQueryBudgetTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            email="admin@example.com",
+            password="admin123",
+            first_name="Admin",
+            last_name="User"
+        )
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="TechBrand", description="Tech", created_by=self.admin)
+        self.field = ProductField.objects.create(name="Color", field_type="text")
+
+    def create_products(self, count):
+        for i in range(Product.objects.count(), count):
+            product = Product.objects.create(
+                name=f"Product {i}",
+                category=self.category,
+                brand=self.brand if i % 2 else None,
+                created_by=self.admin,
+                description="Description",
+                price=Decimal("10.00"),
+                stock=5,
+            )
+            ProductImage.objects.create(product=product, image="images/product-images/a.png", is_primary=True)
+            ProductImage.objects.create(product=product, image="images/product-images/b.png")
+            ProductsFieldValue.objects.create(product=product, field=self.field, value="Red")
+
+    def test_list_query_budget_is_constant(self):
+        budget = ProductViewSet.query_budget['list']
+        for count in (2, 10):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.create_products(count)
+            with self.assertNumQueries(budget):
+                response = self.client.get(reverse("product-list"))
+            self.assertEqual(len(response.data["results"]), count)
+            self.assertIsNotNone(response.data["results"][0]["primary_image"])
+
+    def test_nested_list_query_budget(self):
+        self.create_products(6)
+        with self.assertNumQueries(ProductViewSet.query_budget['list']):
+            response = self.client.get(reverse("category-products-list", kwargs={"category_pk": self.category.pk}))
+        self.assertEqual(len(response.data["results"]), 6)
+
+    def test_retrieve_query_budget(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        with self.assertNumQueries(ProductViewSet.query_budget['retrieve']):
+            response = self.client.get(reverse("product-detail", kwargs={"pk": product.pk}))
+        self.assertEqual(len(response.data["images"]), 2)
+        self.assertEqual(len(response.data["field_values"]), 1)
+
+
+class ProductFeedPaginationTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        for i in range(12):
+            Product.objects.create(
+                name=f"Product {i}", category=self.category, created_by=self.admin,
+                description="Description", price=Decimal("10.00"),
+            )
+
+    def test_keyset_pages_cover_feed_without_count(self):
+        response = self.client.get(reverse("product-list"))
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        first_page = [item["id"] for item in response.data["results"]]
+        self.assertEqual(len(first_page), 10)
+
+        response = self.client.get(response.data["next"])
+        second_page = [item["id"] for item in response.data["results"]]
+        self.assertIsNone(response.data["next"])
+
+        expected = list(Product.objects.order_by("-created", "-id").values_list("id", flat=True))
+        self.assertEqual(first_page + second_page, expected)
+
+    def test_page_number_mode_reports_totals(self):
+        response = self.client.get(reverse("product-list"), {"page": 2})
+        self.assertEqual(response.data["count"], 12)
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="Acme", description="Acme devices", created_by=self.admin)
+        self.phone = Product.objects.create(
+            name="Smartphone X", category=self.category, brand=self.brand, created_by=self.admin,
+            description="Phone with a great camera", price=Decimal("599.99"),
+        )
+        self.laptop = Product.objects.create(
+            name="Laptop Pro", category=self.category, created_by=self.admin,
+            description="Portable computer, pairs with any smartphone", price=Decimal("999.99"),
+        )
+        self.color = ProductField.objects.create(name="Color", field_type="text")
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("product-list"), {"search": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.data["results"]]
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search("smartphone"), ["Smartphone X", "Laptop Pro"])
+        self.assertEqual(self.search("smartphone", ordering="-price"), ["Laptop Pro", "Smartphone X"])
+
+    def test_search_prefix_and_related_fields(self):
+        self.assertEqual(self.search("smartph"), ["Smartphone X", "Laptop Pro"])
+        self.assertEqual(self.search("acme"), ["Smartphone X"])
+        self.assertEqual(self.search("camera phone"), ["Smartphone X"])
+        self.assertEqual(self.search("nothing"), [])
+
+    def test_index_follows_related_saves(self):
+        ProductsFieldValue.objects.create(product=self.laptop, field=self.color, value="Graphite")
+        self.assertEqual(self.search("graphite"), ["Laptop Pro"])
+
+        self.brand.name = "Globex"
+        self.brand.save()
+        self.assertEqual(self.search("globex"), ["Smartphone X"])
+        self.assertEqual(self.search("acme"), [])
+
+        self.laptop.delete()
+        self.assertEqual(self.search("portable"), [])
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.phones = Category.objects.create(name="Phones", created_by=self.admin)
+        self.laptops = Category.objects.create(name="Laptops", created_by=self.admin)
+        self.brand = Brand.objects.create(name="Acme", description="Acme devices", created_by=self.admin)
+        self.color = ProductField.objects.create(name="Color", field_type="choice", choices="Red,Black")
+        products = [
+            ("Phone A", self.phones, self.brand, "80.00", 0, "Black"),
+            ("Phone B", self.phones, None, "120.00", 10, "Red"),
+            ("Laptop A", self.laptops, self.brand, "900.00", 5, "Black"),
+        ]
+        for name, category, brand, price, discount, color in products:
+            product = Product.objects.create(
+                name=name, category=category, brand=brand, created_by=self.admin,
+                description=name, price=Decimal(price), discount=discount,
+            )
+            ProductsFieldValue.objects.create(product=product, field=self.color, value=color)
+
+    def facets(self, **params):
+        response = self.client.get(reverse("product-facets"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_facet_counts(self):
+        data = self.facets()
+        self.assertEqual(
+            {item["label"]: item["count"] for item in data["category"]}, {"Phones": 2, "Laptops": 1}
+        )
+        self.assertEqual(data["brand"], [{"value": self.brand.pk, "label": "Acme", "count": 2}])
+        self.assertEqual(
+            [(item["value"], item["count"]) for item in data["price"]], [("50-100", 1), ("100-250", 1), ("500-1000", 1)]
+        )
+        self.assertEqual({item["value"]: item["count"] for item in data["discount"]}, {True: 2, False: 1})
+        self.assertEqual(data["fields"][0]["name"], "Color")
+        self.assertEqual(data["fields"][0]["values"], [{"value": "Black", "count": 2}, {"value": "Red", "count": 1}])
+
+    def test_facets_follow_filters_and_updates(self):
+        data = self.facets(category=self.phones.pk)
+        self.assertEqual(data["fields"][0]["values"], [{"value": "Black", "count": 1}, {"value": "Red", "count": 1}])
+
+        phone = Product.objects.get(name="Phone B")
+        phone.category = self.laptops
+        phone.save()
+        ProductsFieldValue.objects.filter(product=phone).get().delete()
+
+        data = self.facets(category=self.laptops.pk)
+        self.assertEqual(data["category"][0]["count"], 2)
+        self.assertEqual(data["fields"][0]["values"], [{"value": "Black", "count": 1}])
+
+    def test_deleting_a_brand_drops_its_facet(self):
+        self.brand.delete()
+        self.assertEqual(self.facets()["brand"], [])
+        self.assertFalse(ProductFacet.objects.filter(facet="brand").exists())
+
+
+class TypedAttributeTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.client.force_authenticate(self.admin)
+        self.category = Category.objects.create(name="Phones", created_by=self.admin)
+        self.ram = ProductField.objects.create(name="RAM", field_type="number")
+        self.color = ProductField.objects.create(name="Color", field_type="choice", choices="Red, Black")
+        self.products = {}
+        for name, ram, color in [("Basic", "4", "Red"), ("Plus", "8", "Black"), ("Max", "16", "Black")]:
+            product = Product.objects.create(
+                name=name, category=self.category, created_by=self.admin, description=name, price=Decimal("100.00"),
+            )
+            ProductsFieldValue.objects.create(product=product, field=self.ram, value=ram)
+            ProductsFieldValue.objects.create(product=product, field=self.color, value=color)
+            self.products[name] = product
+
+    def filter(self, **params):
+        response = self.client.get(reverse("product-list"), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(item["name"] for item in response.data["results"])
+
+    def test_typed_columns_are_populated(self):
+        value = ProductsFieldValue.objects.get(product=self.products["Plus"], field=self.ram)
+        self.assertEqual(value.number_value, Decimal("8"))
+        value = ProductsFieldValue.objects.get(product=self.products["Plus"], field=self.color)
+        self.assertEqual(value.choice.value, "Black")
+
+    def test_multi_attribute_filters(self):
+        self.assertEqual(self.filter(**{"attr[ram]__gte": "8"}), ["Max", "Plus"])
+        self.assertEqual(self.filter(**{"attr[RAM]__gte": "8", "attr[color]": "black", "attr[ram]__lt": "16"}), ["Plus"])
+        self.assertEqual(self.filter(**{"attr[Color]__in": "red,black"}), ["Basic", "Max", "Plus"])
+        response = self.client.get(reverse("product-list"), {"attr[weight]": "1"})
+        self.assertEqual(response.status_code, 400)
+        for param, value in [("attr[ram]__gte", "Infinity"), ("attr[ram]__lt", "-inf"), ("attr[ram]", "NaN"),
+                             ("attr[ram]__in", "8,sNaN")]:
+            response = self.client.get(reverse("product-list"), {param: value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_values_are_validated_against_field_type(self):
+        url = reverse("product-field-values-list", kwargs={"product_pk": self.products["Basic"].pk})
+        size = ProductField.objects.create(name="Size", field_type="number")
+        response = self.client.post(url, {"field": size.pk, "value": "large"})
+        self.assertEqual(response.status_code, 400)
+        shape = ProductField.objects.create(name="Shape", field_type="choice", choices="Round,Square")
+        response = self.client.post(url, {"field": shape.pk, "value": "Oval"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {"field": shape.pk, "value": "round"})
+        self.assertEqual(response.status_code, 201)
+
+
+class ProductCollectionTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="Acme", description="Acme devices", created_by=self.admin)
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", category=self.category, brand=self.brand, created_by=self.admin,
+                description="Description", price=Decimal("10.00"),
+            )
+            for i in range(3)
+        ]
+
+    def test_category_list_returns_count_and_link(self):
+        response = self.client.get(reverse("category-list"))
+        item = response.data["results"][0]
+        self.assertEqual(item["product_count"], 3)
+        self.assertNotIn("products", item)
+        self.assertTrue(item["products_url"].endswith(
+            reverse("category-products-list", kwargs={"category_pk": self.category.pk})))
+
+    def test_brand_list_expands_products_on_request(self):
+        response = self.client.get(reverse("brand-list"), {"expand": "products"})
+        item = response.data["results"][0]
+        self.assertEqual(item["product_count"], 3)
+        self.assertEqual(sorted(item["products"]), sorted(product.pk for product in self.products))
+
+    def test_product_rows_embed_counts_not_ids(self):
+        response = self.client.get(reverse("product-list"))
+        category = response.data["results"][0]["category"]
+        self.assertEqual(category["product_count"], 3)
+        self.assertNotIn("products", category)
+
+        with self.assertNumQueries(ProductViewSet.query_budget['list'] + 2):
+            response = self.client.get(reverse("product-list"), {"expand": "category.products,brand.products"})
+        self.assertEqual(len(response.data["results"][0]["brand"]["products"]), 3)
+
+
+class CollectionDetailProductsTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="Acme", description="Acme devices", created_by=self.admin)
+        for i in range(13):
+            Product.objects.create(
+                name=f"Product {i}", category=self.category, brand=self.brand, created_by=self.admin,
+                description="Description", price=Decimal("10.00"),
+            )
+        self.expected = list(Product.objects.order_by("-created", "-id").values_list("name", flat=True))
+
+    def test_detail_products_are_paginated_like_nested_route(self):
+        response = self.client.get(reverse("category-detail", kwargs={"pk": self.category.pk}))
+        products = response.data["products"]
+        names = [item["name"] for item in products["results"]]
+        nested = self.client.get(reverse("category-products-list", kwargs={"category_pk": self.category.pk}))
+        self.assertEqual(names, [item["name"] for item in nested.data["results"]])
+
+        response = self.client.get(products["next"])
+        names += [item["name"] for item in response.data["products"]["results"]]
+        self.assertIsNone(response.data["products"]["next"])
+        self.assertEqual(names, self.expected)
+
+        response = self.client.get(reverse("brand-detail", kwargs={"pk": self.brand.pk}), {"page_size": 5})
+        self.assertEqual(len(response.data["products"]["results"]), 5)
+
+    def test_export_streams_all_products(self):
+        response = self.client.get(reverse("brand-export", kwargs={"pk": self.brand.pk}))
+        self.assertTrue(response.streaming)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["name"], "Acme")
+        self.assertEqual([item["name"] for item in data["products"]], self.expected)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.product = Product.objects.create(
+            name="Smartphone", category=self.category, created_by=self.admin,
+            description="Latest model", price=Decimal("599.99"),
+        )
+
+    def test_repeated_reads_are_served_from_cache(self):
+        url = reverse("product-detail", kwargs={"pk": self.product.pk})
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["name"], "Smartphone")
+
+        response = self.client.get(url, {"expand": "x"})
+        self.assertEqual(response["X-Cache"], "MISS")
+
+    def test_writes_invalidate_cached_responses(self):
+        url = reverse("category-list")
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name="Laptop", category=self.category, created_by=self.admin,
+                description="Laptop", price=Decimal("999.99"),
+            )
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["product_count"], 2)
+
+    def test_version_is_bumped_after_commit(self):
+        version = catalog_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.product.save()
+            self.assertEqual(catalog_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(catalog_version(), version)
+
+    def test_stock_moves_only_expire_responses_showing_that_stock(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        other = Product.objects.create(name="Laptop", category=self.category, created_by=self.admin,
+                                       description="Laptop", price=Decimal("999.99"), stock=5)
+        requests = {
+            "detail": (reverse("product-detail", kwargs={"pk": self.product.pk}), {}),
+            "other detail": (reverse("product-detail", kwargs={"pk": other.pk}), {}),
+            "list": (reverse("product-list"), {}),
+            "list without stock": (reverse("product-list"), {"fields": "id,name"}),
+            "filtered by stock": (reverse("product-list"), {"available_min": 1, "fields": "id"}),
+            "category": (reverse("category-detail", kwargs={"pk": self.category.pk}), {}),
+            "facets": (reverse("product-facets"), {}),
+        }
+        for url, params in requests.values():
+            self.client.get(url, params)
+        version = catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(Product.objects.reserve(self.product.pk, 1))
+        self.assertEqual(catalog_version(), version)
+        expired = {name for name, (url, params) in requests.items()
+                   if self.client.get(url, params)["X-Cache"] == "MISS"}
+        self.assertEqual(expired, {"detail", "list", "filtered by stock", "category"})
+        self.assertEqual(self.client.get(requests["detail"][0]).data["available"], 4)
+
+    def test_permission_tiers_are_cached_separately(self):
+        url = reverse("category-detail", kwargs={"pk": self.category.pk})
+        self.client.get(url)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["created_by"]["email"], "admin@example.com")
+
+        stats = self.client.get(reverse("catalog-cache-stats")).data
+        self.assertGreaterEqual(stats["misses"], 2)
+
+    @override_settings(ALLOWED_HOSTS=["testserver", "shop.example.com"])
+    def test_hosts_and_schemes_are_cached_separately(self):
+        # responses carry absolute links
+        url = reverse("category-list")
+        self.client.get(url)
+        response = self.client.get(url, HTTP_HOST="shop.example.com")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertTrue(response.data["results"][0]["products_url"].startswith("http://shop.example.com/"))
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertTrue(response.data["results"][0]["products_url"].startswith("https://testserver/"))
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.product = Product.objects.create(
+            name="Smartphone", category=self.category, created_by=self.admin,
+            description="Latest model", price=Decimal("599.99"),
+        )
+
+    def test_matching_etag_returns_not_modified(self):
+        url = reverse("product-detail", kwargs={"pk": self.product.pk})
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+        self.product.price = Decimal("549.99")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_modified_since_on_list(self):
+        url = reverse("category-list")
+        response = self.client.get(url)
+        last_modified = response["Last-Modified"]
+        response = self.client.get(url, {"page_size": 5}, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_still_checks_object_permissions(self):
+        url = reverse("product-detail", kwargs={"pk": self.product.pk})
+        self.client.force_authenticate(User.objects.create_user(email="user@example.com", password="user123"))
+        response = self.client.get(url)
+        self.assertIn("Accept", response["Vary"])
+        with mock.patch.object(ProductViewSet, "get_permissions", return_value=[IsOwner()]):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_object_still_returns_404(self):
+        response = self.client.get(reverse("product-detail", kwargs={"pk": 999}), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), PRODUCT_IMAGE_WORKERS=0)
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.product = Product.objects.create(
+            name="Smartphone", category=self.category, created_by=self.admin,
+            description="Latest model", price=Decimal("599.99"),
+        )
+
+    def upload(self, name="photo.png", size=(2000, 1000)):
+        buffer = io.BytesIO()
+        PILImage.new("RGB", size, "red").save(buffer, "PNG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/png")
+
+    def test_upload_generates_variants_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=self.upload(), is_primary=True)
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (2000, 1000))
+        self.assertEqual(set(image.variants), set(settings.PRODUCT_IMAGE_VARIANTS))
+        self.assertEqual((image.variants["thumbnail"]["width"], image.variants["thumbnail"]["height"]), (160, 80))
+        self.assertTrue(image.variants["large"]["name"].endswith(".webp"))
+
+        data = self.client.get(reverse("product-list")).data["results"][0]["primary_image"]
+        self.assertTrue(data["variants"]["medium"]["url"].startswith("http://testserver/"))
+        self.assertIn(" 640w", data["srcset"])
+
+    def test_unreadable_upload_is_left_unprocessed(self):
+        upload = SimpleUploadedFile("notes.png", b"not an image", content_type="image/png")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=self.product, image=upload)
+        image.refresh_from_db()
+        self.assertEqual(image.variants, {})
+        self.assertIsNone(image.width)
+
+    def test_backfill_command(self):
+        image = ProductImage.objects.create(product=self.product, image=self.upload())
+        brand = Brand.objects.create(name="TechBrand", description="Tech", logo=self.upload("logo.png", (300, 300)))
+        call_command("process_images", workers=0, stdout=io.StringIO())
+        image.refresh_from_db()
+        brand.refresh_from_db()
+        self.assertEqual(image.variants["medium"]["width"], 640)
+        self.assertEqual(brand.logo_variants["large"]["width"], 300)
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="TechBrand", description="Tech", created_by=self.admin)
+        self.color = ProductField.objects.create(name="Color", field_type="choice", choices="Red,Blue")
+        self.weight = ProductField.objects.create(name="Weight", field_type="number")
+        Product.objects.create(
+            name="Smartphone", category=self.category, created_by=self.admin,
+            description="Old", price=Decimal("599.99"),
+        )
+
+    def test_csv_command_upserts_and_reports_row_errors(self):
+        path = os.path.join(tempfile.mkdtemp(), "feed.csv")
+        with open(path, "w", newline="") as feed:
+            feed.write(
+                "name,category,brand,description,price,stock,discount,attr[Color],attr[Weight]\n"
+                "Smartphone,electronics,TechBrand,New,549.00,5,10,blue,0.2\n"
+                "Laptop,Electronics,,Fast,999.99,2,0,Red,\n"
+                "Broken,Unknown,,x,abc,1,0,Green,\n"
+            )
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_catalog", path, chunk_size=2, stdout=out, stderr=err)
+        self.assertIn("1 created, 1 updated, 1 failed", out.getvalue())
+        self.assertIn("line 4:", err.getvalue())
+        self.assertIn("Unknown category 'Unknown'", err.getvalue())
+
+        phone = Product.objects.get(name="Smartphone")
+        self.assertEqual((phone.description, phone.price, phone.discount), ("New", Decimal("549.00"), 10))
+        color = phone.field_values.get(field=self.color)
+        self.assertEqual((color.value, color.choice.value), ("blue", "Blue"))
+        self.assertEqual(phone.field_values.get(field=self.weight).number_value, Decimal("0.2"))
+        self.assertEqual(Product.objects.get(name="Laptop").field_values.get().value, "Red")
+
+        response = self.client.get(reverse("product-list"), {"search": "laptop", "attr[Color]": "red"})
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Laptop"])
+
+    def test_jsonl_endpoint_is_admin_only(self):
+        feed = (
+            '{"name": "Tablet", "category": "Gadgets", "brand": "NewBrand", "price": 300, '
+            '"attributes": {"Weight": "0.5"}}\n'
+            'not json\n'
+        ).encode()
+        url = reverse("product-import-catalog")
+        upload = SimpleUploadedFile("feed.jsonl", feed)
+        self.assertIn(self.client.post(url, {"file": upload}).status_code, (401, 403))
+
+        self.client.force_authenticate(self.admin)
+        upload = SimpleUploadedFile("feed.jsonl", feed)
+        response = self.client.post(url, {"file": upload, "create_missing": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["created"], response.data["failed"]), (1, 1))
+        self.assertEqual(response.data["errors"][0]["line"], 2)
+        tablet = Product.objects.get(name="Tablet")
+        self.assertEqual((tablet.category.name, tablet.brand.name, tablet.created_by), ("Gadgets", "NewBrand", self.admin))
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.other = Category.objects.create(name="Books", created_by=self.admin)
+        self.color = ProductField.objects.create(name="Color", field_type="text")
+        for i in range(5):
+            product = Product.objects.create(
+                name=f"Phone {i}", category=self.category, created_by=self.admin,
+                description="Phone, with \"quotes\"", price=Decimal("100.00") + i, stock=i,
+            )
+            ProductsFieldValue.objects.create(product=product, field=self.color, value="Red")
+        Product.objects.create(name="Novel", category=self.other, description="Book", price=Decimal("9.99"))
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_requires_admin(self):
+        self.assertIn(self.client.get(reverse("product-export-catalog")).status_code, (401, 403))
+
+    def test_csv_export_reuses_filters_and_round_trips(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse("product-export-catalog"), {"category": self.category.pk})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]["description"], 'Phone, with "quotes"')
+        self.assertEqual(rows[0]["attr[Color]"], "Red")
+
+        result = CatalogImporter().run(read_rows(io.StringIO(self.read(
+            self.client.get(reverse("product-export-catalog"), {"category": self.category.pk}))), "csv"))
+        self.assertEqual((result.updated, result.errors), (5, []))
+
+    def test_jsonl_and_columnar_exports(self):
+        self.client.force_authenticate(self.admin)
+        url = reverse("product-export-catalog")
+        lines = self.read(self.client.get(url, {"export_format": "jsonl", "ordering": "price"})).splitlines()
+        self.assertEqual([json.loads(line)["name"] for line in lines][:2], ["Novel", "Phone 0"])
+        self.assertEqual(json.loads(lines[1])["attributes"], {"Color": "Red"})
+
+        chunk = json.loads(self.read(self.client.get(url, {"export_format": "columnar"})).splitlines()[0])
+        self.assertEqual(chunk["rows"], 6)
+        self.assertEqual(len(chunk["columns"]["price"]), 6)
+        self.assertEqual(self.client.get(url, {"export_format": "xml"}).status_code, 400)
+
+    def test_export_command(self):
+        out = io.StringIO()
+        call_command("export_products", format="jsonl", filter=["price_max=101"], stdout=out)
+        self.assertEqual(sorted(json.loads(line)["name"] for line in out.getvalue().splitlines()),
+                         ["Novel", "Phone 0", "Phone 1"])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="TechBrand", description="Tech", created_by=self.admin)
+        for i in range(3):
+            product = Product.objects.create(
+                name=f"Phone {i}", category=self.category, brand=self.brand, created_by=self.admin,
+                description="Phone", price=Decimal("100.00"),
+            )
+            ProductImage.objects.create(product=product, image="images/product-images/a.png", is_primary=True)
+
+    def test_fields_select_nested_paths(self):
+        response = self.client.get(reverse("product-list"), {"fields": "id,name,category.name,created_by.email"})
+        item = response.data["results"][0]
+        self.assertEqual(set(item), {"id", "name", "category", "created_by"})
+        self.assertEqual(item["category"], {"name": "Electronics"})
+        self.assertEqual(item["created_by"], {"email": "admin@example.com"})
+
+    def test_omit_and_expand(self):
+        response = self.client.get(
+            reverse("product-list"), {"omit": "description,brand,category.description", "expand": "category.products"})
+        item = response.data["results"][0]
+        self.assertNotIn("description", item)
+        self.assertNotIn("brand", item)
+        self.assertNotIn("description", item["category"])
+        self.assertEqual(len(item["category"]["products"]), 3)
+
+    def test_unrequested_relations_are_not_queried(self):
+        # ETag aggregate + page; no user join, category/brand/image prefetches
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("product-list"), {"fields": "id,name,price"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "name", "price"})
+
+    def test_sparse_fields_inside_collection_detail(self):
+        response = self.client.get(
+            reverse("category-detail", kwargs={"pk": self.category.pk}), {"fields": "name,products.name"})
+        self.assertEqual(set(response.data), {"name", "products"})
+        self.assertEqual(set(response.data["products"]["results"][0]), {"name"})
+
+
+class CompiledListSerializerTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123",
+                                                   first_name="Ada", last_name="Admin")
+        category = Category.objects.create(name="Electronics", created_by=self.admin)
+        brand = Brand.objects.create(name="TechBrand", description="Tech", created_by=self.admin,
+                                     logo="images/brand-logos/t.png",
+                                     logo_variants={"thumbnail": {"name": "variants/t.webp", "width": 160, "height": 80}})
+        for i in range(4):
+            product = Product.objects.create(
+                name=f"Phone {i}", category=category, brand=brand if i % 2 else None,
+                created_by=self.admin if i != 3 else None, description="Phone",
+                price=Decimal("199.99"), discount=15 * i, rating_count=i, rating_sum=4 * i,
+            )
+            if i:
+                ProductImage.objects.create(
+                    product=product, image=f"images/product-images/{i}.png", is_primary=True, width=800, height=600,
+                    variants={"medium": {"name": f"variants/{i}.webp", "width": 640, "height": 480}},
+                )
+
+    def assertSameAsRegular(self, params):
+        compiled = self.client.get(reverse("product-list"), params)
+        catalog_cache().clear()
+        with mock.patch.object(ProductViewSet, "compiled_serializer_class", None):
+            regular = self.client.get(reverse("product-list"), params)
+        catalog_cache().clear()
+        self.assertEqual((compiled["X-Cache"], regular["X-Cache"]), ("MISS", "MISS"))
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, regular.content)
+
+    def test_output_matches_regular_serializer(self):
+        for params in ({}, {"ordering": "price"}, {"fields": "id,name,created_by.full_name,brand.logo_variants"},
+                       {"omit": "category,primary_image.srcset"}, {"page": 1, "page_size": 2}):
+            with self.subTest(params=params):
+                self.assertSameAsRegular(params)
+
+    def test_output_matches_for_staff(self):
+        self.client.force_authenticate(self.admin)
+        self.assertSameAsRegular({})
+
+    def test_every_field_matches_regular_serializer(self):
+        # one field (and nested field) at a time, so an accessor drifting from its DRF field is named
+        Product.objects.filter(pk=Product.objects.order_by("pk")[0].pk).update(stock=3, reserved=1)
+        rows = self.client.get(reverse("product-list")).json()["results"]
+        catalog_cache().clear()
+        paths = {name for row in rows for name in row}
+        paths |= {f"{name}.{field}" for row in rows for name, value in row.items()
+                  if isinstance(value, dict) for field in value}
+        self.assertIn("available", paths)
+        for path in sorted(paths):
+            with self.subTest(field=path):
+                self.assertSameAsRegular({"fields": path})
+
+    def test_expand_uses_regular_serializer(self):
+        with mock.patch.object(CompiledProductListSerializer, "serialize") as serialize:
+            response = self.client.get(reverse("product-list"), {"expand": "category.products"})
+        serialize.assert_not_called()
+        self.assertEqual(len(response.data["results"][0]["category"]["products"]), 4)
+
+
+class FastJSONRendererTests(TestCase):
+    payload = {
+        "text": "naïve \u2028 \"quoted\" \x00", "price": Decimal("19.99"), "tiny": 1e-7, "huge": 10 ** 30,
+        "created": datetime(2024, 5, 1, 12, 30, 0, 5, tzinfo=dt_timezone.utc), "day": date(2024, 5, 1),
+        "id": uuid.UUID(int=1), "ids": (1, 2), 3: None,
+    }
+
+    def test_output_matches_json_renderer(self):
+        # the payload takes the fallback path (huge int, exponent float, int key); the others orjson's
+        simple = {key: self.payload[key] for key in ("text", "price", "created", "day", "id", "ids")}
+        for data in (self.payload, simple, [], None):
+            expected = JSONRenderer().render(data)
+            self.assertEqual(FastJSONRenderer().render(data), expected)
+            with mock.patch("config.api.renderers.orjson", None):
+                self.assertEqual(FastJSONRenderer().render(data), expected)
+        self.assertEqual(FastJSONRenderer().render([1], "application/json; indent=2"),
+                         JSONRenderer().render([1], "application/json; indent=2"))
+
+    def test_non_finite_floats_raise_like_json_renderer(self):
+        # the serializers refuse them, regular and compiled, so the renderer does not have to look
+        class RatingSerializer(DynamicFieldsMixin, ModelSerializer):
+            class Meta:
+                model = Product
+                fields = ["id", "rating_average"]
+
+        class CompiledRatingSerializer(CompiledSerializer):
+            serializer_class = RatingSerializer
+
+        for value in (float("nan"), float("inf"), -float("inf")):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({"items": [{"score": value}]})
+                with self.assertRaises(ValueError):
+                    RatingSerializer(Product(pk=1, rating_average=value)).data
+                with self.assertRaises(ValueError):
+                    CompiledRatingSerializer({}).serialize([{"id": 1, "rating_average": value}])
+        self.assertEqual(RatingSerializer(Product(pk=1, rating_average=2.5)).data, {"id": 1, "rating_average": 2.5})
+
+    def test_product_list_matches_json_renderer(self):
+        admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        category = Category.objects.create(name="Électronique", created_by=admin)
+        Product.objects.create(name="Téléphone", category=category, created_by=admin, description="x",
+                               price=Decimal("99.90"))
+        response = self.client.get(reverse("product-list"))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_parser_matches_json_parser(self):
+        for body in (b'{"a": [1, 2.5, "\\u00e9"], "big": 123456789012345678901234567890}', b'[]'):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for body in (b'{"a": NaN}', b'[1,]'):
+            messages = []
+            for parser in (JSONParser(), FastJSONParser()):
+                with self.assertRaises(ParseError) as error:
+                    parser.parse(io.BytesIO(body))
+                messages.append(str(error.exception))
+            self.assertEqual(messages[0], messages[1])
+
+
+class BulkPriceTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.phones = Category.objects.create(name="Phones", created_by=self.admin)
+        laptops = Category.objects.create(name="Laptops", created_by=self.admin)
+        for name, category, price, discount in (("Phone A", self.phones, "80.00", 0), ("Phone B", self.phones, "120.00", 85),
+                                                ("Laptop", laptops, "900.00", 5)):
+            Product.objects.create(name=name, category=category, created_by=self.admin, description=name,
+                                   price=Decimal(price), discount=discount)
+        self.client.force_authenticate(self.admin)
+
+    def reprice(self, body, **filters):
+        url = reverse("product-bulk-price")
+        if filters:
+            url += "?" + "&".join(f"{name}={value}" for name, value in filters.items())
+        return self.client.post(url, body, format="json")
+
+    def prices(self):
+        return {name: (price, discount) for name, price, discount in Product.objects.values_list("name", "price", "discount")}
+
+    def test_dry_run_only_counts(self):
+        before = self.prices()
+        response = self.reprice({"price_change": "-10", "discount_change": "10", "dry_run": True}, category=self.phones.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"selected": 2, "price_changed": 2, "discount_changed": 2, "dry_run": True})
+        self.assertEqual(self.prices(), before)
+
+    def test_rows_sharing_the_stamp_are_not_recorded(self):
+        stamp = datetime(2030, 1, 1, tzinfo=dt_timezone.utc)
+        Product.objects.filter(name="Laptop").update(updated=stamp)
+        with mock.patch("products.pricing.timezone.now", return_value=stamp):
+            self.reprice({"price_change": "10"}, category=self.phones.pk)
+        recorded = PriceHistory.objects.filter(recorded_at=stamp).values_list("product__name", flat=True)
+        self.assertEqual(sorted(recorded), ["Phone A", "Phone B"])
+
+    def test_reprices_filtered_selection_in_sql(self):
+        with mock.patch("products.pricing.bump_catalog_version") as bump:
+            response = self.reprice({"price_change": "-12.5", "discount_change": "10"}, category=self.phones.pk)
+        self.assertEqual(response.data["selected"], 2)
+        bump.assert_called_once()
+        self.assertEqual(self.prices(), {
+            "Phone A": (Decimal("70.00"), 10),
+            # discount clamped to the validator's 90
+            "Phone B": (Decimal("105.00"), 90),
+            "Laptop": (Decimal("900.00"), 5),
+        })
+        facets = dict(ProductFacet.objects.filter(product__name="Phone B").values_list("facet", "value"))
+        self.assertEqual((facets["price"], facets["discount"]), ("100-250", "true"))
+        facets = dict(ProductFacet.objects.filter(product__name="Phone A").values_list("facet", "value"))
+        self.assertEqual((facets["price"], facets["discount"]), ("50-100", "true"))
+
+    def test_selection_filtering_on_price(self):
+        # rows leaving the price filter after the update still get their facets refreshed
+        response = self.reprice({"price_change": "-100", "price_mode": "absolute"}, price_min=100)
+        self.assertEqual(response.data["price_changed"], 2)
+        self.assertEqual(Product.objects.get(name="Phone B").price, Decimal("20.00"))
+        self.assertEqual(ProductFacet.objects.get(product__name="Laptop", facet="price").value, "500-1000")
+        self.assertEqual(ProductFacet.objects.get(product__name="Phone B", facet="price").value, "0-50")
+
+    def test_validation_and_permissions(self):
+        self.assertEqual(self.reprice({"dry_run": True}).status_code, 400)
+        self.assertEqual(self.reprice({"discount_change": "1.5", "discount_mode": "absolute"}).status_code, 400)
+        self.assertEqual(self.reprice({"price_change": "-150"}).status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(email="user@example.com", password="user123"))
+        self.assertEqual(self.reprice({"price_change": "10"}).status_code, 403)
+
+
+class EffectivePriceTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        self.category = Category.objects.create(name="Phones", created_by=self.admin)
+        cases = [("10.01", 50), ("0.05", 10), ("19.99", 15), ("120.00", 0), ("100.00", 50), ("999999999999.99", 90),
+                 ("33.33", 33), ("0.01", 50)]
+        for i, (price, discount) in enumerate(cases):
+            Product.objects.create(name=f"Product {i}", category=self.category, created_by=self.admin,
+                                   description="x", price=Decimal(price), discount=discount)
+
+    def test_sql_expression_matches_save(self):
+        saved = dict(Product.objects.values_list("pk", "effective_price"))
+        self.assertEqual(saved[Product.objects.get(name="Product 0").pk], Decimal("5.01"))
+        Product.objects.update(effective_price=0)
+        call_command("rebuild_effective_prices", stdout=io.StringIO())
+        self.assertEqual(dict(Product.objects.values_list("pk", "effective_price")), saved)
+
+    def test_discounted_price_is_rounded_once(self):
+        for price, discount, expected in (("6.99", 50, 3), ("7.00", 50, 4), ("5.00", 10, 4), ("15.00", 10, 14)):
+            Product.objects.create(name=f"Rounding {price}", category=self.category, created_by=self.admin,
+                                   description="x", price=Decimal(price), discount=discount)
+            self.assertEqual(Product.objects.get(name=f"Rounding {price}").discounted_price, expected)
+        products = Product.objects.annotate(whole=discounted_price_expression())
+        self.assertEqual({product.pk: product.whole for product in products},
+                         {product.pk: product.discounted_price for product in products})
+
+    def test_filter_and_order_by_effective_price(self):
+        response = self.client.get(reverse("product-list"), {
+            "effective_price_min": 5, "effective_price_max": 60, "ordering": "-effective_price", "fields": "name,effective_price",
+        })
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Product 4", "Product 6", "Product 2", "Product 0"])
+        self.assertEqual(response.data["results"][0]["effective_price"], "50.00")
+
+    def test_bulk_writes_keep_it_in_sync(self):
+        self.client.force_authenticate(self.admin)
+        self.client.post(reverse("product-bulk-price"), {"price_change": "10", "discount_change": "-10"}, format="json")
+        product = Product.objects.get(name="Product 2")
+        self.assertEqual((product.price, product.discount, product.effective_price),
+                         (Decimal("21.99"), 5, Decimal("20.89")))
+        CatalogImporter().run(read_rows(io.StringIO("name,category,price,discount\nProduct 2,Phones,50.00,20\n"), "csv"))
+        self.assertEqual(Product.objects.get(name="Product 2").effective_price, Decimal("40.00"))
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        category = Category.objects.create(name="Phones", created_by=self.admin)
+        self.product = Product.objects.create(name="Phone", category=category, created_by=self.admin,
+                                              description="Phone", price=Decimal("100.00"))
+        self.other = Product.objects.create(name="Other", category=category, created_by=self.admin,
+                                            description="Other", price=Decimal("50.00"))
+        self.url = reverse("product-price-history", kwargs={"pk": self.product.pk})
+
+    def reprice(self, price, discount, when):
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal(price), discount=discount, effective_price=effective_price_for(Decimal(price), discount))
+        record_prices(Product.objects.filter(pk=self.product.pk), recorded_at=when)
+
+    def test_saves_record_only_price_changes(self):
+        self.assertEqual(self.product.price_history.count(), 1)
+        self.product.description = "Updated"
+        self.product.save()
+        self.assertEqual(self.product.price_history.count(), 1)
+        self.product.discount = 10
+        self.product.save()
+        self.assertEqual(list(self.product.price_history.order_by("pk").values_list("effective_price", flat=True)),
+                         [Decimal("100.00"), Decimal("90.00")])
+
+    def test_point_in_time_and_daily_chart(self):
+        PriceHistory.objects.all().delete()
+        DailyPrice.objects.all().delete()
+        day = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.reprice("100.00", 0, day.replace(hour=9))
+        self.reprice("80.00", 0, day.replace(hour=12))
+        self.reprice("120.00", 0, day.replace(hour=18))
+        self.reprice("120.00", 50, day.replace(day=3, hour=8))
+
+        response = self.client.get(self.url, {"at": "2024-03-01T13:00:00Z"})
+        self.assertEqual((response.data["price"], response.data["effective_price"]), ("80.00", "80.00"))
+        self.assertEqual(self.client.get(self.url, {"at": "2024-03-02"}).data["effective_price"], "120.00")
+        self.assertEqual(self.client.get(self.url, {"at": "2024-02-01"}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {"at": "2024-02-30"}).status_code, 400)
+
+        days = self.client.get(self.url).data["days"]
+        self.assertEqual([(item["day"], item["open"], item["high"], item["low"], item["close"], item["changes"])
+                          for item in days], [
+            ("2024-03-01", "100.00", "120.00", "80.00", "120.00", 3),
+            # opens at the previous close
+            ("2024-03-03", "120.00", "120.00", "60.00", "60.00", 1),
+        ])
+        self.assertEqual(len(self.client.get(self.url, {"since": "2024-03-02"}).data["days"]), 1)
+
+    def test_bulk_writes_record_changed_products(self):
+        self.client.force_authenticate(self.admin)
+        self.client.post(reverse("product-bulk-price") + "?price_min=60", {"discount_change": "20"}, format="json")
+        self.assertEqual(self.product.price_history.count(), 2)
+        self.assertEqual(self.other.price_history.count(), 1)
+        self.assertEqual(self.product.daily_prices.get().close, Decimal("80.00"))
+        CatalogImporter().run(read_rows(io.StringIO("name,category,price\nPhone,Phones,100.00\nOther,Phones,55.00\n"), "csv"))
+        self.assertEqual(self.product.price_history.count(), 3)
+        self.assertEqual(self.other.price_history.count(), 2)
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework_nested.routers import DefaultRouter, NestedSimpleRouter
 from .views import (
     CategoryViewSet, BrandViewSet, ProductViewSet,
-    ProductImageViewSet, ProductFieldViewSet, ProductFieldValueViewSet
+    ProductImageViewSet, ProductFieldViewSet, ProductFieldValueViewSet, CatalogCacheStatsView
 )
 
 router = DefaultRouter()
@@ -41,6 +41,7 @@ product_router.register(r'field-values', ProductFieldValueViewSet, basename='pro
 
 
 urlpatterns = [
+    path('catalog-cache/stats/', CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
     path('', include(router.urls)),
     path('', include(category_router.urls)),
     path('', include(category_product_router.urls)),
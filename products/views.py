@@ -1,12 +1,29 @@
+import io
+
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.filters import OrderingFilter, SearchFilter
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from config.api.cache import CatalogCacheMixin, cache_stats
+from config.api.compiled import CompiledListMixin
+from config.api.conditional import ConditionalGetMixin
+from config.api.pagination import FeedPagination
+from config.api.sparse import requested_expansions, wants_field
+from config.api.streaming import serialize_in_chunks, stream_json_object
 
 from .serializers import (
-    CategoryListSerializer, CategoryDetailSerializer, BrandListSerializer,
+    product_list_skips, CategoryListSerializer, CategoryDetailSerializer, BrandListSerializer,
     BrandDetailSerializer, ProductListSerializer, ProductDetailSerializer,
-    ProductImageSerializer, ProductFieldSerializer, ProductFieldValueSerializer
+    ProductImageSerializer, ProductFieldSerializer, ProductFieldValueSerializer, CompiledProductListSerializer,
+    BulkPriceSerializer, DailyPriceSerializer, PriceHistorySerializer
 )
 
 from .models import Category, Brand, Product, ProductImage, ProductField, ProductsFieldValue
@@ -16,11 +33,33 @@ from .filters import (
     ProductFieldFilter, ProductFieldValueFilter
 )
 
+from .exports import export_response, product_export, requested_export_format
+from .facets import compute_facets
+from .history import parse_day, parse_moment, price_at
+from .importers import FORMATS, CatalogImporter, read_rows
+from .pricing import bulk_reprice
+from .search import ProductSearchFilter, ProductOrderingFilter
 from .permissions import IsOwner
 from rest_framework.serializers import ValidationError
 
 
-class CategoryViewSet(ModelViewSet):
+class ProductCollectionExportMixin:
+    export_chunk_size = 500
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        # streams the detail payload with every product inlined, holding one chunk of rows in memory at a time
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        serializer.fields.pop('products')
+        products = instance.products.with_list_relations().order_by('-created', '-id')
+        rows = serialize_in_chunks(products, ProductListSerializer, self.get_serializer_context(), self.export_chunk_size)
+        return StreamingHttpResponse(
+            stream_json_object(serializer.data, 'products', rows), content_type='application/json'
+        )
+
+
+class CategoryViewSet(CatalogCacheMixin, ConditionalGetMixin, ProductCollectionExportMixin, ModelViewSet):
     queryset = Category.objects.all()
     filterset_class = CategoryFilter
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -31,6 +70,15 @@ class CategoryViewSet(ModelViewSet):
     def get_serializer_class(self):
         return CategoryListSerializer if self.action == 'list' else CategoryDetailSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            if wants_field(self.request, 'product_count'):
+                queryset = queryset.annotate(product_count=Count('products'))
+            if 'products' in requested_expansions(self.request):
+                queryset = queryset.prefetch_related(Prefetch('products', queryset=Product.objects.only('id')))
+        return queryset
+
     def get_permissions(self):
         if self.action == 'create':
             return [IsAdminUser()]
@@ -39,7 +87,7 @@ class CategoryViewSet(ModelViewSet):
         return [AllowAny()]
 
 
-class BrandViewSet(ModelViewSet):
+class BrandViewSet(CatalogCacheMixin, ConditionalGetMixin, ProductCollectionExportMixin, ModelViewSet):
     queryset = Brand.objects.all()
 
     filterset_class = BrandFilter
@@ -51,6 +99,15 @@ class BrandViewSet(ModelViewSet):
     def get_serializer_class(self):
         return BrandListSerializer if self.action == 'list' else BrandDetailSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            if wants_field(self.request, 'product_count'):
+                queryset = queryset.annotate(product_count=Count('products'))
+            if 'products' in requested_expansions(self.request):
+                queryset = queryset.prefetch_related(Prefetch('products', queryset=Product.objects.only('id')))
+        return queryset
+
     def get_permissions(self):
         if self.action == 'create':
             return [IsAdminUser()]
@@ -59,20 +116,31 @@ class BrandViewSet(ModelViewSet):
         return [AllowAny()]
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, CompiledListMixin, ModelViewSet):
     queryset = Product.objects.all()
+    pagination_class = FeedPagination
+    cached_actions = ('list', 'retrieve', 'facets', 'price_history')
+
+    # Fixed number of queries per action, independent of page size (enforced in products/tests.py):
+    # list: ETag aggregate + page + categories with product counts + brands with product counts + primary images
+    # (keyset pages run no COUNT)
+    # retrieve: ETag aggregate + product with created_by + field values + images
+    query_budget = {'list': 5, 'retrieve': 4}
+    # list pages are rendered from values() rows (see config.api.compiled), except with ?expand=
+    compiled_serializer_class = CompiledProductListSerializer
 
     filterset_class = ProductFilter
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    search_fields = ['name', 'description']
-    ordering_filters = ['price', 'stock', 'discount', 'created', 'average_rating']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
+    ordering_fields = ['price', 'effective_price', 'stock', 'discount', 'created', 'rating_average', 'rating_count']
     ordering = ['-created']
+    # filters whose matches move with every basket hold; see CatalogCacheMixin.depend_on_stock()
+    stock_filters = ('stock_min', 'stock_max', 'available_min')
 
     def get_serializer_class(self):
         return ProductListSerializer if self.action == 'list' else ProductDetailSerializer
 
     def get_permissions(self):
-        if self.action == 'create':
+        if self.action in ('create', 'import_catalog', 'export_catalog', 'bulk_price'):
             return [IsAdminUser()]
         if self.action in ('update', 'partial_update', 'destroy'):
             return [IsOwner()]
@@ -80,6 +148,12 @@ class ProductViewSet(ModelViewSet):
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.with_list_relations(
+                expand=requested_expansions(self.request), skip=product_list_skips(self.request))
+        elif self.action == 'retrieve':
+            queryset = queryset.with_detail_relations(
+                skip={name for name in ('created_by', 'field_values', 'images') if not wants_field(self.request, name)})
         category_id = self.kwargs.get('category_pk')
         brand_id = self.kwargs.get('brand_pk')
         if category_id:
@@ -93,6 +167,102 @@ class ProductViewSet(ModelViewSet):
         context['view'] = self
         return context
 
+    def shows_stock(self):
+        return wants_field(self.request, 'stock') or wants_field(self.request, 'available')
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        ordering = params.get('ordering', '')
+        if any(name in params for name in self.stock_filters) or 'stock' in ordering.replace('-', '').split(','):
+            self.depend_on_stock()
+        return super().filter_queryset(queryset)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and self.shows_stock():
+            # model instances, or values() rows on the compiled path
+            self.depend_on_stock(row['id'] if isinstance(row, dict) else row.pk for row in page)
+        return page
+
+    def get_object(self):
+        product = super().get_object()
+        if self.action == 'retrieve' and self.shows_stock():
+            self.depend_on_stock([product.pk])
+        return product
+
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def facets(self, request, *args, **kwargs):
+        return self.cached_response(self.compute_facets, request, *args, **kwargs)
+
+    def compute_facets(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(compute_facets(queryset))
+
+    @action(detail=True, methods=['get'], url_path='price-history', pagination_class=None)
+    def price_history(self, request, *args, **kwargs):
+        return self.cached_response(self.compute_price_history, request, *args, **kwargs)
+
+    def compute_price_history(self, request, *args, **kwargs):
+        # ?at=<datetime> answers "what did it cost then" from the raw history; otherwise the daily
+        # open/high/low/close rows between ?since= and ?until= (dates) for charts
+        product = self.get_object()
+        at = request.query_params.get('at')
+        if at is not None:
+            moment = parse_moment(at)
+            if moment is None:
+                raise ValidationError({"at": "Expected an ISO 8601 date or datetime."})
+            record = price_at(product.pk, moment)
+            if record is None:
+                raise NotFound("No price was recorded for this product at that time.")
+            return Response({'product': product.pk, 'at': moment, **PriceHistorySerializer(record).data})
+        days = product.daily_prices.order_by('day')
+        for param, lookup in (('since', 'day__gte'), ('until', 'day__lte')):
+            value = request.query_params.get(param)
+            if value is not None:
+                day = parse_day(value)
+                if day is None:
+                    raise ValidationError({param: "Expected an ISO 8601 date."})
+                days = days.filter(**{lookup: day})
+        return Response({'product': product.pk, 'days': DailyPriceSerializer(days, many=True).data})
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_catalog(self, request, *args, **kwargs):
+        # ?export_format=csv|jsonl|columnar plus any of the list filters
+        format = requested_export_format(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(product_export(queryset, format), format, 'products')
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser, FormParser])
+    def import_catalog(self, request, *args, **kwargs):
+        # multipart `file` (CSV or JSONL), optional `import_format`, `chunk_size` and `create_missing`
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({"file": "A CSV or JSONL file is required."})
+        format = request.data.get('import_format') or upload.name.rsplit('.', 1)[-1].lower()
+        if format not in FORMATS:
+            raise ValidationError({"import_format": f"Expected one of {', '.join(FORMATS)}."})
+        try:
+            chunk_size = min(max(int(request.data.get('chunk_size', 1000)), 1), 5000)
+        except ValueError:
+            raise ValidationError({"chunk_size": "A whole number is required."})
+        create_missing = str(request.data.get('create_missing', '')).lower() in ('1', 'true', 'yes')
+
+        importer = CatalogImporter(chunk_size=chunk_size, create_missing=create_missing, user=request.user)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        try:
+            result = importer.run(read_rows(stream, format))
+        except UnicodeDecodeError:
+            raise ValidationError({"file": "The file must be UTF-8 encoded."})
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-price')
+    def bulk_price(self, request, *args, **kwargs):
+        # reprices every product matched by the list filters in the query string, e.g. ?brand=3&price_min=100
+        serializer = BulkPriceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(bulk_reprice(queryset, dry_run=serializer.validated_data['dry_run'], **serializer.changes()))
+
 
 class ProductImageViewSet(ModelViewSet):
     serializer_class = ProductImageSerializer
@@ -176,4 +346,11 @@ class ProductFieldValueViewSet(ModelViewSet):
         product_id = self.kwargs.get('product_pk')
         if product_id:
             context['product'] = Product.objects.get(id=product_id)
-        return context
\ No newline at end of file
+        return context
+
+
+class CatalogCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
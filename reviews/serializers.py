@@ -1,11 +1,13 @@
 from rest_framework import serializers
 
+from config.api.compiled import CompiledSerializer
+from config.api.sparse import DynamicFieldsMixin
 from orders.models import OrderItem
 from products.models import Product
 from reviews.models import Review
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = serializers.CharField(source='user.email', read_only=True)
 
     class Meta:
@@ -58,5 +60,6 @@ class ReviewSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-
-
+class CompiledReviewSerializer(CompiledSerializer):
+    # every field is a column; `user` reads user__email through a join
+    serializer_class = ReviewSerializer
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from config.api.cache import bump_catalog_version_on_commit
+from products.models import Product
+from .models import Review
+
+
+def _apply_rating(product_id, value, delta):
+    if not product_id or not value:
+        return
+    new_sum = F('rating_sum') + delta * value
+    new_count = F('rating_count') + delta
+    Product.objects.filter(pk=product_id).update(
+        rating_count=new_count,
+        rating_sum=new_sum,
+        rating_average=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 0.0),
+        **{f'rating_{value}': F(f'rating_{value}') + delta},
+    )
+
+
+def _rating_state(instance):
+    return instance.__dict__.get('product_id'), instance.__dict__.get('value')
+
+
+@receiver(post_init, sender=Review)
+def remember_rating(sender, instance, **kwargs):
+    instance._rating_state = _rating_state(instance) if instance.pk else (None, None)
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    old_state = (None, None) if created else instance._rating_state
+    new_state = _rating_state(instance)
+    if old_state != new_state:
+        with transaction.atomic():
+            _apply_rating(*old_state, delta=-1)
+            _apply_rating(*new_state, delta=1)
+    instance._rating_state = new_state
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    _apply_rating(*instance._rating_state, delta=-1)
+
+
+post_save.connect(bump_catalog_version_on_commit, sender=Review, dispatch_uid='catalog_version_Review_save')
+post_delete.connect(bump_catalog_version_on_commit, sender=Review, dispatch_uid='catalog_version_Review_delete')
@@ -1,3 +1,124 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from config.api.cache import catalog_cache
+from products.models import Brand, Category, Product
+from .models import Review
+from .views import ReviewViewSet
+
+User = get_user_model()
+
+
+class ProductRatingAggregateTests(TestCase):
+    def setUp(self):
+        catalog_cache().clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            email="admin@example.com", password="admin123", first_name="Admin", last_name="User"
+        )
+        self.users = [
+            User.objects.create_user(email=f"user{i}@example.com", password="user123")
+            for i in range(3)
+        ]
+        self.category = Category.objects.create(name="Electronics", created_by=self.admin)
+        self.brand = Brand.objects.create(name="TechBrand", description="Tech", created_by=self.admin)
+        self.product = Product.objects.create(
+            name="Smartphone", category=self.category, brand=self.brand, created_by=self.admin,
+            description="Latest model", price=Decimal("599.99"), stock=100,
+        )
+        self.other_product = Product.objects.create(
+            name="Laptop", category=self.category, brand=self.brand, created_by=self.admin,
+            description="High-end laptop", price=Decimal("999.99"), stock=10,
+        )
+
+    def test_review_create_updates_aggregates(self):
+        Review.objects.create(user=self.users[0], product=self.product, text="Great", value=5)
+        Review.objects.create(user=self.users[1], product=self.product, text="Fine", value=4)
+        Review.objects.create(user=self.users[2], product=self.product, text="Just a comment")
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_sum, 9)
+        self.assertEqual(self.product.average_rating, 4.5)
+        self.assertEqual(self.product.rating_average, 4.5)
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+
+    def test_review_edit_and_delete_update_aggregates(self):
+        review = Review.objects.create(user=self.users[0], product=self.product, text="Great", value=5)
+        review.value = 2
+        review.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 2))
+        self.assertEqual(self.product.rating_histogram[5], 0)
+        self.assertEqual(self.product.rating_histogram[2], 1)
+
+        review = Review.objects.get(pk=review.pk)
+        review.product = self.other_product
+        review.save()
+        self.product.refresh_from_db()
+        self.other_product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.average_rating, 0)
+        self.assertEqual(self.other_product.rating_count, 1)
+
+        Review.objects.get(pk=review.pk).delete()
+        self.other_product.refresh_from_db()
+        self.assertEqual((self.other_product.rating_count, self.other_product.rating_sum), (0, 0))
+
+    def test_rebuild_ratings_command(self):
+        Review.objects.create(user=self.users[0], product=self.product, text="Great", value=5)
+        Review.objects.create(user=self.users[1], product=self.product, text="Bad", value=1)
+        Product.objects.update(rating_count=0, rating_sum=0, rating_average=0, rating_5=0, rating_1=0)
+
+        call_command('rebuild_ratings', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.average_rating, 3)
+        self.assertEqual(self.product.rating_histogram, {1: 1, 2: 0, 3: 0, 4: 0, 5: 1})
+
+    def test_products_ordered_by_rating(self):
+        Review.objects.create(user=self.users[0], product=self.product, text="Bad", value=2)
+        Review.objects.create(user=self.users[0], product=self.other_product, text="Great", value=5)
+
+        response = self.client.get(reverse("product-list"), {"ordering": "-rating_average"})
+        self.assertEqual(response.status_code, 200)
+        names = [item["name"] for item in response.data["results"]]
+        self.assertEqual(names, ["Laptop", "Smartphone"])
+
+
+class CompiledReviewListTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_superuser(email="admin@example.com", password="admin123")
+        category = Category.objects.create(name="Electronics", created_by=admin)
+        for i in range(3):
+            product = Product.objects.create(name=f"Phone {i}", category=category, description="Phone",
+                                             price=Decimal("10.00"))
+            Review.objects.create(user=admin, product=product, text=f"Review {i}", value=i + 1)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def assertSameAsRegular(self, params):
+        compiled = self.client.get(reverse("review-list"), params)
+        with mock.patch.object(ReviewViewSet, "compiled_serializer_class", None):
+            regular = self.client.get(reverse("review-list"), params)
+        self.assertEqual(compiled.status_code, 200)
+        self.assertEqual(compiled.content, regular.content)
+
+    def test_output_matches_regular_serializer(self):
+        for params in ({}, {"fields": "id,user,value"}, {"ordering": "value"}):
+            with self.subTest(params=params):
+                self.assertSameAsRegular(params)
 
-# Create your tests here.
+    def test_every_field_matches_regular_serializer(self):
+        # one field at a time, so an accessor drifting from its DRF field is named
+        for name in self.client.get(reverse("review-list")).json()["results"][0]:
+            with self.subTest(field=name):
+                self.assertSameAsRegular({"fields": name})
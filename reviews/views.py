@@ -3,13 +3,19 @@ from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.viewsets import ModelViewSet
 
+from config.api.compiled import CompiledListMixin
+from config.api.conditional import ConditionalGetMixin
+from config.api.pagination import FeedPagination
+from config.api.sparse import wants_field
 from products.permissions import IsOwner
 from reviews.models import Review
-from reviews.serializers import ReviewSerializer
+from reviews.serializers import CompiledReviewSerializer, ReviewSerializer
 
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, CompiledListMixin, ModelViewSet):
     serializer_class = ReviewSerializer
+    compiled_serializer_class = CompiledReviewSerializer
+    pagination_class = FeedPagination
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['product', 'user']
     search_fields = ['text']
@@ -28,13 +34,12 @@ class ReviewViewSet(ModelViewSet):
 
     def get_queryset(self):
         if self.request.user.is_authenticated and self.request.user.is_superuser:
-            queryset = Review.objects.select_related('user', 'product').prefetch_related(
-                'product__order_items'
-            )
+            queryset = Review.objects.all()
         else:
-            queryset = Review.objects.filter(user=self.request.user).select_related(
-                'user', 'product'
-            ).prefetch_related('product__order_items')
+            queryset = Review.objects.filter(user=self.request.user)
+        # `product` is serialized as a pk and nothing reads product.order_items, so only the user is joined
+        if wants_field(self.request, 'user'):
+            queryset = queryset.select_related('user')
 
         product_pk = self.kwargs.get('product_pk')
         if product_pk:
@@ -1,11 +1,12 @@
 from rest_framework import serializers
 from django.core.mail import send_mail
 from django.conf import settings
+from config.api.sparse import DynamicFieldsMixin
 
 from . import utils
 from .models import User, EmailVerification
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -2,14 +2,14 @@ from django.urls import path
 from .views import (
     RegisterView, ConfirmEmailView, LogoutView, ProfileView, UserListView,
     UserDetailView, UpdatePasswordView, ResetPasswordView, ResetPasswordConfirmView,
-    UserRoleUpdateView,
+    UserRoleUpdateView, LoginView,
 )
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('confirm-email/', ConfirmEmailView.as_view(), name='confirm-email'),
-    path('login/', TokenObtainPairView.as_view(), name='token-obtain-pair'),
+    path('login/', LoginView.as_view(), name='token-obtain-pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('profile/', ProfileView.as_view(), name='profile'),
@@ -6,6 +6,9 @@ from rest_framework.views import APIView
 from rest_framework.generics import RetrieveUpdateDestroyAPIView, ListAPIView, CreateAPIView
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+from carts.guest import merge_guest_basket_at_login
+from config.api.conditional import ConditionalGetMixin
 from .models import User
 from .serializers import (
     UserSerializer, UserRegisterSerializer, UserConfirmEmailSerializer,
@@ -36,6 +39,18 @@ class ConfirmEmailView(APIView):
             "refresh": str(refresh),
         }, status=status.HTTP_200_OK)
 
+class LoginView(TokenObtainPairView):
+    # TokenObtainPairView that also moves the visitor's guest basket into the user's basket
+    def get_serializer(self, *args, **kwargs):
+        # kept for post(), which needs the user it authenticated
+        self.serializer = super().get_serializer(*args, **kwargs)
+        return self.serializer
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        merge_guest_basket_at_login(request, self.serializer.user, response)
+        return response
+
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -50,14 +65,17 @@ class LogoutView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-class ProfileView(RetrieveUpdateDestroyAPIView):
+class ProfileView(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserSerializer
 
     def get_object(self):
         return self.request.user
 
-class UserListView(ListAPIView):
+    def get_conditional_queryset(self):
+        return User.objects.filter(pk=self.request.user.pk)
+
+class UserListView(ConditionalGetMixin, ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
@@ -80,7 +98,7 @@ class UserRoleUpdateView(APIView):
         return Response({"message": "Role Updated"}, status=status.HTTP_200_OK)
 
 
-class UserDetailView(RetrieveUpdateDestroyAPIView):
+class UserDetailView(ConditionalGetMixin, RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]  # Agar custom permission kerak bo‘lsa, IsAdminOrOwner qo‘shiladi